@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark for generating the per-student build tasks at task-load time.
+
+Writes a small exam project with a synthetic roster into a temp directory,
+then times what `build-exam` does before any student is built: parse the
+roster, derive a `BuildInfo` and `BuildSpec` for every student with
+`student_build_specs`, and turn those into doit tasks. The time per student
+should stay flat as the class grows, i.e. total time is linear in the
+number of students.
+
+Usage:
+
+    python3 benchmarks/task_generation.py [max_students]
+"""
+
+import sys
+import time
+import tempfile
+import textwrap
+import importlib.util
+
+from pathlib import Path
+
+from exam_gen.build.loader.loader import BuildLoader
+
+__exam_file__ = textwrap.dedent(
+    """
+    from exam_gen import *
+
+    class BenchClassroom(Classroom):
+
+        roster = BCoursesCSVRoster.with_options(file_name = "roster.csv")
+
+    class BenchQuestion(LatexDoc, Question):
+
+        body.text = "What is {{ 1 + 1 }}?"
+
+    class BenchExam(LatexDoc, Exam):
+
+        classes = {'bench': BenchClassroom}
+
+        questions = {'q1': BenchQuestion}
+    """)
+
+def make_project(proj_dir, num_students):
+    """
+    Write an exam with a roster of `num_students` into `proj_dir` and
+    import it.
+    """
+
+    rows = ["Name,Student ID,Email Address"]
+    for i in range(num_students):
+        rows.append('"Student, Number {0}",{0:08d},student{0:05d}@x.edu'
+                    .format(i))
+
+    Path(proj_dir, "roster.csv").write_text("\n".join(rows) + "\n")
+
+    exam_file = Path(proj_dir, "bench_exam.py")
+    exam_file.write_text(__exam_file__)
+
+    module_name = "bench_exam_{}".format(num_students)
+    spec = importlib.util.spec_from_file_location(module_name, exam_file)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    return module.BenchExam
+
+def load_students(num_students):
+    """
+    Time generating the `build-exam` tasks for a class of `num_students`.
+
+    Returns:
+
+       (float, float): Seconds spent in `student_build_specs` and in
+       generating the whole task list (including the specs).
+    """
+
+    with tempfile.TemporaryDirectory() as proj_dir:
+
+        loader = BuildLoader(make_project(proj_dir, num_students))
+        loader.setup(dict())
+
+        start = time.perf_counter()
+        loader.student_build_specs("exam")
+        specs_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tasks = list(loader.create_exam_tasks())
+        tasks_time = time.perf_counter() - start
+
+        assert len(tasks) > num_students
+
+    return (specs_time, tasks_time)
+
+def main(max_students = 2000):
+
+    print("{:>10} {:>12} {:>12} {:>16}".format(
+        "students", "specs (ms)", "tasks (ms)", "per student (us)"))
+
+    size = 250
+    while size <= max_students:
+        (specs_time, tasks_time) = load_students(size)
+        print("{:>10} {:>12.2f} {:>12.2f} {:>16.2f}".format(
+            size, specs_time * 1e3, tasks_time * 1e3,
+            tasks_time * 1e6 / size))
+        size *= 2
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark for template context handling in `build_template_spec`.
+
+Builds a synthetic multi-part exam spec tree (questions with sub-parts and
+multiple choice options) whose root context holds a large student record and
+metadata, the way a real exam's does, then:
+
+  - Walks the tree doing just the context bookkeeping, both the old way
+    (deep-copying `ctxt | spec.context` twice at every node) and with
+    `LayeredContext`.
+  - Renders the whole tree with `build_template_spec`.
+
+With layered contexts the time per node should stay flat as the exam grows
+instead of growing with the size of the context.
+
+Usage:
+
+    python3 benchmarks/template_contexts.py [max_questions] [depth]
+"""
+
+import sys
+import time
+import tempfile
+
+from copy import deepcopy
+from pathlib import Path
+
+from exam_gen.property.templated import (TemplateSpec, RenderPlan,
+                                         build_template_spec)
+from exam_gen.util.layered_context import LayeredContext
+
+def make_student():
+    return {'student': {'name': "Some Student",
+                        'username': "sstudent",
+                        'student_id': "00000000",
+                        'data': {"field{}".format(i): "x" * 40
+                                 for i in range(200)}},
+            'metadata': {'course': "BENCH 101",
+                         'notes': ["line {}".format(i) for i in range(200)]}}
+
+def make_spec(num_questions, depth, num_choices = 5):
+    """
+    A spec tree with `num_questions` questions, each with `depth` levels of
+    sub-parts, where the deepest part is a multiple choice question.
+    """
+
+    def make_part(level):
+        spec = TemplateSpec(
+            "{{ index }}: {{ body.text }} {% for c in choices %}"
+            "{{ c.text }} {% endfor %}{% for q in questions.values() %}"
+            "{{ q.text }}{% endfor %}",
+            context = {'number': level, 'points': 10})
+        spec.subtemplates['body'] = TemplateSpec(
+            "Body of part {{ number }} for {{ student.name }}")
+        spec.subtemplates['choices'] = list()
+        spec.subtemplates['questions'] = dict()
+
+        if level == depth:
+            spec.subtemplates['choices'] = [
+                TemplateSpec("Choice {{ letter }}",
+                             context = {'letter': "ABCDEFGH"[i]})
+                for i in range(num_choices)]
+        else:
+            spec.subtemplates['questions']['part'] = make_part(level + 1)
+            spec.subtemplates['questions']['part'].context['index'] = 0
+
+        return spec
+
+    root = TemplateSpec("{% for q in questions.values() %}"
+                        "{{ q.text }}\n{% endfor %}",
+                        context = make_student())
+    root.subtemplates['questions'] = dict()
+
+    for i in range(num_questions):
+        root.subtemplates['questions']["q{}".format(i)] = make_part(0)
+        root.subtemplates['questions']["q{}".format(i)].context['index'] = i
+
+    return root
+
+def count_nodes(spec):
+    count = 1
+    for sub in spec.subtemplates.values():
+        if isinstance(sub, list):
+            subs = sub
+        elif isinstance(sub, dict):
+            subs = sub.values()
+        else:
+            subs = [sub]
+        for entry in subs:
+            count += count_nodes(entry)
+    return count
+
+def walk_subs(spec):
+    for sub in spec.subtemplates.values():
+        if isinstance(sub, list):
+            yield from sub
+        elif isinstance(sub, dict):
+            yield from sub.values()
+        else:
+            yield sub
+
+def deepcopy_walk(spec, ctxt):
+    initial_ctxt = deepcopy(ctxt | spec.context)
+    final_ctxt = deepcopy(initial_ctxt)
+    for sub in walk_subs(spec):
+        deepcopy_walk(sub, initial_ctxt)
+    return {k:v for (k,v) in final_ctxt.items() if k not in ctxt or
+            ctxt[k] != final_ctxt[k]}
+
+def layered_walk(spec, ctxt):
+    initial_ctxt = ctxt.layer(spec.context)
+    final_ctxt = initial_ctxt.layer()
+    for sub in walk_subs(spec):
+        layered_walk(sub, initial_ctxt)
+    return final_ctxt.changes(ctxt)
+
+def time_it(fun, *vargs):
+    start = time.perf_counter()
+    fun(*vargs)
+    return time.perf_counter() - start
+
+def main(max_questions = 40, depth = 3):
+
+    print("{:>10} {:>8} {:>16} {:>16} {:>16}".format(
+        "questions", "nodes", "deepcopy (ms)", "layered (ms)", "render (ms)"))
+
+    size = 5
+    while size <= max_questions:
+
+        spec = make_spec(size, depth)
+        nodes = count_nodes(spec)
+
+        copy_time = time_it(deepcopy_walk, spec, dict())
+        layer_time = time_it(layered_walk, spec, LayeredContext())
+
+        # warm up the render plan and template caches, then time a render
+        plan = RenderPlan()
+        with tempfile.TemporaryDirectory() as out_dir:
+            out_file = Path(out_dir, "bench.tex")
+            build_template_spec("bench", make_spec(size, depth),
+                                out_file = out_file, plan = plan)
+            render_time = time_it(build_template_spec, "bench", spec,
+                                  None, out_file, None, None, plan)
+
+        print("{:>10} {:>8} {:>16.2f} {:>16.2f} {:>16.2f}".format(
+            size, nodes, copy_time * 1e3, layer_time * 1e3,
+            render_time * 1e3))
+
+        size *= 2
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
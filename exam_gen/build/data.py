@@ -1,17 +1,27 @@
 import attr
+import sys
+import inspect
+import importlib
+import importlib.util
 
 from pathlib import *
 from copy import *
 
+from exam_gen.util.stable_hash import stable_hash
+
 import exam_gen.util.logging as logging
 
 log = logging.new(__name__, level="DEBUG")
 
-@attr.s
+@attr.s(frozen=True)
 class BuildInfo():
     """
     Information about the build process
 
+    Instances are immutable, use `where` to get a modified copy. Copies share
+    references to heavy objects like the `classroom` and `student`, so making
+    one per student doesn't copy the whole roster.
+
     !!! todo "Todo: Write up attribute information"
     """
 
@@ -55,19 +65,79 @@ class BuildInfo():
     finalize_prefix = attr.ib(default='finalize-', kw_only=True)
     template_prefix = attr.ib(default='template-', kw_only=True)
     output_prefix = attr.ib(default='output-', kw_only=True)
+    merge_prefix = attr.ib(default='merge-', kw_only=True)
 
     doc_file = attr.ib(default='doc.yaml', kw_only=True)
     log_file = attr.ib(default='log.yaml', kw_only=True)
     spec_file = attr.ib(default='spec.yaml', kw_only=True)
     result_file = attr.ib(default='result.yaml', kw_only=True)
+    journal_file = attr.ib(default='journal.yaml', kw_only=True)
+    latex_log_file = attr.ib(default='latex.log', kw_only=True)
+    timing_file = attr.ib(default='timing.yaml', kw_only=True)
+    timing_summary_file = attr.ib(default='timing-summary.yaml', kw_only=True)
 
     student_data_file = attr.ib(default='data.yaml', kw_only=True)
     grade_data_file = attr.ib(default='grade-data.yaml', kw_only=True)
 
-    root_dir = attr.ib(default = None, init=False)
+    root_dir = attr.ib(default = None, kw_only=True)
 
     build_settings = attr.ib(factory=dict, kw_only = True)
 
+    shard = attr.ib(default=None, kw_only=True)
+    """
+    When set to `(i, n)`, only build the students in shard `i` of `n`.
+    See `in_shard`.
+    """
+
+    shard_prefix = attr.ib(default='shard-', kw_only=True)
+
+    debug_level = attr.ib(default='full', kw_only=True)
+    """
+    How many template debug files to write into the data directory, one of
+    'off', 'on-error', 'summary', or 'full'. See `build_template_spec`.
+    """
+
+    latex_jobs = attr.ib(default=None, kw_only=True)
+    """
+    How many exams to compile in the background while rendering the next
+    ones, see `CompilePool`. `None` uses one per core, and `0` compiles each
+    exam before moving on to the next.
+    """
+
+    template_cache_dir = attr.ib(default='template-cache', kw_only=True)
+    """
+    Directory within the build dir where compiled templates are kept between
+    runs.
+    """
+
+    fragment_cache_dir = attr.ib(default='fragment-cache', kw_only=True)
+    """
+    Directory within the build dir where `{% cache %}` blocks are kept
+    between runs, when the document's `persist_fragments` setting is on.
+    """
+
+    latex_format_dir = attr.ib(default='latex-format', kw_only=True)
+    """
+    Directory within the build dir where precompiled LaTeX preambles are
+    kept, see the `precompile_preamble` LaTeX setting.
+    """
+
+    def in_shard(self, student_id):
+        """
+        Is this student part of the current shard? Students are assigned to
+        shards using a stable hash of their id, so every machine building a
+        shard agrees on the partition.
+        """
+        if self.shard == None:
+            return True
+
+        (index, count) = self.shard
+        return int(stable_hash(student_id), 16) % count == index - 1
+
+    def shard_name(self):
+        (index, count) = self.shard
+        return "{}{}-of-{}".format(self.shard_prefix, index, count)
+
     def base_data_path(self):
         return Path(self.root_dir, self.data_dir)
 
@@ -90,6 +160,15 @@ class BuildInfo():
     def base_build_path(self):
         return Path(self.root_dir, self.build_dir)
 
+    def template_cache_path(self):
+        return Path(self.base_build_path(), self.template_cache_dir)
+
+    def fragment_cache_path(self):
+        return Path(self.base_build_path(), self.fragment_cache_dir)
+
+    def latex_format_path(self):
+        return Path(self.base_build_path(), self.latex_format_dir)
+
     def class_build_path(self):
         return Path(self.base_build_path(),
                     self.class_prefix + self.class_name)
@@ -113,11 +192,29 @@ class BuildInfo():
         return Path(self.base_out_path(),
                     self.class_prefix + self.class_name)
 
+    def shard_out_path(self):
+        return Path(self.class_out_path(), self.shard_name())
+
     def exam_out_path(self):
         return Path(self.base_out_path(),
                     self.exam_prefix + self.exam_format,
                     self.class_prefix + self.class_name)
 
+    def out_file(self, name):
+        """
+        The PDF that `output_build` writes for `name` into `out_path`. This
+        appends `.pdf` rather than replacing a suffix, so that student ids
+        with dots in them (e.g. `john.smith`) keep their full name.
+        """
+        return Path(self.out_path, str(name) + ".pdf")
+
+    def exam_out_file(self):
+        """
+        The PDF that a student's exam is output to, see `out_file`.
+        """
+        return self.where(out_path = self.exam_out_path()).out_file(
+            self.student_id)
+
     def question_out_path(self):
         return Path(self.base_out_path(),
                     self.question_prefix + self.question_format,
@@ -128,10 +225,80 @@ class BuildInfo():
         Create a new copy of this object with some attributes changed.
 
         Parameters are identical to the parameters of `BuildInfo.__init__`.
+
+        This is a shallow copy, unchanged attributes refer to the same objects
+        as they do in `self`.
         """
 
-        new = deepcopy(self)
-        for (k,v) in kwargs.items():
-            setattr(new, k, v)
+        return attr.evolve(self, **kwargs)
+
+
+@attr.s(frozen=True)
+class BuildSpec():
+    """
+    A small, picklable description of a single per-student build task.
+
+    Doit's multiprocess runner has to ship every task action to a worker, so
+    instead of handing it an exam class and a `BuildInfo` holding a whole
+    `Classroom` we hand it one of these. The worker rehydrates the exam class
+    with `exam_class()` and pulls the (per-process cached) roster itself.
+    """
+
+    exam_module = attr.ib()
+    exam_name = attr.ib()
+    exam_file = attr.ib()
+
+    class_name = attr.ib(kw_only=True)
+    student_id = attr.ib(kw_only=True)
+    exam_format = attr.ib(kw_only=True)
+
+    exam_formats = attr.ib(default=None, kw_only=True)
+    """
+    If set, a tuple of every format to build from the one set up exam.
+    """
+
+    load_answers = attr.ib(default=False, kw_only=True)
+    load_scores = attr.ib(default=False, kw_only=True)
+
+    fingerprint = attr.ib(default=None, kw_only=True)
+    """
+    Hash of all the inputs to this build, recorded in the build journal.
+    """
+
+    build_info = attr.ib(default=None, kw_only=True)
+    """
+    A `BuildInfo` with no classroom or student attached, just carries the
+    root directory and file naming options over to the worker.
+    """
+
+    @classmethod
+    def from_exam(cls, exam_cls, **kwargs):
+        """
+        Create a spec for the given exam class, the remaining parameters are
+        passed through to `BuildSpec.__init__`.
+        """
+        return cls(exam_cls.__module__,
+                   exam_cls.__qualname__,
+                   str(Path(inspect.getsourcefile(exam_cls)).resolve()),
+                   **kwargs)
+
+    def exam_class(self):
+        """
+        Retrieve the exam class this spec refers to, importing it from
+        `exam_file` if the module isn't already loaded in this process.
+        """
+
+        module = sys.modules.get(self.exam_module, None)
+
+        if module == None or not hasattr(module, self.exam_name):
+            module_name = "_exam_gen_worker_{}".format(Path(self.exam_file).stem)
+            module = sys.modules.get(module_name, None)
+
+            if module == None:
+                mod_spec = importlib.util.spec_from_file_location(
+                    module_name, self.exam_file)
+                module = importlib.util.module_from_spec(mod_spec)
+                sys.modules[module_name] = module
+                mod_spec.loader.exec_module(module)
 
-        return new
+        return getattr(module, self.exam_name)
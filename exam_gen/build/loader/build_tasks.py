@@ -1,15 +1,23 @@
 import attr
 import os
+import time
+import shutil
 
 from pprint import *
 from pathlib import *
 
 from .roster_tasks import *
+from .journal import *
+from .timing_tasks import *
+from .compile_pool import *
 from exam_gen.build.data import BuildInfo
 from exam_gen.property.answerable import distribute_answers
 from exam_gen.property.gradeable import distribute_scores
-from exam_gen.property.templated import build_template_spec
+from exam_gen.property.templated import (build_template_spec, render_plan,
+                                         template_dependencies)
 from exam_gen.util.file_ops import *
+from exam_gen.util.template_manager import get_template_manager
+from exam_gen.util.fragment_cache import get_fragment_cache
 
 import exam_gen.util.logging as logging
 
@@ -41,23 +49,42 @@ def init_exam(exam_cls, build_info):
 
     return exam_obj
 
+def build_dir_listing(build_dir):
+    """
+    Get the size and modification time of every file under `build_dir`,
+    keyed by its path relative to `build_dir`.
+    """
+
+    build_dir = Path(build_dir)
+    listing = dict()
+
+    for build_file in build_dir.rglob('*'):
+        if build_file.is_file():
+            stat = build_file.stat()
+            listing[str(build_file.relative_to(build_dir))] = (
+                stat.st_size, stat.st_mtime_ns)
+
+    return listing
+
 def setup_exam(exam_obj, build_info):
     dump_obj(exam_obj, path=(build_info.data_path,
                             build_info.pre_prefix +
                             build_info.setup_prefix +
                             build_info.doc_file))
 
-
-    pwd = os.getcwd()
-
-    os.chdir(build_info.build_path)
+    before_setup = build_dir_listing(build_info.build_path)
 
     setup_log = exam_obj.setup_build(build_info)
 
     setup_log['children'] = exam_obj.on_children(
         lambda n: n.setup_build(build_info))
 
-    os.chdir(pwd)
+    # Every asset and file that setup created or changed, as opposed to
+    # leftovers from the last build like its `.aux` or `.pdf`.
+    after_setup = build_dir_listing(build_info.build_path)
+    setup_log['setup_files'] = sorted(
+        name for (name, stat) in after_setup.items()
+        if before_setup.get(name, None) != stat)
 
     dump_yaml(setup_log, path=(build_info.data_path,
                                build_info.setup_prefix +
@@ -68,6 +95,8 @@ def setup_exam(exam_obj, build_info):
                             build_info.setup_prefix +
                             build_info.doc_file))
 
+    return setup_log
+
 def template_exam(exam_obj, build_info):
 
     dump_obj(exam_obj, path=(build_info.data_path,
@@ -75,39 +104,76 @@ def template_exam(exam_obj, build_info):
                             build_info.template_prefix +
                             build_info.doc_file))
 
+    file_name = Path(build_info.build_path,
+                     exam_obj.settings.template.output +
+                     "." +
+                     exam_obj.settings.template.format_ext)
 
-    pwd = os.getcwd()
+    template_spec = exam_obj.template_spec(file_name, build_info)
 
-    os.chdir(build_info.build_path)
+    get_template_manager().use_bytecode_dir(build_info.template_cache_path())
 
+    fragment_cache = get_fragment_cache()
 
-    file_name = Path(exam_obj.settings.template.output +
-                     "." +
-                     exam_obj.settings.template.format_ext)
+    fragment_cache.use_dir(build_info.fragment_cache_path()
+                           if exam_obj.settings.template.persist_fragments
+                           else None)
 
-    template_spec = exam_obj.template_spec(file_name, build_info)
+    write_spec = build_info.debug_level in ['summary', 'full']
+
+    if write_spec:
+        dump_yaml(template_spec, path=(build_info.data_path,
+                                   build_info.template_prefix +
+                                   build_info.spec_file))
 
-    dump_yaml(template_spec, path=(build_info.data_path,
-                               build_info.template_prefix +
-                               build_info.spec_file))
+    plan = render_plan(type(exam_obj), build_info.exam_format)
+
+    templates = template_dependencies(template_spec)
+
+    stats_before = plan.render_stats()
+    fragments_before = fragment_cache.stats()
 
     result = build_template_spec(
         exam_obj.settings.template.output,
         template_spec,
         out_file = file_name,
-        debug_dir = build_info.data_path)
-
-    dump_yaml(template_spec, path=(build_info.data_path,
-                               build_info.template_prefix +
-                               build_info.result_file))
-
-    os.chdir(pwd)
+        debug_dir = build_info.data_path,
+        plan = plan,
+        stream = exam_obj.settings.template.stream_output,
+        keep_text = not exam_obj.settings.template.stream_output,
+        debug_level = build_info.debug_level,
+        cache_renders = exam_obj.settings.template.cache_renders)
+
+    stats_after = plan.render_stats()
+    fragments_after = fragment_cache.stats()
+
+    template_log = {
+        'render_cache': {
+            'hits': stats_after['hits'] - stats_before['hits'],
+            'misses': stats_after['misses'] - stats_before['misses'],
+            'uncacheable': (stats_after['uncacheable']
+                            - stats_before['uncacheable']),
+            'process_hit_rate': stats_after['hit_rate']},
+        'fragment_cache': {
+            'hits': fragments_after['hits'] - fragments_before['hits'],
+            'misses': fragments_after['misses'] - fragments_before['misses'],
+            'process_hit_rate': fragments_after['hit_rate']}}
+
+    dump_yaml(template_log, path=(build_info.data_path,
+                                  build_info.template_prefix +
+                                  build_info.log_file))
+
+    if write_spec:
+        dump_yaml(template_spec, path=(build_info.data_path,
+                                   build_info.template_prefix +
+                                   build_info.result_file))
 
     dump_obj(exam_obj, path=(build_info.data_path,
                             build_info.post_prefix +
                             build_info.template_prefix +
                             build_info.doc_file))
-    pass
+
+    return templates
 
 def finalize_exam(exam_obj, build_info):
 
@@ -116,15 +182,8 @@ def finalize_exam(exam_obj, build_info):
                             build_info.finalize_prefix +
                             build_info.doc_file))
 
-
-    pwd = os.getcwd()
-
-    os.chdir(build_info.build_path)
-
     finalize_log = exam_obj.finalize_build(build_info)
 
-    os.chdir(pwd)
-
     dump_obj(finalize_log, path=(build_info.data_path,
                                build_info.finalize_prefix +
                                build_info.log_file))
@@ -144,36 +203,255 @@ def output_exam(exam_obj, build_info):
                                build_info.output_prefix +
                                build_info.log_file))
 
-def build_exam(exam_cls, class_name, student_id,  build_info, setup_only = False):
+def copy_exam_assets(source_info, build_info, setup_files):
+    """
+    Copy the files that setting up an exam put in its build directory into
+    another format's build directory. That's every asset along with any
+    files that user setup code generated there, see `setup_exam`.
+
+    Parameters:
+
+       source_info: The format the exam was set up in.
+
+       build_info: The format to copy the files to.
+
+       setup_files: Paths relative to the build directory, i.e. the
+          `'setup_files'` of the setup log.
+    """
+
+    start = time.perf_counter()
+
+    source_dir = Path(source_info.build_path)
+
+    copy_log = dict()
+    copy_log['files_copied'] = list()
+
+    for name in setup_files:
+
+        in_file = Path(source_dir, name)
+        out_file = Path(build_info.build_path, name)
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+
+        shutil.copyfile(in_file, out_file)
+
+        copy_log['files_copied'].append({
+            'from': str(in_file), 'to': str(out_file)})
+
+    copy_log['copy_seconds'] = time.perf_counter() - start
+
+    dump_yaml(copy_log, path=(build_info.data_path,
+                              build_info.setup_prefix +
+                              build_info.log_file))
+
+    return copy_log
+
+def record_setup_times(timer, setup_log):
+    """
+    Split the time spent in `setup_exam` or `copy_exam_assets` into copying
+    assets and running user setup code.
+    """
+    timer.add_detail('setup_assets', sum_log_field(setup_log, 'copy_seconds'))
+    timer.add_detail('setup_user', sum_log_field(setup_log, 'user_setup_seconds'))
+
+def compile_exam(exam_obj, format_infos, journals, timers):
+    """
+    Finalize and output an exam that's already been templated in every
+    format.
+    """
+
+    for (format_info, journal, format_timer) in zip(
+            format_infos, journals, timers):
+
+        with format_timer.phase('finalize_exam'):
+            finalize_exam(exam_obj, format_info)
+
+        journal.phase_done('finalize')
 
-    build_info = build_info.where(
-        data_path = build_info.exam_data_path(),
-        build_path = build_info.exam_build_path(),
-        out_path = build_info.exam_out_path(),
-        is_standalone = True)
+        with format_timer.phase('output_exam'):
+            output_exam(exam_obj, format_info)
 
-    os.makedirs(build_info.data_path, exist_ok = True)
-    os.makedirs(build_info.build_path, exist_ok = True)
-    os.makedirs(build_info.out_path, exist_ok = True)
+        journal.phase_done('output')
 
-    exam_obj = init_exam(exam_cls, build_info)
+        journal.finish()
 
-    if build_info.classroom.answers != None:
-        if exam_obj.student.answer_data != None:
-            distribute_answers(exam_obj, exam_obj.student.answer_data)
+def compile_exam_job(exam_obj, format_infos, journals, timers):
+    """
+    `compile_exam` as a background job, which has to record failures and
+    timings itself since `build_exam` has already returned.
+    """
+
+    try:
+        compile_exam(exam_obj, format_infos, journals, timers)
+
+    except Exception as err:
+        fail_journals(journals, err)
+        raise err
+
+    finally:
+        dump_timings(format_infos, timers)
+
+def fail_journals(journals, err):
+    for journal in journals:
+        if journal.status != 'done':
+            journal.fail(err)
+
+def dump_timings(format_infos, timers):
+    for (format_info, format_timer) in zip(format_infos, timers):
+        dump_yaml(format_timer.report(format_info),
+                  path=(format_info.data_path, format_info.timing_file))
+
+def build_exam(exam_cls, class_name, student_id,  build_info, setup_only = False,
+               exam_formats = None, fingerprint = None, compile_pool = None):
+    """
+    Build a single student's exam.
+
+    When `exam_formats` is given, the exam is initialized and set up only once
+    (in the first format's directories) and then templated, finalized and
+    output for every format in the list.
+
+    Unless `setup_only` is set, progress through each phase is recorded in a
+    `BuildJournal` for every format along with the `fingerprint` of the build
+    inputs, so an interrupted class-wide build can be resumed.
+
+    The time spent in each phase is written to a timing report in each
+    format's data directory. Work shared between formats is counted against
+    the first one.
+
+    If a `compile_pool` is given, the exam is only templated here and then
+    handed off to the pool to be finalized and output, so the caller can
+    start on the next student right away. Failures are then raised when the
+    pool is drained, see `drain_compile_pool`.
+    """
+
+    if exam_formats == None:
+        exam_formats = [build_info.exam_format]
+
+    format_infos = list()
+    journals = list()
+    timers = list()
+
+    for exam_format in exam_formats:
+
+        format_info = build_info.where(exam_format = exam_format)
+
+        format_info = format_info.where(
+            data_path = format_info.exam_data_path(),
+            build_path = format_info.exam_build_path(),
+            out_path = format_info.exam_out_path(),
+            is_standalone = True)
+
+        os.makedirs(format_info.data_path, exist_ok = True)
+        os.makedirs(format_info.build_path, exist_ok = True)
+        os.makedirs(format_info.out_path, exist_ok = True)
+
+        format_infos.append(format_info)
+        timers.append(PhaseTimer())
+
+        if not setup_only:
+            journal = BuildJournal(Path(format_info.data_path,
+                                        format_info.journal_file))
+            journal.start(fingerprint)
+            journals.append(journal)
+
+    def phase_done(phase, journals=journals):
+        for journal in journals:
+            journal.phase_done(phase)
+
+    build_info = format_infos[0]
+    timer = timers[0]
+
+    compile_deferred = False
 
-    if build_info.classroom.scores != None:
-        if exam_obj.student.score_data != None:
-            distribute_scores(exam_obj, exam_obj.student.score_data)
+    try:
 
-    setup_exam(exam_obj, build_info)
+        with timer.phase('init_exam'):
+            exam_obj = init_exam(exam_cls, build_info)
 
-    if not setup_only:
+        phase_done('init')
 
-        template_exam(exam_obj, build_info)
+        with timer.phase('distribute_answers'):
 
-        finalize_exam(exam_obj, build_info)
+            if build_info.classroom.answers != None:
+                if exam_obj.student.answer_data != None:
+                    distribute_answers(exam_obj, exam_obj.student.answer_data)
 
-        output_exam(exam_obj, build_info)
+            if build_info.classroom.scores != None:
+                if exam_obj.student.score_data != None:
+                    distribute_scores(exam_obj, exam_obj.student.score_data)
+
+        with timer.phase('setup_exam'):
+            setup_log = setup_exam(exam_obj, build_info)
+
+        record_setup_times(timer, setup_log)
+
+        for (format_info, format_timer) in zip(format_infos[1:], timers[1:]):
+            with format_timer.phase('setup_exam'):
+                copy_log = copy_exam_assets(build_info, format_info,
+                                            setup_log['setup_files'])
+            record_setup_times(format_timer, copy_log)
+
+        phase_done('setup')
+
+        if not setup_only:
+
+            for (format_info, journal, format_timer) in zip(
+                    format_infos, journals, timers):
+
+                with format_timer.phase('template_exam'):
+                    templates = template_exam(exam_obj, format_info)
+
+                journal.phase_done('template', templates = templates)
+
+            if compile_pool == None:
+                compile_exam(exam_obj, format_infos, journals, timers)
+            else:
+                compile_pool.submit(class_name, student_id, compile_exam_job,
+                                    exam_obj, format_infos, journals, timers)
+                compile_deferred = True
+
+    except Exception as err:
+
+        fail_journals(journals, err)
+
+        raise err
+
+    finally:
+
+        if not compile_deferred:
+            dump_timings(format_infos, timers)
 
     return exam_obj
+
+
+def build_from_spec(class_name, student_id, spec):
+    """
+    Task action for a single student's build, takes only a picklable
+    `BuildSpec` so that it can be shipped to doit's multiprocess workers.
+    """
+
+    exam_cls = spec.exam_class()
+
+    classroom = cached_roster(exam_cls,
+                              class_name,
+                              spec.build_info,
+                              load_answers = spec.load_answers,
+                              load_scores = spec.load_scores)
+
+    build_info = spec.build_info.where(
+        class_name = class_name,
+        classroom = classroom,
+        exam_format = spec.exam_format,
+        student_id = student_id,
+        student = classroom.students[student_id])
+
+    compile_pool = None
+
+    if build_info.latex_jobs != 0:
+        compile_pool = get_compile_pool(build_info.latex_jobs)
+
+    build_exam(exam_cls, class_name, student_id, build_info,
+               exam_formats = spec.exam_formats,
+               fingerprint = spec.fingerprint,
+               compile_pool = compile_pool)
+
+    return None
@@ -0,0 +1,168 @@
+import attr
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ["CompilePool",
+           "get_compile_pool",
+           "drain_compile_pool",
+           "parse_latex_jobs"]
+
+@attr.s
+class CompilePool():
+    """
+    A bounded pool that compiles (finalizes and outputs) exams in the
+    background while the student tasks go on to render the next exams.
+
+    The work is almost entirely waiting on LaTeX subprocesses, so threads are
+    enough to keep `workers` of them running at once. `submit` blocks once
+    `max_pending` exams are rendered but not yet compiled, so rendering can't
+    get arbitrarily far ahead of compilation.
+    """
+
+    workers = attr.ib(default=None)
+    """
+    Number of exams compiled at once, defaults to the number of cores.
+    """
+
+    max_pending = attr.ib(default=None, kw_only=True)
+    """
+    Max number of exams either compiling or waiting to compile, defaults to
+    twice `workers`.
+    """
+
+    _executor = attr.ib(init=False)
+    _slots = attr.ib(init=False)
+    _pending = attr.ib(factory=list, init=False)
+    _lock = attr.ib(factory=threading.Lock, init=False)
+
+    def __attrs_post_init__(self):
+        if self.workers == None:
+            self.workers = os.cpu_count() or 1
+        if self.max_pending == None:
+            self.max_pending = 2 * self.workers
+
+        self._executor = ThreadPoolExecutor(
+            max_workers = self.workers,
+            thread_name_prefix = "compile")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def submit(self, group, name, job, *vargs, **kwargs):
+        """
+        Run `job(*vargs, **kwargs)` in the background, waiting for a free
+        slot first if too many jobs are already pending.
+
+        Parameters:
+
+           group: The jobs `drain` should wait for, e.g. the class name.
+
+           name: Used to identify the job if it fails, e.g. the student id.
+
+        Returns:
+
+           Future: For the result of `job`.
+        """
+
+        self._slots.acquire()
+
+        def run_job():
+            try:
+                return job(*vargs, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(run_job)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending.append((group, name, future))
+
+        return future
+
+    def drain(self, group=None):
+        """
+        Wait for every submitted job in `group`, or for all of them if no
+        group is given.
+
+        Raises:
+
+           RuntimeError: If any of the jobs failed, after all of them are
+           done. The individual errors are logged.
+        """
+
+        with self._lock:
+            pending = [job for job in self._pending
+                       if group == None or job[0] == group]
+            self._pending = [job for job in self._pending
+                             if not (group == None or job[0] == group)]
+
+        failures = list()
+
+        for (_, name, future) in pending:
+            err = future.exception()
+            if err != None:
+                log.error("Compiling '%s' failed: %s", name, err)
+                failures.append(name)
+
+        if len(failures) > 0:
+            raise RuntimeError("Failed to compile {} exam(s): {}".format(
+                len(failures), ", ".join(failures)))
+
+_compile_pool = None
+"""
+The pool shared by every build in this process, see `get_compile_pool`.
+"""
+
+_compile_pool_lock = threading.Lock()
+
+def get_compile_pool(workers=None):
+    """
+    Get the process-wide `CompilePool`, creating it with `workers` threads
+    if needed.
+    """
+    global _compile_pool
+    with _compile_pool_lock:
+        if _compile_pool == None:
+            _compile_pool = CompilePool(workers)
+        return _compile_pool
+
+def drain_compile_pool(group=None):
+    """
+    Wait for the background compiles in `group` (or all of them) in this
+    process, if any, raising an error if any of them failed. This is the
+    action of each class's task, which runs after all its students' tasks,
+    so that compile failures fail the build.
+    """
+    if _compile_pool != None:
+        _compile_pool.drain(group)
+
+def parse_latex_jobs(latex_jobs, num_process=0, par_type='process'):
+    """
+    Turn the `--latex-jobs` option into `BuildInfo.latex_jobs`, the number of
+    exams compiled in the background at once.
+
+    `0` compiles each exam inline. So does running doit with `-n N -P
+    process`, since each class's task may run in a different worker process
+    than its students' tasks and couldn't wait for their compiles. The worker
+    processes already overlap rendering with compiling in that case.
+    """
+
+    if latex_jobs < 0:
+        raise RuntimeError(
+            "'--latex-jobs' must be 0 or more, got {}.".format(latex_jobs))
+
+    if par_type == 'process' and num_process > 1:
+        if latex_jobs != 0:
+            log.info("Compiling inline, since doit runs tasks in %s "
+                     "processes.", num_process)
+        return 0
+
+    return latex_jobs
@@ -0,0 +1,166 @@
+import hashlib
+import inspect
+import functools
+import yaml
+import jsonpickle.pickler as json_p
+
+from pathlib import *
+
+from doit.tools import config_changed
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ["document_classes",
+           "fingerprint_data",
+           "exam_file_deps",
+           "exam_settings_fingerprint",
+           "files_fingerprint",
+           "templates_unchanged",
+           "student_fingerprint",
+           "student_task_fields"]
+
+def document_classes(doc_cls):
+    """
+    Walk an exam class and all of its (sub-)questions, returning a list of
+    every document class that's part of the exam.
+    """
+
+    # unwrap `with_options` and similar partial applications
+    while isinstance(doc_cls, functools.partial):
+        doc_cls = doc_cls.func
+
+    classes = [doc_cls]
+
+    for question in getattr(doc_cls, 'questions', dict()).values():
+        for sub_cls in document_classes(question):
+            if sub_cls not in classes:
+                classes.append(sub_cls)
+
+    return classes
+
+def fingerprint_data(data):
+    """
+    A stable content hash for arbitrary python data. Objects are flattened
+    the same way `dump_obj` does before they're hashed, so the result doesn't
+    depend on memory addresses or dict ordering.
+    """
+    flat = json_p.Pickler(keys=True, warn=False).flatten(data)
+    text = yaml.dump(flat, sort_keys=True)
+    return hashlib.sha256(bytes(text, 'utf-8')).hexdigest()
+
+def _class_settings(doc_cls):
+    """
+    The class level settings of a document class. `settings` itself is only
+    a property on instances, the class' copy lives in a secret attribute.
+    """
+    return getattr(doc_cls, "__settings")
+
+def _class_root(doc_cls):
+    return Path(inspect.getsourcefile(doc_cls)).parent
+
+def exam_file_deps(exam_cls):
+    """
+    Get the sorted list of the files every build of an exam depends on: the
+    source files of the exam and its questions, and all the asset files that
+    would be copied into the build directory.
+
+    Templates aren't included, which ones a build reads depends on the
+    student. They're recorded in each student's journal instead, see
+    `templates_unchanged`.
+    """
+
+    deps = set()
+
+    for doc_cls in document_classes(exam_cls):
+
+        deps.add(Path(inspect.getsourcefile(doc_cls)).resolve())
+
+        for glob_pattern in _class_settings(doc_cls).assets:
+            for asset in _class_root(doc_cls).glob(glob_pattern):
+                if asset.is_file():
+                    deps.add(asset.resolve())
+
+    return sorted(map(str, deps))
+
+def files_fingerprint(files):
+    """
+    Hash of the names and contents of a list of files.
+    """
+    hasher = hashlib.sha256()
+    for file_name in files:
+        hasher.update(bytes(str(file_name), 'utf-8'))
+        hasher.update(Path(file_name).read_bytes())
+    return hasher.hexdigest()
+
+def templates_unchanged(templates):
+    """
+    Do all the template files from `template_dependencies` still have the
+    same contents? `None`, for a build that never recorded its templates,
+    is never unchanged.
+    """
+
+    if templates == None:
+        return False
+
+    for (file_name, digest) in templates.items():
+        try:
+            data = Path(file_name).read_bytes()
+        except OSError:
+            return False
+        if hashlib.sha256(data).hexdigest() != digest:
+            return False
+
+    return True
+
+def exam_settings_fingerprint(exam_cls):
+    """
+    Hash of the settings tree for the exam and all its questions.
+    """
+    return fingerprint_data({
+        "{}.{}".format(c.__module__, c.__qualname__): _class_settings(c).value_dict
+        for c in document_classes(exam_cls)})
+
+def student_fingerprint(student):
+    """
+    Hash of a student's roster row and any answer or score data attached to
+    it.
+    """
+    return fingerprint_data({
+        'ident': student.ident,
+        'name': student.name,
+        'username': student.username,
+        'student_id': student.student_id,
+        'root_seed': student.root_seed,
+        'student_data': student.student_data,
+        'answer_data': student.answer_data,
+        'score_data': student.score_data})
+
+def student_task_fields(file_deps, settings_hash, student, targets=None):
+    """
+    Extra doit task fields for a per-student build task, letting doit skip the
+    task when none of its inputs have changed.
+
+    Parameters:
+
+       file_deps: List of files the build depends on, from `exam_file_deps`.
+
+       settings_hash: Fingerprint from `exam_settings_fingerprint`.
+
+       student: The `Student` this task is building an exam for.
+
+       targets: The output files this task produces, if any.
+    """
+
+    fields = {
+        'file_dep': file_deps,
+        'uptodate': [config_changed({
+            'settings': settings_hash,
+            'student': student_fingerprint(student)})]
+        }
+
+    if targets != None:
+        fields['targets'] = list(map(str, targets))
+
+    return fields
@@ -12,27 +12,31 @@ import exam_gen.util.logging as logging
 
 log = logging.new(__name__, level="DEBUG")
 
-def calculate_grades(class_name, build_info):
+def calculate_grades(exam_cls, class_name, build_info):
 
     classroom = get_roster_data(
+        exam_cls,
         class_name,
         build_info,
         load_scores = True,
         load_answers = True
     )
 
-    for (student_id, student) in classroom.students.items():
+    students = {k: v for (k, v) in classroom.students.items()
+                if build_info.in_shard(k)}
 
+    for (student_id, student) in students.items():
 
         print("Grading Student: {}".format(student_id))
 
         student_bld = build_info.where(
+            classroom = classroom,
             student_id = student_id,
             student = student
         )
 
         exam_obj = build_exam(
-            classroom.exam,
+            exam_cls,
             class_name,
             student_id,
             student_bld,
@@ -47,6 +51,16 @@ def calculate_grades(class_name, build_info):
 
         classroom.assign_grades(student_id, grade_data)
 
-    classroom.print_grades(build_info.class_out_path())
+    if build_info.shard == None:
+        classroom.print_grades(build_info.class_out_path(), students)
+    else:
+        classroom.print_grades(build_info.shard_out_path(), students)
 
     return classroom
+
+def grade_class(exam_cls, class_name, build_info):
+    """
+    Task action for `calculate-grades`.
+    """
+    calculate_grades(exam_cls, class_name, build_info)
+    return None
@@ -0,0 +1,169 @@
+import attr
+import os
+import yaml
+import datetime
+
+from pathlib import *
+
+from .fingerprint import templates_unchanged
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ["BuildJournal",
+           "journal_complete",
+           "journal_templates_unchanged",
+           "resume_task_fields",
+           "__build_phases__"]
+
+__build_phases__ = ['init', 'setup', 'template', 'finalize', 'output']
+"""
+The phases of a single student's build, in the order they're run.
+"""
+
+@attr.s
+class BuildJournal():
+    """
+    Persistent record of how far a single student's build got, so that a
+    class-wide build that dies partway through can be resumed.
+
+    Each student and format has its own journal file in its data directory,
+    which means parallel workers never write to the same file.
+    """
+
+    path = attr.ib()
+    """
+    Where the journal is stored.
+    """
+
+    fingerprint = attr.ib(default=None, kw_only=True)
+    """
+    Hash of the inputs this build was started with.
+    """
+
+    status = attr.ib(default=None, kw_only=True)
+    """
+    One of `None`, `'running'`, `'failed'` or `'done'`.
+    """
+
+    phases = attr.ib(factory=dict, kw_only=True)
+    """
+    Map from each completed phase to the time it completed.
+    """
+
+    error = attr.ib(default=None, kw_only=True)
+    """
+    Description of the error that made the build fail, if any.
+    """
+
+    templates = attr.ib(default=None, kw_only=True)
+    """
+    Map from each template file the build read to the sha256 of its
+    contents, see `template_dependencies`.
+    """
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read the journal at `path`, returns an empty journal if there isn't
+        one or it can't be read.
+        """
+        path = Path(path)
+
+        try:
+            data = yaml.safe_load(path.read_text())
+            return cls(path, **data)
+        except (OSError, TypeError, yaml.YAMLError):
+            return cls(path)
+
+    def save(self):
+        """
+        Write the journal out. This writes a temp file and renames it so a
+        killed build never leaves a truncated journal behind.
+        """
+        data = attr.asdict(self, filter=lambda a, v: a.name != 'path')
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(yaml.safe_dump(data))
+        os.replace(tmp_path, self.path)
+
+    def start(self, fingerprint):
+        """
+        Mark the build as started with some set of inputs, forgetting about
+        any phases from a previous run.
+        """
+        self.fingerprint = fingerprint
+        self.status = 'running'
+        self.phases = dict()
+        self.error = None
+        self.templates = None
+        self.save()
+
+    def phase_done(self, phase, templates=None):
+        """
+        Mark a phase as done. The templating phase also records the
+        `templates` it read.
+        """
+        assert phase in __build_phases__, (
+            "'{}' is not a valid build phase".format(phase))
+        self.phases[phase] = datetime.datetime.now().isoformat()
+        if templates != None:
+            self.templates = templates
+        self.save()
+
+    def finish(self):
+        self.status = 'done'
+        self.save()
+
+    def fail(self, err):
+        self.status = 'failed'
+        self.error = "{}: {}".format(type(err).__name__, err)
+        self.save()
+
+    def is_complete(self, fingerprint):
+        """
+        Did the build finish every phase with inputs matching `fingerprint`,
+        and templates that haven't changed since?
+        """
+        return (self.status == 'done'
+                and self.fingerprint == fingerprint
+                and all(map(lambda p: p in self.phases, __build_phases__))
+                and templates_unchanged(self.templates))
+
+def journal_complete(journal_files, fingerprint):
+    """
+    Doit `uptodate` check used when resuming a build, a student's task can
+    be skipped if all of its journals are complete for the current inputs.
+    """
+    return all(map(lambda f: BuildJournal.load(f).is_complete(fingerprint),
+                   journal_files))
+
+def journal_templates_unchanged(journal_files):
+    """
+    Doit `uptodate` check, a student's task can be skipped only if none of
+    the templates its last build read have changed.
+    """
+    return all(map(
+        lambda f: templates_unchanged(BuildJournal.load(f).templates),
+        journal_files))
+
+def resume_task_fields(journal_files, fingerprint, targets=None):
+    """
+    Extra doit task fields for a per-student build task when resuming a build.
+    These ignore doit's own dependency database (which may not have been saved
+    if the build was killed) and only rerun the task if its journals aren't
+    complete for the current `fingerprint`.
+    """
+
+    fields = {
+        'uptodate': [(journal_complete,
+                      (list(map(str, journal_files)), fingerprint),
+                      {})]
+        }
+
+    if targets != None:
+        fields['targets'] = list(map(str, targets))
+
+    return fields
@@ -1,5 +1,6 @@
 
 import attr
+import os
 import inspect
 import textwrap
 import functools
@@ -8,7 +9,7 @@ from copy import *
 from pprint import *
 from pathlib import *
 
-from ..data import BuildInfo
+from ..data import BuildInfo, BuildSpec
 
 from doit.cmd_base import TaskLoader2
 from doit.task import dict_to_task
@@ -17,6 +18,11 @@ from .task_generators import *
 from .roster_tasks import *
 from .build_tasks import *
 from .grade_tasks import *
+from .fingerprint import *
+from .journal import *
+from .shard_tasks import *
+from .timing_tasks import *
+from .compile_pool import *
 
 from exam_gen.util.with_options import WithOptions
 from exam_gen.util.file_ops import *
@@ -39,6 +45,49 @@ class BuildLoader(TaskLoader2, WithOptions):
     cmd = attr.ib(init=False)
     pos_args = attr.ib(init=False)
 
+    resume = attr.ib(default=False, init=False)
+    """
+    Skip students whose build journals show a completed build with the same
+    inputs, instead of relying on doit's dependency database.
+    """
+
+    cmd_options = (
+        {'name': 'resume',
+         'long': 'resume',
+         'type': bool,
+         'default': False,
+         'help': ("Resume an interrupted build, only building students whose "
+                  "last build failed, didn't finish, or whose inputs have "
+                  "changed.")},
+        {'name': 'shard',
+         'long': 'shard',
+         'type': str,
+         'default': "",
+         'help': ("Only build students in shard 'i/N' (e.g. '--shard 2/4'), "
+                  "so a class can be split across several machines. Run "
+                  "`merge-shards` once all the shards are done.")},
+        {'name': 'debug_artifacts',
+         'long': 'debug-artifacts',
+         'type': str,
+         'default': 'full',
+         'choices': (('off', "Don't write template debug files."),
+                     ('on-error', "Only for templates that fail to render."),
+                     ('summary', ("Only the top level template and result, "
+                                  "plus 'on-error'.")),
+                     ('full', "Templates, contexts, and results for every "
+                              "template.")),
+         'help': ("Which template debug files to write into the data "
+                  "directory.")},
+        {'name': 'latex_jobs',
+         'long': 'latex-jobs',
+         'type': int,
+         'default': os.cpu_count() or 1,
+         'help': ("How many exams to compile with LaTeX in the background "
+                  "while the next ones are rendered, defaults to one per "
+                  "core. 0 compiles each exam before starting the next, as "
+                  "does running doit with '-n N -P process'.")},
+    )
+
     @proj_root.default
     def _init_proj_root(self):
         return Path(inspect.getsourcefile(self.exam)).parent
@@ -47,13 +96,29 @@ class BuildLoader(TaskLoader2, WithOptions):
         if hasattr(super(), '__attrs_post_init__'):
             super().__attrs_post_init__()
 
-        self.build_info.root_dir = self.proj_root
+        self.build_info = self.build_info.where(root_dir = self.proj_root)
 
-    def setup(self, opt_values): pass
+    def setup(self, opt_values):
+        self.resume = opt_values.get('resume', False)
+        self.build_info = self.build_info.where(
+            shard = parse_shard(opt_values.get('shard', None)),
+            debug_level = opt_values.get('debug_artifacts', 'full'),
+            latex_jobs = parse_latex_jobs(
+                opt_values.get('latex_jobs', os.cpu_count() or 1),
+                num_process = opt_values.get('num_process', 0),
+                par_type = opt_values.get('par_type', 'process')))
 
     def load_doit_config(self):
-        return {'verbosity': 2,
-                'default_tasks':['_help_msg']}
+        config = {'verbosity': 2,
+                  'default_tasks':['_help_msg']}
+
+        # Shards often share a project directory over NFS, so each needs its
+        # own dependency database.
+        if self.build_info.shard != None:
+            config['dep_file'] = ".doit-{}.db".format(
+                self.build_info.shard_name())
+
+        return config
 
     def load_tasks(self, cmd, pos_args):
         self.cmd = cmd
@@ -64,7 +129,10 @@ class BuildLoader(TaskLoader2, WithOptions):
         tasks += self.roster_parse_tasks()
         tasks += self.build_exam_tasks()
         tasks += self.build_solution_tasks()
+        tasks += self.build_release_tasks()
         tasks += self.calculate_grade_tasks()
+        tasks += self.merge_shard_tasks()
+        tasks += self.timing_report_tasks()
         return tasks
 
     def help_task(self):
@@ -100,127 +168,206 @@ class BuildLoader(TaskLoader2, WithOptions):
 
     def roster_parse_tasks(self):
 
-        classes = {k:
-                   self.build_info.where(class_name = k,
-                                         classroom = class_init(
-                                             exam=self.exam,
-                                             parent_path=self.proj_root))
-                   for (k,class_init) in self.exam.classes.items()}
-
-        def drop_return(a,b):
-            get_roster_data(a,b)
-            return None
+        classes = {k: self.build_info.where(class_name = k)
+                   for k in self.exam.classes.keys()}
 
         return build_task_group(
             task_prefix = "parse-roster",
             task_doc = ("parse the class rosters (incl. answer and score data "
                         "if available)"),
             group_data = classes,
-            run_task = drop_return)
+            run_task = functools.partial(parse_roster, self.exam))
 
     def calculate_grade_tasks(self):
 
-        classes = {k:
-                   self.build_info.where(
-                       class_name = k,
-                       exam_format = "grades",
-                       classroom = class_init(
-                           exam=self.exam,
-                           parent_path=self.proj_root
-                       )
-                   )
-
-                   for (k,class_init) in self.exam.classes.items()}
-
-        def drop_return(a,b):
-            calculate_grades(a,b)
-            return None
+        classes = {k: self.build_info.where(class_name = k,
+                                            exam_format = "grades")
+                   for k in self.exam.classes.keys()}
 
         return build_task_group(
             task_prefix = "calculate-grades",
             task_doc = ("Calculates the grades for the classroom."),
             group_data = classes,
-            run_task = drop_return)
+            run_task = functools.partial(grade_class, self.exam))
 
-    def build_exam_tasks(self):
+    def merge_shard_tasks(self):
 
-        exam_data = dict()
+        classes = {k: self.build_info.where(class_name = k)
+                   for k in self.exam.classes.keys()}
 
-        build_info = self.build_info.where(exam_format = "exam")
-
-        for (class_name, class_init) in self.exam.classes.items():
-
-            class_obj = class_init(exam = self.exam,
-                                   parent_path = self.proj_root)
+        return build_task_group(
+            task_prefix = "merge-shards",
+            task_doc = ("Combine the outputs of sharded builds into the "
+                        "class-level results."),
+            group_data = classes,
+            run_task = functools.partial(merge_shards, self.exam))
 
-            class_bld = build_info.where(class_name = class_name,
-                                         classroom = class_obj)
+    def timing_report_tasks(self):
 
-            class_obj = get_roster_data(
-                class_name,
-                class_bld
-            )
+        classes = {k: self.build_info.where(class_name = k)
+                   for k in self.exam.classes.keys()}
 
-            exam_data[class_name] = dict()
+        return build_task_group(
+            task_prefix = "timing-report",
+            task_doc = ("Summarize how long each build phase took for every "
+                        "student in the class."),
+            group_data = classes,
+            run_task = functools.partial(report_timings, self.exam))
 
-            for (student_id, student) in class_obj.students.items():
+    def build_exam_tasks(self):
 
-                student_bld = class_bld.where(student_id = student_id,
-                                              student = student)
+        return delayed_task_group(
+            task_name = "build-exam",
+            create_tasks = self.create_exam_tasks,
+            task_doc = "Build all the exams for each student.")
 
-                exam_data[class_name][student_id] = student_bld
+    def create_exam_tasks(self):
 
-        def drop_return(*vargs, **kwargs):
-            build_exam(*vargs, **kwargs)
-            return None
+        (exam_data, student_fields) = self.student_build_specs("exam")
 
         return build_all_class_tasks(
             task_prefix = "build-exam",
             exam_data = exam_data,
-            run_task = functools.partial(drop_return, self.exam),
+            run_task = build_from_spec,
             task_doc = "Build all the exams for each student.",
-            subtask_doc = "Build the exams for class '{}'.")
+            subtask_doc = "Build the exams for class '{}'.",
+            class_finish_actions = [drain_compile_pool],
+            student_task_fields = student_fields)
 
 
     def build_solution_tasks(self):
 
+        return delayed_task_group(
+            task_name = "build-solution",
+            create_tasks = self.create_solution_tasks,
+            task_doc = "Build all the answer keys for each student.")
+
+    def create_solution_tasks(self):
+
+        (exam_data, student_fields) = self.student_build_specs(
+            "solution", load_answers=True)
+
+        return build_all_class_tasks(
+            task_prefix = "build-solution",
+            exam_data = exam_data,
+            run_task = build_from_spec,
+            task_doc = "Build all the answer keys for each student.",
+            subtask_doc = "Build the answer keys for class '{}'.",
+            class_finish_actions = [drain_compile_pool],
+            student_task_fields = student_fields)
+
+    def build_release_tasks(self):
+
+        return delayed_task_group(
+            task_name = "build-release",
+            create_tasks = self.create_release_tasks,
+            task_doc = ("Build both the exams and answer keys for each "
+                        "student, setting up each exam only once."))
+
+    def create_release_tasks(self):
+
+        (exam_data, student_fields) = self.student_build_specs(
+            "exam", "solution", load_answers=True)
+
+        return build_all_class_tasks(
+            task_prefix = "build-release",
+            exam_data = exam_data,
+            run_task = build_from_spec,
+            task_doc = ("Build both the exams and answer keys for each "
+                        "student, setting up each exam only once."),
+            subtask_doc = "Build the exams and answer keys for class '{}'.",
+            class_finish_actions = [drain_compile_pool],
+            student_task_fields = student_fields)
+
+    def student_build_specs(self, *exam_formats, load_answers=False,
+                            load_scores=False):
+        """
+        Get the rosters for every class and generate a dict of
+        `class_name -> student_id -> BuildSpec`, where each spec is small
+        enough to be cheaply pickled and sent to a doit worker process.
+
+        If more than one format is given, each student's exam will be set up
+        once and then built in every one of those formats.
+
+        Also returns a matching dict of per-student task fields with the
+        `file_dep`, `uptodate` and `targets` that let doit skip students whose
+        inputs haven't changed since the last build. When resuming, the
+        students' build journals are checked instead.
+        """
+
         exam_data = dict()
+        student_fields = dict()
+
+        file_deps = exam_file_deps(self.exam)
+        settings_hash = exam_settings_fingerprint(self.exam)
+        files_hash = files_fingerprint(file_deps)
 
-        build_info = self.build_info.where(exam_format = "solution")
+        exam_format = exam_formats[0]
 
-        for (class_name, class_init) in self.exam.classes.items():
+        if len(exam_formats) == 1:
+            exam_formats = None
 
-            class_obj = class_init(exam = self.exam,
-                                   parent_path = self.proj_root)
+        build_info = self.build_info.where(exam_format = exam_format)
 
-            class_bld = build_info.where(class_name = class_name,
-                                         classroom = class_obj)
+        for class_name in self.exam.classes.keys():
+
+            class_bld = build_info.where(class_name = class_name)
 
             class_obj = get_roster_data(
+                self.exam,
                 class_name,
                 class_bld,
-                load_answers=True
+                load_answers=load_answers,
+                load_scores=load_scores
             )
 
             exam_data[class_name] = dict()
+            student_fields[class_name] = dict()
 
             for (student_id, student) in class_obj.students.items():
 
-                student_bld = class_bld.where(student_id = student_id,
-                                              student = student)
+                if not build_info.in_shard(student_id):
+                    continue
 
-                exam_data[class_name][student_id] = student_bld
+                fingerprint = fingerprint_data([files_hash,
+                                                settings_hash,
+                                                student_fingerprint(student)])
 
-        def drop_return(*vargs, **kwargs):
-            build_exam(*vargs, **kwargs)
-            return None
+                exam_data[class_name][student_id] = BuildSpec.from_exam(
+                    self.exam,
+                    class_name = class_name,
+                    student_id = student_id,
+                    exam_format = exam_format,
+                    exam_formats = exam_formats,
+                    load_answers = load_answers,
+                    load_scores = load_scores,
+                    build_info = self.build_info,
+                    fingerprint = fingerprint)
 
-        return build_all_class_tasks(
-            task_prefix = "build-solution",
-            exam_data = exam_data,
-            run_task = functools.partial(drop_return, self.exam),
-            task_doc = "Build all the answer keys for each student.",
-            subtask_doc = "Build the answer keys for class '{}'.")
+                format_blds = [class_bld.where(exam_format = f,
+                                               student_id = student_id)
+                               for f in (exam_formats or [exam_format])]
+
+                targets = [f.exam_out_file() for f in format_blds]
+
+                journal_files = [str(Path(f.exam_data_path(), f.journal_file))
+                                 for f in format_blds]
+
+                if self.resume:
+                    fields = resume_task_fields(
+                        journal_files, fingerprint, targets = targets)
+                else:
+                    fields = student_task_fields(
+                        file_deps, settings_hash, student, targets = targets)
+
+                    # the templates a build reads depend on the student, so
+                    # they're checked against what the last build recorded
+                    fields['uptodate'].append(
+                        (journal_templates_unchanged, (journal_files,), {}))
+
+                student_fields[class_name][student_id] = fields
+
+        return (exam_data, student_fields)
 
     def build_tasks(self, exam_format, **build_settings):
         """
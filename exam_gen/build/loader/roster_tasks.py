@@ -1,4 +1,5 @@
 import attr
+import threading
 
 from copy import *
 
@@ -9,24 +10,44 @@ import exam_gen.util.logging as logging
 
 log = logging.new(__name__, level="DEBUG")
 
-__all__ = ['get_roster_data']
+__all__ = ['get_roster_data',
+           'parse_roster',
+           'cached_roster']
 
-def get_roster_data(class_name, build_info, load_answers=False, load_scores=False):
+_roster_cache = dict()
+"""
+Per-process cache of loaded classrooms, see `cached_roster`.
+"""
 
-    cd_path = build_info.class_data_path()
+_roster_lock = threading.RLock()
+"""
+Makes sure threads building students in parallel don't parse a roster twice.
+"""
+
+def get_roster_data(exam_cls, class_name, build_info,
+                    load_answers=False, load_scores=False):
+    """
+    Get the (cached) classroom for `class_name` and write the parsed roster
+    and per-student data into the data directory.
+    """
+
+    classroom = cached_roster(exam_cls,
+                              class_name,
+                              build_info,
+                              load_answers = load_answers,
+                              load_scores = load_scores)
 
-    classroom = build_info.classroom
+    build_info = build_info.where(class_name = class_name,
+                                  classroom = classroom)
 
-    classroom.load_students()
+    cd_path = build_info.class_data_path()
 
     dump_obj(classroom, path=(cd_path,build_info.base_roster_file))
 
     if load_answers and classroom.answers != None:
-        classroom.load_answers()
         dump_obj(classroom, path=(cd_path, build_info.answered_roster_file))
 
     if load_scores and classroom.scores != None:
-        classroom.load_scores()
         dump_obj(classroom, path=(cd_path, build_info.scored_roster_file))
 
     for (student_id, student) in classroom.students.items():
@@ -39,3 +60,55 @@ def get_roster_data(class_name, build_info, load_answers=False, load_scores=Fals
         dump_obj(student, path=(sd_path, new_build_info.student_data_file))
 
     return classroom
+
+def parse_roster(exam_cls, class_name, build_info):
+    """
+    Task action for `parse-roster`.
+    """
+    get_roster_data(exam_cls, class_name, build_info)
+    return None
+
+def cached_roster(exam_cls, class_name, build_info,
+                  load_answers=False, load_scores=False):
+    """
+    Load the classroom `class_name` for `exam_cls`. The roster file is parsed
+    at most once per process, classrooms with answer or score data are copies
+    of that base classroom with the extra data loaded in.
+
+    Unlike `get_roster_data` this doesn't write anything into the data
+    directory, it's meant for worker processes that just need the students.
+    """
+
+    base_key = (exam_cls, class_name, str(build_info.root_dir))
+    key = base_key + (load_answers, load_scores)
+
+    with _roster_lock:
+
+        if key in _roster_cache:
+            return _roster_cache[key]
+
+        if base_key + (False, False) not in _roster_cache:
+
+            classroom = exam_cls.classes[class_name](
+                exam = exam_cls,
+                parent_path = build_info.root_dir)
+
+            classroom.load_students()
+
+            _roster_cache[base_key + (False, False)] = classroom
+
+        classroom = _roster_cache[base_key + (False, False)]
+
+        if load_answers or load_scores:
+
+            classroom = deepcopy(classroom)
+
+            if load_answers and classroom.answers != None:
+                classroom.load_answers()
+
+            if load_scores and classroom.scores != None:
+                classroom.load_scores()
+
+            _roster_cache[key] = classroom
+
+        return classroom
@@ -0,0 +1,152 @@
+import re
+
+from pathlib import *
+
+from exam_gen.build.formats import __exam_formats__
+from exam_gen.util.file_ops import *
+from .roster_tasks import *
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ['parse_shard', 'find_shard_dirs', 'merge_shards']
+
+def parse_shard(shard_str):
+    """
+    Parse a `--shard` option of the form `"i/N"` into a tuple `(i, N)` with
+    `1 <= i <= N`. Returns `None` for an empty option.
+    """
+
+    if shard_str == None or shard_str == "":
+        return None
+
+    try:
+        (index, count) = map(int, shard_str.split('/'))
+    except ValueError:
+        raise RuntimeError(("Invalid shard '{}', should be of the form "
+                            "'i/N' e.g. '2/4'.").format(shard_str))
+
+    if not (1 <= index <= count):
+        raise RuntimeError(("Invalid shard '{}', the shard index must be "
+                            "between 1 and {}.").format(shard_str, count))
+
+    return (index, count)
+
+def find_shard_dirs(class_out, shard_prefix, count=None):
+    """
+    Find the output directories of a complete set of shards.
+
+    Parameters:
+
+       class_out: The class output directory the shards wrote into.
+
+       shard_prefix: See `BuildInfo.shard_prefix`.
+
+       count: Number of shards the class was split into. If `None`, the
+          shard directories must all be from the same number of shards.
+
+    Returns:
+
+       List of `Path`: The directories for shards `1` through `count`, in
+       order. Empty if there aren't any.
+
+    Raises:
+
+       RuntimeError: If there are directories for more than one shard count
+          and `count` isn't given, or any shard of the set is missing.
+    """
+
+    pattern = re.compile(
+        r"^{}(\d+)-of-(\d+)$".format(re.escape(shard_prefix)))
+
+    class_out = Path(class_out)
+
+    if not class_out.exists():
+        return list()
+
+    shard_sets = dict()
+
+    for shard_dir in class_out.iterdir():
+        match = pattern.match(shard_dir.name)
+        if match != None and shard_dir.is_dir():
+            (index, total) = map(int, match.groups())
+            shard_sets.setdefault(total, dict())[index] = shard_dir
+
+    if count == None:
+        if len(shard_sets) == 0:
+            return list()
+        if len(shard_sets) > 1:
+            raise RuntimeError(
+                ("Found outputs for {} shards in '{}', remove the stale ones "
+                 "or pass '--shard' with the number of shards to merge."
+                 ).format(" and ".join(map(str, sorted(shard_sets))),
+                          class_out))
+        (count,) = shard_sets.keys()
+
+    shards = shard_sets.get(count, dict())
+
+    if len(shards) == 0:
+        return list()
+
+    missing = [i for i in range(1, count + 1) if i not in shards]
+
+    if len(missing) > 0:
+        raise RuntimeError(
+            "Can't merge '{}', missing output for shard(s) {} of {}.".format(
+                class_out, ", ".join(map(str, missing)), count))
+
+    return [shards[i] for i in range(1, count + 1)]
+
+def merge_shards(exam_cls, class_name, build_info):
+    """
+    Task action for `merge-shards`. Combines the per-shard grade outputs of a
+    class into the class level output directory, and checks that every
+    student has an output PDF for every format that's been built.
+
+    Sharded exam and solution builds already write each student's PDF into
+    the shared class output directory, so those only need checking.
+
+    Only a single, complete set of shards is merged, see `find_shard_dirs`.
+    """
+
+    classroom = cached_roster(exam_cls, class_name, build_info)
+
+    build_info = build_info.where(class_name = class_name,
+                                  classroom = classroom)
+
+    class_out = build_info.class_out_path()
+
+    shard_dirs = find_shard_dirs(
+        class_out,
+        build_info.shard_prefix,
+        count = build_info.shard[1] if build_info.shard != None else None)
+
+    merge_log = {'shards': list(map(str, shard_dirs)),
+                 'missing': dict()}
+
+    if classroom.grades != None and len(shard_dirs) > 0:
+        classroom.merge_grades(shard_dirs, class_out)
+
+    for exam_format in __exam_formats__:
+
+        format_info = build_info.where(exam_format = exam_format)
+
+        if not format_info.exam_out_path().exists():
+            continue
+
+        missing = [student_id for student_id in classroom.students.keys()
+                   if not format_info.where(
+                       student_id = student_id).exam_out_file().exists()]
+
+        if len(missing) > 0:
+            log.warning("Class '%s' is missing %s output for students: %s",
+                        class_name, exam_format, ", ".join(missing))
+
+        merge_log['missing'][exam_format] = missing
+
+    dump_yaml(merge_log, path=(build_info.class_data_path(),
+                               build_info.merge_prefix +
+                               build_info.log_file))
+
+    return None
@@ -13,12 +13,20 @@ import exam_gen.util.logging as logging
 
 log = logging.new(__name__, level="WARNING")
 
+__finish_task_name__ = "finish"
+"""
+Name of the subtask that runs a group's `finish_actions`, after all its other
+subtasks.
+"""
+
 def build_task_group(task_prefix : str,
                      group_data : dict,
                           run_task : Callable,
                           task_doc : str = "",
                           mapped_task_deps : List[str] = None,
-                          task_fields : dict = None):
+                          task_fields : dict = None,
+                          subtask_fields : dict = None,
+                          finish_actions : List[Callable] = None):
     """
     Create a task for each entry in a dictionary.
 
@@ -40,6 +48,13 @@ def build_task_group(task_prefix : str,
 
        task_fields : Other fields to be added to each student task that's
           generated.
+
+       subtask_fields : dict from subtask_prefix to other fields that should
+          only be added to that specific subtask. (e.g. `file_dep`)
+
+       finish_actions : Actions for an extra subtask, named by
+          `__finish_task_name__`, which runs after all the others. (doit
+          doesn't let the root task have actions of its own.)
     """
 
     return doit.generate_tasks(
@@ -50,14 +65,18 @@ def build_task_group(task_prefix : str,
             run_task,
             task_doc,
             mapped_task_deps,
-            task_fields))
+            task_fields,
+            subtask_fields,
+            finish_actions))
 
 def build_task_group_iter(task_prefix : str,
                      group_data : dict,
                      run_task : Callable,
                      task_doc : str = "",
                      mapped_task_deps : List[str] = None,
-                     task_fields : dict = None):
+                     task_fields : dict = None,
+                     subtask_fields : dict = None,
+                     finish_actions : List[Callable] = None):
     """
     Create a list of task dicts. See `build_task_group` for parameter details.
     """
@@ -82,6 +101,9 @@ def build_task_group_iter(task_prefix : str,
         if task_fields != None:
             new_task_fields = deepcopy(task_fields)
 
+        if subtask_fields != None and subtask_prefix in subtask_fields:
+            new_task_fields |= subtask_fields[subtask_prefix]
+
         # map any neccesary fields and
         if mapped_task_deps != None:
             new_task_deps = list(map(append_subtask, mapped_task_deps))
@@ -109,6 +131,21 @@ def build_task_group_iter(task_prefix : str,
 
         #     run_student_task(sid, sdata)
 
+    # Add a subtask that runs once all the others are done
+    if finish_actions != None:
+
+        if __finish_task_name__ in group_data:
+            raise RuntimeError(
+                "'{}' can't be used as a name in '{}', it's reserved for the "
+                "task that runs after all the others."
+                .format(__finish_task_name__, task_prefix))
+
+        yield { 'basename': task_prefix,
+                'name': __finish_task_name__,
+                'actions': finish_actions,
+                'task_dep': ["{}:{}".format(task_prefix, subtask_prefix)
+                             for subtask_prefix in group_data]
+        }
 
 
 def build_all_class_tasks(task_prefix : str,
@@ -118,7 +155,9 @@ def build_all_class_tasks(task_prefix : str,
                           subtask_doc : str = "",
                           class_task_deps : List[str] = None,
                           student_task_deps : List[str] = None,
-                          task_fields : dict = None):
+                          task_fields : dict = None,
+                          student_task_fields : dict = None,
+                          class_finish_actions : List[Callable] = None):
     """
     Builds tasks for all classes in an exam.
 
@@ -149,6 +188,13 @@ def build_all_class_tasks(task_prefix : str,
 
        task_fields : Other fields to be added to each student task that's
           generated.
+
+       student_task_fields : Nested dict from `class_name` to `student_id` to
+          other fields that are only added to that student's task.
+
+       class_finish_actions : Functions with sig `(class_name : str) -> None`
+          that are run after all of a class's student tasks, see
+          `build_task_group`.
     """
 
     task_list = list()
@@ -193,13 +239,26 @@ def build_all_class_tasks(task_prefix : str,
             if new_class_task_deps != []:
                 new_task_fields['task_dep'] = new_class_task_deps
 
+        # Partially apply the class name to the class's finish actions
+        new_class_actions = None
+        if class_finish_actions != None:
+            new_class_actions = [functools.partial(action, class_name)
+                                 for action in class_finish_actions]
+
+        # Get the fields that are specific to each student in the class
+        class_student_fields = None
+        if student_task_fields != None:
+            class_student_fields = student_task_fields.get(class_name, None)
+
         # Actually generate the tasks for the class and all the students in it.
         task_list += build_task_group(class_task_prefix,
                                              class_roster,
                                              student_task,
                                              class_task_doc,
                                              new_student_task_deps,
-                                             new_task_fields)
+                                             new_task_fields,
+                                             class_student_fields,
+                                             new_class_actions)
 
     # generate the super-task that will perform the action for all classes
     task_list.append(doit.dict_to_task({
@@ -211,6 +270,35 @@ def build_all_class_tasks(task_prefix : str,
 
     return task_list
 
+def delayed_task_group(task_name : str,
+                       create_tasks : Callable,
+                       task_doc : str = ""):
+    """
+    Create a placeholder task whose actual subtasks are only generated when
+    doit needs to run one of them. Lets `list`, `cleanup` and friends skip
+    expensive work like parsing rosters.
+
+    Parameters:
+
+       task_name : The name of the placeholder task, must be the basename of
+          every task that `create_tasks` generates.
+
+       create_tasks : Function with sig `() -> List[Task]` which will
+          generate the real tasks.
+
+       task_doc : documentation for the placeholder task
+    """
+
+    def creator():
+        yield from create_tasks()
+
+    creator.__doc__ = task_doc
+
+    return [doit.Task(task_name,
+                      None,
+                      doc = task_doc,
+                      loader = doit.DelayedLoader(creator))]
+
 def build_exam_task(classrooms,
                     task_prefix,
                     exam_format,
@@ -0,0 +1,152 @@
+import attr
+import time
+import yaml
+import contextlib
+
+from pathlib import *
+
+from exam_gen.util.file_ops import *
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ['PhaseTimer',
+           'sum_log_field',
+           'summarize_timings',
+           'report_timings']
+
+@attr.s
+class PhaseTimer():
+    """
+    Accumulates the wall-clock time spent in each phase of a single student's
+    build.
+    """
+
+    phases = attr.ib(factory=dict)
+    """
+    Seconds spent in each top level phase, these add up to the total build
+    time.
+    """
+
+    details = attr.ib(factory=dict)
+    """
+    Breakdowns of time spent within a phase (e.g. asset copying vs. user
+    setup code during `setup_exam`), not counted towards the total.
+    """
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_detail(self, name, seconds):
+        self.details[name] = self.details.get(name, 0.0) + seconds
+
+    def report(self, build_info):
+        return {'class': build_info.class_name,
+                'student': build_info.student_id,
+                'format': build_info.exam_format,
+                'phases': dict(self.phases),
+                'details': dict(self.details),
+                'total': sum(self.phases.values())}
+
+def sum_log_field(log_data, field):
+    """
+    Sum every value stored under the key `field` in a nested setup log, like
+    the ones produced by `setup_build` and `on_children`.
+    """
+
+    total = 0.0
+
+    if isinstance(log_data, dict):
+        for (key, value) in log_data.items():
+            if key == field and isinstance(value, (int, float)):
+                total += value
+            else:
+                total += sum_log_field(value, field)
+    elif isinstance(log_data, (list, tuple)):
+        for value in log_data:
+            total += sum_log_field(value, field)
+
+    return total
+
+def _percentile(values, pct):
+    """
+    Nearest-rank percentile of a sorted, non-empty, list.
+    """
+    index = max(0, int(round(pct / 100 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+def summarize_timings(reports, num_slowest=10):
+    """
+    Build the class-level timing summary from a list of per-student timing
+    reports. Gives the p50, p95 and max of each phase (and phase breakdown),
+    and the students with the slowest total build times.
+    """
+
+    phase_times = dict()
+
+    for report in reports:
+        times = dict(report['phases'])
+        times.update(report.get('details', dict()))
+        for (phase, seconds) in times.items():
+            phase_times.setdefault(phase, list()).append(seconds)
+
+    phases = dict()
+
+    for (phase, times) in phase_times.items():
+        times = sorted(times)
+        phases[phase] = {'count': len(times),
+                         'p50': _percentile(times, 50),
+                         'p95': _percentile(times, 95),
+                         'max': times[-1],
+                         'total': sum(times)}
+
+    slowest = sorted(reports, key=lambda r: r['total'], reverse=True)
+
+    return {'phases': phases,
+            'slowest': [{'student': r['student'],
+                         'format': r['format'],
+                         'total': r['total']}
+                        for r in slowest[:num_slowest]]}
+
+def report_timings(exam_cls, class_name, build_info):
+    """
+    Task action for `timing-report`. Collects the timing report of every
+    student in the class and writes the class-level summary next to them.
+    """
+
+    build_info = build_info.where(class_name = class_name)
+
+    class_path = build_info.class_data_path()
+
+    reports = list()
+
+    for timing_file in sorted(class_path.glob(
+            "{}*/{}*/{}".format(build_info.student_prefix,
+                                build_info.exam_prefix,
+                                build_info.timing_file))):
+        reports.append(yaml.safe_load(timing_file.read_text()))
+
+    if len(reports) == 0:
+        log.warning("No timing data found for class '%s'", class_name)
+        return None
+
+    summary = summarize_timings(reports)
+
+    dump_yaml(summary, path=(class_path,
+                             build_info.timing_summary_file))
+
+    print("Timing summary for class '{}':".format(class_name))
+    for (phase, data) in summary['phases'].items():
+        print("  {:<20} p50 {:8.3f}s  p95 {:8.3f}s  max {:8.3f}s".format(
+            phase, data['p50'], data['p95'], data['max']))
+
+    return None
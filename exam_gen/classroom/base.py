@@ -113,5 +113,10 @@ class Classroom(HasDirPath, WithOptions):
     def assign_grades(self, ident, grade_data):
         self.students[ident].grade_data = grade_data
 
-    def print_grades(self, out_dir):
-        self.grades.print_grades(self.students, out_dir)
+    def print_grades(self, out_dir, students=None):
+        if students == None:
+            students = self.students
+        self.grades.print_grades(students, out_dir)
+
+    def merge_grades(self, in_dirs, out_dir):
+        self.grades.merge_grades(in_dirs, out_dir)
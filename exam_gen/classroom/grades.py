@@ -22,6 +22,13 @@ class Grades(HasDirPath, WithOptions):
     def print_grades(self, student_dict, out_dir):
         pass
 
+    def merge_grades(self, in_dirs, out_dir):
+        """
+        Combine the grade outputs that `print_grades` wrote into each of
+        `in_dirs` (e.g. one per build shard) into a single output in `out_dir`.
+        """
+        pass
+
 
 @attr.s
 class CSVGrades(Grades):
@@ -53,6 +60,26 @@ class CSVGrades(Grades):
 
         return out_entries
 
+    def merge_grades(self, in_dirs, out_dir):
+
+        col_keys = list(self.columns.keys())
+
+        out_file = Path(out_dir, self.file_name)
+
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+
+        writer = csv.DictWriter(out_file.open('w'), fieldnames=col_keys)
+        writer.writeheader()
+
+        for in_dir in in_dirs:
+
+            in_file = Path(in_dir, self.file_name)
+
+            if in_file.exists():
+                writer.writerows(csv.DictReader(in_file.open('r')))
+            else:
+                log.warning("No grades found in '%s'", in_file)
+
     def gen_grade_record(self, col_keys, student):
 
         fields = dict()
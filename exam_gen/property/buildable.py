@@ -1,4 +1,5 @@
 import attr
+import time
 import shutil
 
 from .has_settings import HasSettings
@@ -54,6 +55,7 @@ class Buildable(HasSettings, HasDirPath):
         Note: This is a key override function for other classes.
         """
 
+        start = time.perf_counter()
 
         data_dir = build_info.data_path
         build_dir = build_info.build_path
@@ -109,6 +111,8 @@ class Buildable(HasSettings, HasDirPath):
                 log_data['files_copied'].append({
                     'from': str(in_file), 'to': str(out_file)})
 
+        log_data['copy_seconds'] = time.perf_counter() - start
+
         return log_data # will be dumped into data file for debug
 
     def finalize_build(self, build_info):
@@ -1,6 +1,5 @@
 import attr
 import os
-import subprocess
 import shutil
 import textwrap
 
@@ -11,8 +10,9 @@ from collections import Iterable
 from ..document import Document
 from ..buildable import Buildable
 from ..templated import Templated, build_template_spec
+from .latex_build import *
 
-from exam_gen.util.file_ops import dump_str, dump_yaml
+from exam_gen.util.file_ops import dump_str, dump_obj
 
 import exam_gen.util.logging as logging
 
@@ -42,6 +42,36 @@ class LatexDoc(Buildable, Templated):
         document. `'xelatex'` and `'lualatex'` are some other possible options.
         """)
 
+    settings.latex.new_value(
+        'max_passes', default=4, doc=
+        """
+        The most times the document will be compiled. It's only compiled
+        again when a pass changes the `.aux`, `.out` or `.toc` files, or the
+        log asks for a rerun (e.g. for `lastpage` or `hyperref`), so most
+        documents take one or two passes.
+        """)
+
+    settings.latex.new_value(
+        'skip_unchanged', default=True, doc=
+        """
+        Don't compile the document again if neither it nor any file LaTeX
+        read while compiling it last time (found with `-recorder`) has
+        changed, just reuse the existing PDF.
+        """)
+
+    settings.latex.new_value(
+        'precompile_preamble', default=False, doc=
+        """
+        Dump the document's preamble, header includes and all, into a LaTeX
+        format file in the build directory the first time it's seen, then
+        compile every student's document against it instead of loading all
+        the packages again. A new format is built whenever the preamble
+        changes.
+
+        Only works with engines and packages that can be dumped with `-ini`,
+        e.g. `'pdflatex'` and the default exam template.
+        """)
+
     settings.latex.new_value(
         name='header_includes',
         default=None,
@@ -90,9 +120,6 @@ class LatexDoc(Buildable, Templated):
 
     def finalize_build(self, build_info):
 
-        if Path(os.getcwd()) != build_info.build_path:
-            raise RuntimeError("LatexDoc Builds must be run in build dir")
-
         file_stem = self.settings.template.output
         tex_file = Path(file_stem + '.' + self.settings.template.format_ext)
         pdf_file = tex_file.with_suffix('.pdf')
@@ -104,24 +131,92 @@ class LatexDoc(Buildable, Templated):
         # results = build_template_spec(
         #     file_stem, template_spec, dict(), tex_file, data_dir)
 
-        build_cmd = subprocess.run([self.settings.latex.command,
-                                    tex_file])
+        # LaTeX's console output, the parsed `.log` goes in the finalize log
+        output_file = Path(build_info.data_path,
+                           build_info.finalize_prefix +
+                           build_info.latex_log_file)
+
+        output_file.unlink(missing_ok = True)
+
+        build_args = [self.settings.latex.command,
+                      *__latex_batch_args__,
+                      '-recorder',
+                      tex_file]
+        build_env = None
+        format_name = None
+        main_file = tex_file
 
         log_ = {'tex_file': tex_file,
                'pdf_file': pdf_file,
                'build_info': build_info,
-               'latex_command': self.settings.latex.command}
+               'latex_command': self.settings.latex.command,
+               'latex_output': output_file,
+               'latex_log': Path(build_info.build_path, file_stem + '.log')}
 
         try:
-            build_cmd.check_returncode()
 
-        except err:
+            if self.settings.latex.precompile_preamble:
+
+                precompiled = precompile_preamble(
+                    self.settings.latex.command,
+                    Path(build_info.build_path, tex_file),
+                    build_info.latex_format_path(),
+                    output_file = output_file)
+
+                if precompiled != None:
+                    (format_name, body_file) = precompiled
+                    main_file = body_file.name
+                    build_args = [self.settings.latex.command,
+                                  *__latex_batch_args__,
+                                  '-recorder',
+                                  '-fmt=' + format_name,
+                                  '-jobname=' + file_stem,
+                                  main_file]
+                    build_env = os.environ | {'TEXFORMATS': (
+                        str(build_info.latex_format_path()) + os.pathsep)}
+
+            log_['latex_format'] = format_name
+
+            if (self.settings.latex.skip_unchanged
+                and build_is_current(build_args, build_info.build_path,
+                                     file_stem, main_file)):
+                log_['latex_passes'] = 0
+                print_latex_status(build_info, log_)
+                return log_
+
+            (build_cmd, passes) = run_latex(
+                build_args,
+                build_info.build_path,
+                file_stem,
+                max_passes = self.settings.latex.max_passes,
+                env = build_env,
+                output_file = output_file)
+
+            log_['latex_passes'] = passes
+
+            if log_['latex_log'].exists():
+                log_ |= parse_latex_log(log_['latex_log'].read_text(
+                    encoding = 'utf-8', errors = 'replace'))
+
+            if build_cmd.returncode != 0:
+                raise RuntimeError(latex_error_message(log_))
+
+            write_build_record(build_args, build_info.build_path, file_stem)
+
+        except Exception as err:
+
+            log_['error'] = str(err)
+
+            print_latex_status(build_info, log_)
+
             log_name = "finalize-error-{}.yaml".format(file_stem)
 
-            dump_yaml(log_, path=(data_dir, log_name))
+            dump_obj(log_, path=(build_info.data_path, log_name))
 
             raise err
 
+        print_latex_status(build_info, log_)
+
         return log_
 
     def output_build(self, build_info, output_file=None):
@@ -129,7 +224,7 @@ class LatexDoc(Buildable, Templated):
         if output_file == None:
             output_file = self.settings.template.output
 
-        output_file = Path(build_info.out_path, output_file).with_suffix('.pdf')
+        output_file = build_info.out_file(output_file)
 
         pdf_file = Path(build_info.build_path,
                         self.settings.template.output).with_suffix('.pdf')
@@ -139,3 +234,35 @@ class LatexDoc(Buildable, Templated):
         return {'output_file': output_file,
                 'pdf_file': pdf_file,
                 'build_info': build_info}
+
+def latex_error_message(finalize_log):
+    """
+    A one line description of why a LaTeX build failed.
+    """
+
+    errors = finalize_log.get('errors', list())
+
+    if len(errors) == 0:
+        return "LaTeX failed, see '{}'.".format(finalize_log['latex_output'])
+
+    return "LaTeX failed at {}:{}: {}".format(
+        errors[0]['file'], errors[0]['line'], errors[0]['message'])
+
+def print_latex_status(build_info, finalize_log):
+    """
+    Print a single line on how compiling a student's document went, all the
+    details are in the finalize log.
+    """
+
+    if 'error' in finalize_log:
+        status = "FAILED, {}".format(finalize_log['error'])
+    elif finalize_log['latex_passes'] == 0:
+        status = "up to date"
+    else:
+        status = "ok, {} pass(es), {} warning(s)".format(
+            finalize_log['latex_passes'],
+            len(finalize_log.get('warnings', list())))
+
+    print("latex {}:{}: {}".format(build_info.student_id,
+                                   build_info.exam_format,
+                                   status))
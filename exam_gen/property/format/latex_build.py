@@ -0,0 +1,518 @@
+import os
+import re
+import yaml
+import hashlib
+import threading
+import subprocess
+
+from pathlib import *
+
+from exam_gen.util.file_ops import dump_yaml
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ["split_preamble",
+           "precompile_preamble",
+           "run_latex",
+           "recorded_inputs",
+           "write_build_record",
+           "build_is_current",
+           "parse_latex_log",
+           "__latex_batch_args__"]
+
+__latex_batch_args__ = ['-interaction=nonstopmode',
+                        '-halt-on-error',
+                        '-file-line-error']
+"""
+Arguments that keep LaTeX from ever waiting on input, and make errors easy
+to find in its log.
+"""
+
+__begin_document__ = "\\begin{document}"
+
+def split_preamble(tex_source):
+    """
+    Split a LaTeX document into its preamble and body.
+
+    Returns:
+
+       (preamble, body) or None: Where `body` starts with
+       `\\begin{document}`, or `None` if there's no `\\begin{document}` at
+       the start of a line.
+    """
+
+    index = 0
+
+    for line in tex_source.splitlines(keepends=True):
+        if line.lstrip().startswith(__begin_document__):
+            return (tex_source[:index], tex_source[index:])
+        index += len(line)
+
+    return None
+
+_format_locks = dict()
+_format_locks_lock = threading.Lock()
+
+def _format_lock(fmt_name):
+    with _format_locks_lock:
+        return _format_locks.setdefault(fmt_name, threading.Lock())
+
+def precompile_preamble(command, tex_file, format_dir, output_file=None):
+    """
+    Dump the preamble of `tex_file` into a format file in `format_dir`, and
+    write the rest of the document next to `tex_file` so it can be compiled
+    against that format.
+
+    Format files are named after the hash of the preamble and the command,
+    so an existing one is reused by every document with the same preamble and
+    a new one is only built when the preamble changes.
+
+    Parameters:
+
+       command: The LaTeX command, e.g. `'pdflatex'`. Its own format is used
+          as the base of the new one.
+
+       tex_file: The full document, the format is built in its directory so
+          that relative paths in the preamble work.
+
+       format_dir: Where the format files are kept.
+
+       output_file: File to append LaTeX's console output to, if it
+          shouldn't go to the terminal.
+
+    Returns:
+
+       (format_name, body_file) or None: The name to pass with `-fmt`, and
+       the file holding the body of the document. `None` if the document has
+       no `\\begin{document}` to split it at.
+    """
+
+    tex_file = Path(tex_file)
+
+    split = split_preamble(tex_file.read_text(encoding = 'utf-8'))
+
+    if split == None:
+        log.warning("Can't find the preamble of '%s', compiling it without a "
+                    "precompiled format.", tex_file)
+        return None
+
+    (preamble, body) = split
+
+    # The base format is named after the engine, e.g. `pdflatex.fmt`
+    engine = Path(command).name
+
+    fmt_name = "{}-{}".format(engine, hashlib.sha256(
+        bytes(preamble, 'utf-8')).hexdigest()[:16])
+
+    fmt_file = Path(format_dir, fmt_name + ".fmt")
+
+    body_file = tex_file.with_name(tex_file.stem + "-body.tex")
+    body_file.write_text(body, encoding = 'utf-8')
+
+    with _format_lock(fmt_name):
+
+        if not fmt_file.exists():
+
+            os.makedirs(format_dir, exist_ok = True)
+
+            # Build under a name that's unique to this document and then move
+            # it into place, so other processes never see a partial format.
+            job_name = "{}-preamble-{}".format(tex_file.stem, fmt_name)
+            preamble_file = tex_file.with_name(job_name + ".tex")
+            preamble_file.write_text(preamble + "\\dump\n", encoding = 'utf-8')
+
+            process = _run_captured([command,
+                                     '-ini',
+                                     *__latex_batch_args__,
+                                     '-jobname=' + job_name,
+                                     '&' + engine,
+                                     preamble_file.name],
+                                    tex_file.parent,
+                                    output_file = output_file)
+
+            if process.returncode != 0:
+                raise RuntimeError(
+                    "Building the LaTeX format for '{}' failed, see '{}'."
+                    .format(tex_file, Path(tex_file.parent, job_name + ".log")))
+
+            os.replace(Path(tex_file.parent, job_name + ".fmt"), fmt_file)
+
+    return (fmt_name, body_file)
+
+__rerun_exts__ = ['.aux', '.out', '.toc', '.lof', '.lot']
+"""
+Files LaTeX reads back in on the next pass, if any of them change then the
+document has to be compiled again.
+"""
+
+__rerun_pattern__ = re.compile(
+    r"Rerun to get|Label\(s\) may have changed|Please rerun LaTeX"
+    r"|Rerun LaTeX")
+"""
+Messages in the LaTeX log asking for another pass.
+"""
+
+def _rerun_hashes(build_dir, job_name):
+    """
+    Hash each of the files that feed back into the next pass, `None` for
+    those that don't exist.
+    """
+    hashes = dict()
+    for ext in __rerun_exts__:
+        aux_file = Path(build_dir, job_name + ext)
+        if aux_file.exists():
+            hashes[ext] = hashlib.sha256(aux_file.read_bytes()).hexdigest()
+        else:
+            hashes[ext] = None
+    return hashes
+
+def _log_requests_rerun(build_dir, job_name):
+    log_file = Path(build_dir, job_name + ".log")
+    if not log_file.exists():
+        return False
+    return __rerun_pattern__.search(
+        log_file.read_text(encoding = 'utf-8', errors = 'replace')) != None
+
+def _run_captured(build_args, build_dir, env=None, output_file=None):
+    """
+    Run LaTeX with no input, appending its output to `output_file` if
+    given.
+    """
+
+    if output_file == None:
+        return subprocess.run(build_args, cwd = build_dir, env = env,
+                              stdin = subprocess.DEVNULL)
+
+    with open(output_file, 'a', encoding = 'utf-8') as output:
+        output.write("$ {}\n".format(" ".join(map(str, build_args))))
+        output.flush()
+        return subprocess.run(build_args, cwd = build_dir, env = env,
+                              stdin = subprocess.DEVNULL,
+                              stdout = output,
+                              stderr = subprocess.STDOUT)
+
+def run_latex(build_args, build_dir, job_name, max_passes=4, env=None,
+              output_file=None):
+    """
+    Compile a document as many times as it takes for its cross-references,
+    page counts and the like to settle, like `latexmk` does.
+
+    After each pass the `.aux`, `.out`, `.toc`, `.lof` and `.lot` files are
+    compared with what they were before it, and the log is checked for a
+    request to rerun. Another pass is only run if one of those says it's
+    needed.
+
+    Parameters:
+
+       build_args: The full LaTeX command line.
+
+       build_dir: The directory to run LaTeX in.
+
+       job_name: The name of LaTeX's output files, i.e. the document's file
+          name without the `.tex`, or whatever's given with `-jobname`.
+
+       max_passes: Stop after this many passes even if the document still
+          hasn't settled.
+
+       env: The environment to run LaTeX with, if not this process's.
+
+       output_file: File to append LaTeX's console output to, if it
+          shouldn't go to the terminal.
+
+    Returns:
+
+       (process, passes): The `CompletedProcess` of the last pass, and how
+       many passes were run. Stops at the first pass that fails.
+    """
+
+    hashes = _rerun_hashes(build_dir, job_name)
+    passes = 0
+
+    while True:
+
+        passes += 1
+
+        process = _run_captured(build_args, build_dir, env = env,
+                                output_file = output_file)
+
+        if process.returncode != 0:
+            break
+
+        new_hashes = _rerun_hashes(build_dir, job_name)
+
+        if (new_hashes == hashes
+            and not _log_requests_rerun(build_dir, job_name)):
+            break
+
+        if passes >= max_passes:
+            log.warning("'%s' still needs another pass after %s passes, "
+                        "references may be wrong.", job_name, passes)
+            break
+
+        hashes = new_hashes
+
+    return (process, passes)
+
+__build_record_ext__ = ".build-record.yaml"
+"""
+Suffix of the file, next to the PDF, that records what the last compile of
+a document read. See `build_is_current`.
+"""
+
+def _file_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _load_build_record(record_file):
+    """
+    Read a build record, `None` if it's missing or not in the current format.
+    """
+
+    if not Path(record_file).exists():
+        return None
+
+    with open(record_file, 'r') as record_stream:
+        try:
+            record = yaml.safe_load(record_stream)
+        except yaml.YAMLError:
+            return None
+
+    if (not isinstance(record, dict)
+        or not isinstance(record.get('inputs', None), dict)
+        or not all(isinstance(entry, dict)
+                   for entry in record['inputs'].values())):
+        return None
+
+    return record
+
+def _input_unchanged(name, entry):
+    """
+    Is the file `name` the same as when `entry` was recorded? Only hashes the
+    file if its size matches but its modification time doesn't, so that
+    checking the hundreds of packages and fonts a document reads stays cheap.
+    """
+
+    if not Path(name).is_file():
+        return False
+
+    stat = _file_stat(name)
+
+    if stat['size'] != entry.get('size', None):
+        return False
+
+    if stat['mtime_ns'] == entry.get('mtime_ns', None):
+        return True
+
+    return _file_hash(name) == entry.get('sha256', None)
+
+def recorded_inputs(build_dir, job_name):
+    """
+    Get every file the last pass read, from the `.fls` file written when
+    LaTeX is run with `-recorder`. Files the document wrote itself, like its
+    `.aux`, are left out.
+
+    Returns:
+
+       list or None: The absolute path of each input, `None` if there's no
+       `.fls` file.
+    """
+
+    fls_file = Path(build_dir, job_name + ".fls")
+
+    if not fls_file.exists():
+        return None
+
+    pwd = Path(build_dir)
+    inputs = dict()
+    outputs = set()
+
+    for line in fls_file.read_text(encoding = 'utf-8',
+                                   errors = 'replace').splitlines():
+
+        (kind, _, name) = line.partition(" ")
+
+        if kind == "PWD":
+            pwd = Path(name)
+        elif kind == "INPUT":
+            inputs[str(Path(pwd, name).resolve())] = None
+        elif kind == "OUTPUT":
+            outputs.add(str(Path(pwd, name).resolve()))
+
+    return [name for name in inputs if name not in outputs]
+
+def write_build_record(build_args, build_dir, job_name):
+    """
+    Record the command line, and the size, modification time and hash of
+    every file read by a successful compile, for `build_is_current` to check
+    next time.
+
+    Hashes from the previous record are reused for files whose size and
+    modification time haven't changed, so only new or edited files are read.
+    """
+
+    inputs = recorded_inputs(build_dir, job_name)
+
+    if inputs == None:
+        return
+
+    record_file = Path(build_dir, job_name + __build_record_ext__)
+
+    old_record = _load_build_record(record_file)
+    old_inputs = old_record['inputs'] if old_record != None else dict()
+
+    entries = dict()
+
+    for name in inputs:
+
+        if not Path(name).is_file():
+            continue
+
+        entry = _file_stat(name)
+        old_entry = old_inputs.get(name, dict())
+
+        if (old_entry.get('size', None) == entry['size']
+            and old_entry.get('mtime_ns', None) == entry['mtime_ns']
+            and 'sha256' in old_entry):
+            entry['sha256'] = old_entry['sha256']
+        else:
+            entry['sha256'] = _file_hash(name)
+
+        entries[name] = entry
+
+    record = {'build_args': [str(arg) for arg in build_args],
+              'inputs': entries}
+
+    dump_yaml(record, path=record_file)
+
+def build_is_current(build_args, build_dir, job_name, tex_file):
+    """
+    Would compiling the document again give the same PDF as the last time?
+    That's the case if the PDF is still there, the command line is the same,
+    and neither `tex_file` nor anything else the last compile read has
+    changed since then.
+
+    Inputs are compared by size and modification time, and only hashed when
+    those disagree (e.g. a file that was rewritten with the same content).
+    """
+
+    if not Path(build_dir, job_name + ".pdf").exists():
+        return False
+
+    record = _load_build_record(Path(build_dir,
+                                     job_name + __build_record_ext__))
+
+    if (record == None
+        or record.get('build_args') != [str(arg) for arg in build_args]):
+        return False
+
+    inputs = record['inputs']
+
+    # Check the document itself before everything it includes
+    tex_name = str(Path(build_dir, tex_file).resolve())
+    if tex_name not in inputs:
+        return False
+
+    others = [name for name in inputs if name != tex_name]
+
+    for name in [tex_name] + others:
+        if not _input_unchanged(name, inputs[name]):
+            return False
+
+    return True
+
+_file_line_error = re.compile(
+    r"^(?P<file>[^\s:()][^:()]*):(?P<line>\d+): (?P<message>.*)$")
+_bang_error = re.compile(r"^! (?P<message>.*)$")
+_error_line = re.compile(r"^l\.(?P<line>\d+)")
+_warning = re.compile(
+    r"^(?:LaTeX|pdfTeX|LaTeX Font|Package \S+|Class \S+) Warning: "
+    r"(?P<message>.*)$")
+_warning_continued = re.compile(r"^(?:\([^\s()]+\))?\s+")
+_input_line = re.compile(r"on input line (?P<line>\d+)")
+_file_open = re.compile(r"\((?P<file>(?:\.{0,2}/)?[^\s(){}]+\.\w+)")
+
+def parse_latex_log(log_text):
+    """
+    Pull the errors and warnings out of a LaTeX `.log` file.
+
+    The file each message comes from is taken from the `file:line:` prefix
+    of errors (with `-file-line-error`), or else from tracking which files
+    LaTeX has opened, which is only a best guess since TeX wraps long lines.
+
+    Returns:
+
+       dict: With `'errors'` and `'warnings'` lists, where each entry has a
+       `'file'`, `'line'` (either may be `None`) and `'message'`.
+    """
+
+    errors = list()
+    warnings = list()
+
+    # One entry per open paren, the file name if it opened a file
+    open_files = list()
+
+    lines = log_text.splitlines()
+
+    for (index, text) in enumerate(lines):
+
+        current_file = next((name for name in reversed(open_files)
+                             if name != None), None)
+
+        match = _file_line_error.match(text)
+        if match != None:
+            errors.append({'file': match['file'],
+                           'line': int(match['line']),
+                           'message': match['message'].strip()})
+            continue
+
+        match = _bang_error.match(text)
+        if match != None:
+            line = None
+            for context in lines[index + 1:index + 10]:
+                line_match = _error_line.match(context)
+                if line_match != None:
+                    line = int(line_match['line'])
+                    break
+            errors.append({'file': current_file,
+                           'line': line,
+                           'message': match['message'].strip()})
+            continue
+
+        match = _warning.match(text)
+        if match != None:
+            # Warnings continue on lines that are indented or start with
+            # `(<package>)`, up to the next blank one
+            message = [match['message'].strip()]
+            for more in lines[index + 1:]:
+                continued = _warning_continued.match(more)
+                if more.strip() == "" or continued == None:
+                    break
+                message.append(more[continued.end():].strip())
+            message = " ".join(message)
+            line_match = _input_line.search(message)
+            warnings.append({
+                'file': current_file,
+                'line': int(line_match['line']) if line_match else None,
+                'message': message})
+            continue
+
+        position = 0
+        while position < len(text):
+            char = text[position]
+            if char == "(":
+                match = _file_open.match(text, position)
+                if match != None:
+                    open_files.append(match['file'])
+                    position = match.end()
+                    continue
+                open_files.append(None)
+            elif char == ")" and len(open_files) > 0:
+                open_files.pop()
+            position += 1
+
+    return {'errors': errors, 'warnings': warnings}
@@ -1,7 +1,9 @@
 import attr
+import time
 
 from .buildable import Buildable
 from exam_gen.util.user_setup import UserSetup
+from exam_gen.util.file_ops import working_dir
 
 import exam_gen.util.logging as logging
 
@@ -15,5 +17,12 @@ class HasUserSetup(Buildable, UserSetup):
 
         log = super().setup_build(build_info)
 
-        log['user_setup'] = self._run_user_setup()
+        start = time.perf_counter()
+
+        # User code is allowed to assume it's run in the build directory.
+        with working_dir(build_info.build_path):
+            log['user_setup'] = self._run_user_setup()
+
+        log['user_setup_seconds'] = time.perf_counter() - start
+
         return log
@@ -1,10 +1,17 @@
+import io
 import attr
+import pickle
+import shutil
+import hashlib
 import textwrap
+import threading
 import functools
+import itertools
 
 from pprint import *
 from pathlib import *
 from jinja2 import *
+from jinja2.utils import LRUCache
 from copy import *
 
 from .has_settings import HasSettings
@@ -14,6 +21,10 @@ from .document import Document
 from exam_gen.util.versioned_option import add_versioned_option
 from exam_gen.util.file_ops import dump_str, dump_yaml
 from exam_gen.util.stable_hash import stable_hash
+from exam_gen.util.template_manager import get_template_manager, _freeze_opts
+from exam_gen.util.layered_context import LayeredContext
+from exam_gen.util.config.group import change_count
+from exam_gen.util.config.value import ConfigValue
 
 import exam_gen.util.logging as logging
 
@@ -21,6 +32,9 @@ log = logging.new(__name__, level="DEBUG")
 
 __all__ = ["Templated",
            "TemplateSpec",
+           "RenderPlan",
+           "render_plan",
+           "template_dependencies",
            "build_template_spec",
            "add_template_var"]
 
@@ -33,6 +47,12 @@ class Templated(HasSettings, HasDirPath, Document):
 
     _template_manager = attr.ib(default=None, kw_only=True)
 
+    _template_settings = attr.ib(default=None, init=False, repr=False)
+    """
+    This document's resolved `TemplateSettings`, along with the
+    `change_count` of the template settings when they were resolved.
+    """
+
     settings.new_group('template',doc=
                        """
                        Settings for how templates should be applied by this
@@ -123,6 +143,47 @@ class Templated(HasSettings, HasDirPath, Document):
         for templates.
         """)
 
+    settings.template.new_value(
+        'stream_output',
+        default = False,
+        doc =
+        """
+        When building this as a standalone document, render the top level
+        template straight into the output file instead of building the whole
+        document as a string first. Rendered text of sub-templates is also
+        dropped once their parent has been rendered, unless a
+        `post_render_hook` needs it.
+
+        Useful for exams with large generated figures or tables.
+        """)
+
+    settings.template.new_value(
+        'cache_renders',
+        default = True,
+        doc =
+        """
+        When building this as a standalone document, reuse the rendered text
+        of any sub-template whose inputs are the same as they were for an
+        earlier student, e.g. static question text.
+
+        Sub-templates are always rendered if they include templates by a
+        computed name, use jinja's `random` filter, call a function or
+        method from their context (e.g. `rng.choice(...)`), or whose inputs
+        include functions or values that can't be pickled. Turn this off if
+        your templates get varying output some other way, e.g. from
+        properties with side effects.
+        """)
+
+    settings.template.new_value(
+        'persist_fragments',
+        default = False,
+        doc =
+        """
+        When building this as a standalone document, keep the output of
+        `{% cache %}` blocks in the build directory so later runs can reuse
+        it. Only safe if each block's keys cover everything it depends on.
+        """)
+
     settings.template.new_value(
         'jinja_opts',
         default = dict(),
@@ -176,12 +237,62 @@ class Templated(HasSettings, HasDirPath, Document):
 
         return spec
 
-    def __get_search_path(self):
+    def __get_template_settings(self):
+        """
+        Get the search path and jinja options for this document. These only
+        depend on the class, `root_dir`, and settings of this document and its
+        parents, so they're resolved once and shared by every document with
+        the same lineage, until the template settings are changed.
+        """
 
-        path = list()
+        version = change_count(['settings', 'template'])
 
+        if (self._template_settings != None
+            and self._template_settings[0] == version):
+            return self._template_settings[1]
+
+        parent = None
         if isinstance(self._parent_doc, Templated):
-            path = self._parent_doc.__get_search_path()
+            parent = self._parent_doc.__get_template_settings()
+
+        # Documents whose template settings were changed at runtime (or have a
+        # parent like that) get their own copy.
+        if ((parent != None and parent.ident == None)
+            or _has_instance_values(self.settings.template)):
+
+            settings = self.__resolve_template_settings(parent, None)
+
+        else:
+
+            key = (None if parent == None else parent.ident,
+                   type(self),
+                   str(self.root_dir))
+
+            with _template_settings_lock:
+
+                if _template_settings_cache['version'] != version:
+                    _template_settings_cache['entries'].clear()
+                    _template_settings_cache['version'] = version
+
+                settings = _template_settings_cache['entries'].get(key)
+
+                if settings == None:
+                    settings = self.__resolve_template_settings(
+                        parent, next(_template_settings_ids))
+                    _template_settings_cache['entries'][key] = settings
+
+        self._template_settings = (version, settings)
+
+        return settings
+
+    def __resolve_template_settings(self, parent, ident):
+
+        path = list()
+        opts = dict()
+
+        if parent != None:
+            path = list(parent.search_path)
+            opts = deepcopy(parent.jinja_opts)
 
         add_root = lambda p : Path(self.root_dir, p)
 
@@ -192,14 +303,11 @@ class Templated(HasSettings, HasDirPath, Document):
 
         path += list(map(add_root,string_paths))
 
-        return path
-
-    def __get_jinja_opts(self):
-        opts = dict()
-        if isinstance(self._parent_doc, Templated):
-            opts = deepcopy(self._parent_doc.__get_jinja_opts())
         opts |= self.settings.template.jinja_opts
-        return opts
+
+        return TemplateSettings(ident = ident,
+                                search_path = tuple(path),
+                                jinja_opts = opts)
 
     def template_spec(self, out_file=None, build_info=None):
 
@@ -207,147 +315,270 @@ class Templated(HasSettings, HasDirPath, Document):
 
         spec = self.build_template_spec(build_info)
 
-        spec.path += self.__get_search_path()
+        template_settings = self.__get_template_settings()
+
+        spec.path += template_settings.search_path
+
+        spec.jinja_opts = __jinja_default_opts__ | template_settings.jinja_opts
 
-        spec.jinja_opts = __jinja_default_opts__ | self.__get_jinja_opts()
+        # extensions are added to the defaults instead of replacing them
+        if 'extensions' in template_settings.jinja_opts:
+            spec.jinja_opts['extensions'] = (
+                __jinja_default_opts__['extensions'] +
+                [ext for ext in template_settings.jinja_opts['extensions']
+                 if ext not in __jinja_default_opts__['extensions']])
         spec.format_dir = self.settings.template.format_dir
         spec.format_ext = self.settings.template.format_ext
 
         return spec
 
+@attr.s(frozen=True)
+class TemplateSettings():
+    """
+    The resolved template search path and jinja options for a document.
+    """
+
+    ident = attr.ib()
+    """
+    Unique id for this entry in the shared cache, `None` if it isn't shared.
+    """
+
+    search_path = attr.ib()
+    jinja_opts = attr.ib()
+
+_template_settings_cache = {'version': None, 'entries': dict()}
+"""
+Shared `TemplateSettings` keyed by the parent's entry id, document class, and
+root directory. Cleared whenever template settings are assigned to.
+"""
+
+_template_settings_lock = threading.Lock()
+
+_template_settings_ids = itertools.count()
+
+def _has_instance_values(config_group):
+    """
+    Were any of the values in this group set on an instance, rather than
+    inherited from class definitions?
+    """
+    return any(isinstance(m, ConfigValue) and m.instance_context
+               for m in config_group.members.values())
+
 def build_template_spec(name,
                         spec,
                         ctxt=None,
                         out_file=None,
-                        debug_dir=None):
+                        debug_dir=None,
+                        manager=None,
+                        plan=None,
+                        stream=False,
+                        keep_text=True,
+                        debug_level='full',
+                        cache_renders=False):
+    """
+    Render a `TemplateSpec` and all its subtemplates.
 
-    if ctxt == None: ctxt = dict()
+    Parameters:
 
-    template_file = None
-    template_str  = None
+       name: Name of this node, used for debug files and the names of
+          subtemplate nodes.
 
+       spec: The `TemplateSpec` to render.
 
-    # Figure out whether our template is a file or string.
-    if spec.template == None:
-        raise RuntimeError("Template spec has no template given")
-    elif isinstance(spec.template, Path):
-        template_file =  spec.template
-    else:
-        template_str = textwrap.dedent(spec.template).strip()
+       ctxt: Context inherited from the parent node, either a dict or a
+          `LayeredContext`.
 
-    # build out jinja template env
-    environment = Environment(**spec.jinja_opts)
-    template = None
+       out_file: File to write the result to, defaults to `spec.out_file`.
 
-    # Retrieve the file from our loader if needed.
-    file_name = None
-    if template_str == None:
-
-        # get our final path, after including all the format specs
-        dir_path = list()
-        for entry in spec.path:
-            dir_path.append(entry)
-            if spec.format_dir != None:
-                dir_path.append(str(Path(entry, spec.format_dir)))
-
-        # build our loader
-        loader_list = [FileSystemLoader(dir_path)]
-        if spec.format_dir != None:
-            loader_list.append(PackageLoader(
-                "exam_gen",
-                "templates/{}".format(spec.format_dir)
-            ))
-        loader_list.append(PackageLoader("exam_gen","templates"))
-        loader = ChoiceLoader(loader_list)
-
-        # try getting our source w/ the format ext
-        if spec.format_ext != None:
-            try:
-                file_n = "{}.{}".format(str(template_file),
-                                         spec.format_ext)
-                (template_str,_,_) = loader.get_source(environment, file_n)
-                template = loader.load(environment, file_n)
-                template_file = file_n
-            except TemplateNotFound:
-                pass
-
-        # and just doing it normally
-        if template_str == None:
-            (template_str,_,_) = loader.get_source(environment, str(template_file))
-            template = loader.load(environment, str(template_file))
-
-    # Otherwise just get it from the string.
-    else:
-        template = environment.from_string(template_str)
+       debug_dir: Directory for debug output, none is written if not given.
+
+       manager: The `TemplateManager` to get templates from.
+
+       plan: The `RenderPlan` used to resolve nodes.
+
+       stream: Render straight into `out_file` without keeping the result
+          in memory. The returned dict won't have a `text` entry.
+
+       keep_text: When false, the `text` of each subtemplate is dropped from
+          the result once this node (and its `post_render_hook`) is done
+          with it.
+
+       debug_level: Which debug files to write into `debug_dir`, one of:
+
+          - 'off': Nothing.
+          - 'on-error': Only the template and contexts of a node whose
+            render fails.
+          - 'summary': The template and result of this node, and
+            'on-error' for all of its subtemplates.
+          - 'full': The template, initial and final contexts, and result of
+            every node.
+
+       cache_renders: Reuse the results of subtemplates whose inputs are the
+          same as an earlier render with the same `plan`, see
+          `RenderPlan.render`.
+    """
+
+    # Only the top level call gets a plain dict
+    is_root = not isinstance(ctxt, LayeredContext)
+
+    if is_root:
+        ctxt = LayeredContext(dict() if ctxt == None else ctxt)
+
+    # Everything about this node that doesn't depend on the student is
+    # resolved once, see `RenderPlan`.
+    if plan == None:
+        plan = RenderPlan(manager = manager)
 
     # Get the path we're outputting a file to
     out_path = out_file if out_file else spec.out_file
     spec.out_file = str(out_path)
 
-    # Get the extension we use for debug output
-    if out_path != None:
-        out_ext = "".join(Path(out_path).suffixes)
-    elif spec.format_ext != None:
-        # log.warning(out_path)
-        out_ext = "." + spec.format_ext
-    else:
-        out_ext = ""
+    node = plan.resolve(name, spec, out_path)
 
-    # TODO: Some settings that should be moved elsewhere
-    tmpl_pat = 'template-{}.jn2{}'
-    init_context_pat  = 'initial-context-{}.yaml'
-    final_context_pat  = 'final-context-{}.yaml'
-    result_pat   = 'result-{}{}'
+    (debug_level, sub_debug_level) = _debug_levels(debug_dir, debug_level)
 
     # write out the base template
-    if debug_dir != None:
-        dump_str(template_str,path=(debug_dir,tmpl_pat.format(name,out_ext)))
+    if debug_level in ['summary', 'full']:
+        dump_str(node.source,path=(debug_dir,node.template_debug_file))
 
-    # generate new context
-    initial_ctxt = deepcopy(ctxt | spec.context)
+    # generate new context, sharing everything from our parent's
+    initial_ctxt = ctxt.layer(spec.context)
 
     # and print it out
-    if debug_dir != None:
-        dump_yaml(initial_ctxt,path=(debug_dir,init_context_pat.format(name)))
+    if debug_level == 'full':
+        dump_yaml(initial_ctxt.flatten(),
+                  path=(debug_dir,node.initial_context_file))
 
-    final_ctxt = deepcopy(initial_ctxt)
+    # subtemplate results go in their own layer
+    final_ctxt = initial_ctxt.layer()
 
     # run through all subtemplates and build them too
     for (subname, subtemp) in spec.subtemplates.items():
 
-        # log.warning((name, subname, type(subtemp)))
-
         final_ctxt[subname] = build_subtemplates(
-            spec, name, subtemp, subname, initial_ctxt, debug_dir)
+            spec, name, subtemp, subname, initial_ctxt, debug_dir,
+            plan = plan, keep_text = keep_text,
+            debug_level = sub_debug_level,
+            cache_renders = cache_renders)
 
 
     # dump the context post subtemplating
-    if debug_dir != None:
-        dump_yaml(final_ctxt, path=(debug_dir,final_context_pat.format(name)))
+    if debug_level == 'full':
+        dump_yaml(final_ctxt.flatten(),
+                  path=(debug_dir,node.final_context_file))
 
-    # actually render the template
-    result = template.render(**final_ctxt)
+    return_val = final_ctxt.changes(ctxt)
 
-    # dump the result of this template as a debug entry
-    if debug_dir != None:
-        dump_str(result, path=(debug_dir,result_pat.format(name, out_ext)))
+    try:
 
-    return_val = {k:v for (k,v) in final_ctxt.items() if k not in ctxt or
-                  ctxt[k] != final_ctxt[k]}
-    return_val['text'] = result
+        # the top level document is always different for each student so
+        # there's no point caching it
+        return_val |= _render_node(
+            plan, node, final_ctxt, out_path, debug_dir,
+            debug_level = debug_level,
+            # Hooks get to look at our text, so we can only stream without one
+            stream = stream and spec.post_render_hook == None,
+            use_cache = cache_renders and not is_root)
 
-    # print the out_put
-    if out_path != None:
-        dump_str(result, path=out_path)
-        return_val['file'] = out_path
+        if spec.post_render_hook != None:
+            spec.post_render_hook(return_val)
+
+    except Exception as err:
+
+        # Only this node failed, so this is the one whose files we want
+        if debug_level in ['on-error', 'summary']:
+            dump_str(node.source,path=(debug_dir,node.template_debug_file))
+            dump_yaml(initial_ctxt.flatten(),
+                      path=(debug_dir,node.initial_context_file))
+            dump_yaml(final_ctxt.flatten(),
+                      path=(debug_dir,node.final_context_file))
+
+        raise err
 
-    if spec.post_render_hook != None:
-        spec.post_render_hook(return_val)
+    if not keep_text:
+        for subname in spec.subtemplates.keys():
+            _drop_text(return_val.get(subname))
 
     return return_val
 
+def _debug_levels(debug_dir, debug_level):
+    """
+    Check a `debug_level`, returning the levels for a node and its
+    subtemplates.
+    """
+
+    if debug_dir == None:
+        return ('off', 'off')
+
+    if debug_level not in __debug_levels__:
+        raise RuntimeError("Unknown debug level '{}', should be one of {}"
+                           .format(debug_level, __debug_levels__))
+
+    # Children of a summarized document only write files if they fail
+    if debug_level == 'summary':
+        return (debug_level, 'on-error')
+
+    return (debug_level, debug_level)
 
-def build_subtemplates(spec, name, sub, subname, ctxt, debug):
+def _render_node(plan, node, ctxt, out_path, debug_dir, debug_level='off',
+                 stream=False, use_cache=False):
+    """
+    Render a resolved node into `out_path` (if any), either streaming it
+    straight into the file or going through `RenderPlan.render`.
+
+    Returns:
+
+       dict: With the `file` written and, unless streaming, the `text`.
+    """
+
+    result = dict()
+
+    if stream and out_path != None:
+
+        # render the template straight into the output file
+        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+        node.template.stream(**ctxt).dump(str(out_path))
+        result['file'] = out_path
+
+        if debug_level in ['summary', 'full']:
+            shutil.copyfile(out_path, Path(debug_dir, node.result_file))
+
+        return result
+
+    text = plan.render(node, ctxt, use_cache = use_cache)
+
+    # dump the result of this template as a debug entry
+    if debug_level in ['summary', 'full']:
+        dump_str(text, path=(debug_dir,node.result_file))
+
+    result['text'] = text
+
+    # print the out_put
+    if out_path != None:
+        dump_str(text, path=out_path)
+        result['file'] = out_path
+
+    return result
+
+def _drop_text(sub_result):
+    """
+    Remove the rendered text from the result of `build_subtemplates`, which
+    is either a single result or a list/dict of them.
+    """
+    if isinstance(sub_result, list):
+        for entry in sub_result:
+            _drop_text(entry)
+    elif isinstance(sub_result, dict):
+        if 'text' in sub_result:
+            del sub_result['text']
+        else:
+            for entry in sub_result.values():
+                _drop_text(entry)
+
+
+def build_subtemplates(spec, name, sub, subname, ctxt, debug, plan=None,
+                       keep_text=True, debug_level='full',
+                       cache_renders=False):
     """
     Properly handle lists and dicts of subtemplates, allowing for better
     management of subquestions. Esp. not requiring templates to know what
@@ -384,7 +615,11 @@ def build_subtemplates(spec, name, sub, subname, ctxt, debug):
         return build_template_spec(name=new_name,
                                    spec=sub,
                                    ctxt=ctxt,
-                                   debug_dir=debug)
+                                   debug_dir=debug,
+                                   plan=plan,
+                                   keep_text=keep_text,
+                                   debug_level=debug_level,
+                                   cache_renders=cache_renders)
 
     for (keyname, subspec) in entries:
         # log.warning((keyname, subspec))
@@ -394,7 +629,11 @@ def build_subtemplates(spec, name, sub, subname, ctxt, debug):
             sub = subspec,
             subname = "{}[{}]".format(subname, keyname),
             ctxt = ctxt,
-            debug = debug)
+            debug = debug,
+            plan = plan,
+            keep_text = keep_text,
+            debug_level = debug_level,
+            cache_renders = cache_renders)
     return output
 
 @attr.s
@@ -418,6 +657,336 @@ class TemplateSpec():
 
     post_render_hook = attr.ib(default=None, kw_only=True)
 
+def template_dependencies(spec, manager=None):
+    """
+    Find every template file (with its sha256) used to render a
+    `TemplateSpec` tree, including files reached through `{% include %}`,
+    `{% extends %}` and `{% import %}`. Templates are resolved exactly as
+    `build_template_spec` would, using the spec's search path, format
+    directory and format extension. The spec isn't modified.
+
+    To get the dependencies of a document use
+    `template_dependencies(doc.template_spec(build_info=...))`.
+
+    Returns `None` if any template in the tree includes a template whose name
+    is only known when rendering, see `TemplateManager.dependencies`.
+    """
+
+    if manager == None:
+        manager = get_template_manager()
+
+    deps = dict()
+    tracked = True
+
+    def walk(spec, path, format_dir, format_ext):
+
+        nonlocal tracked
+
+        if spec.template == None:
+            raise RuntimeError("Template spec has no template given")
+
+        elif isinstance(spec.template, Path):
+            (template, source, _) = manager.get_template(
+                spec.template, path, format_dir, format_ext, spec.jinja_opts)
+
+        else:
+            source = textwrap.dedent(spec.template).strip()
+            template = manager.from_string(
+                source, path, format_dir, spec.jinja_opts)
+
+        node_deps = manager.dependencies(template, source)
+
+        if node_deps == None:
+            tracked = False
+        else:
+            deps.update(node_deps)
+
+        for sub in spec.subtemplates.values():
+            walk_subs(sub, path, format_dir, format_ext)
+
+    def walk_subs(sub, path, format_dir, format_ext):
+
+        if isinstance(sub, list):
+            entries = sub
+        elif isinstance(sub, dict):
+            entries = sub.values()
+        else:
+            walk(sub,
+                 path + sub.path,
+                 sub.format_dir if sub.format_dir != None else format_dir,
+                 sub.format_ext if sub.format_ext != None else format_ext)
+            return
+
+        for entry in entries:
+            walk_subs(entry, path, format_dir, format_ext)
+
+    walk(spec, spec.path, spec.format_dir, spec.format_ext)
+
+    return deps if tracked else None
+
+@attr.s(frozen=True)
+class PlanNode():
+    """
+    A single node of a `RenderPlan`: the compiled template for one spec node
+    and the names of the files it writes.
+    """
+
+    template = attr.ib()
+    source = attr.ib()
+    template_name = attr.ib()
+
+    dependencies = attr.ib()
+    """
+    Every template file this node reads and its hash, or `None` if they
+    can't be tracked, see `TemplateManager.dependencies`.
+    """
+
+    variables = attr.ib()
+    """
+    Sorted tuple of the context variables the template reads, `None` if they
+    can't be determined. See `TemplateManager.referenced_variables`.
+    """
+
+    out_ext = attr.ib()
+
+    template_debug_file = attr.ib()
+    initial_context_file = attr.ib()
+    final_context_file = attr.ib()
+    result_file = attr.ib()
+
+@attr.s
+class RenderPlan():
+    """
+    The parts of rendering a document's template tree that are the same for
+    every student: which template each node uses, its compiled form, and the
+    names of its output and debug files.
+
+    Nodes are resolved the first time they're rendered and reused for every
+    later student, so after that each student only has to bind contexts and
+    render. Use `render_plan` to get the shared plan for an exam class.
+    """
+
+    manager = attr.ib(default=None, kw_only=True)
+
+    max_nodes = attr.ib(default=5000, kw_only=True)
+    """
+    Bound on the number of resolved nodes, templates given as strings can be
+    generated per-student so there's no fixed number of them.
+    """
+
+    nodes = attr.ib(init=False)
+
+    @nodes.default
+    def _init_nodes(self):
+        return LRUCache(self.max_nodes)
+
+    max_renders = attr.ib(default=10000, kw_only=True)
+    """
+    Bound on the number of rendered results kept for reuse by `render`.
+    """
+
+    renders = attr.ib(init=False)
+
+    @renders.default
+    def _init_renders(self):
+        return LRUCache(self.max_renders)
+
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+    uncacheable = attr.ib(default=0, init=False)
+
+    _lock = attr.ib(factory=threading.RLock, init=False)
+
+    def resolve(self, name, spec, out_path=None):
+        """
+        Get the `PlanNode` for the spec node `name`, looking up and compiling
+        its template if this is the first time we've seen it.
+
+        Multiple choice questions shuffle their choices per student, so the
+        template itself is part of the key, not just the node's name. So are
+        the search path and jinja options, which pick the environment the
+        template is compiled in.
+        """
+
+        key = (name,
+               spec.template,
+               tuple(map(str, spec.path)),
+               spec.format_dir,
+               spec.format_ext,
+               _freeze_opts(spec.jinja_opts),
+               out_path == None)
+
+        node = self.nodes.get(key)
+
+        if node == None:
+            with self._lock:
+                node = self.nodes.get(key)
+                if node == None:
+                    node = self._build_node(name, spec, out_path)
+                    self.nodes[key] = node
+
+        return node
+
+    def render(self, node, context, use_cache=True):
+        """
+        Render a node's template with `context`. Unless `use_cache` is false,
+        the result is reused for any later render of the same template where
+        all the variables the template reads have the same values, e.g. a
+        question body that doesn't depend on the student.
+
+        Templates that include a template by a computed name, that could
+        render differently for the same variables (see
+        `TemplateManager.referenced_variables`), or whose variables hold
+        anything callable or unpicklable, are always rendered.
+        """
+
+        key = None
+
+        if use_cache:
+            key = self._render_key(node, context)
+
+        if key == None:
+            if use_cache:
+                with self._lock:
+                    self.uncacheable += 1
+            return node.template.render(**context)
+
+        result = self.renders.get(key)
+
+        if result != None:
+            with self._lock:
+                self.hits += 1
+            return result
+
+        result = node.template.render(**context)
+
+        with self._lock:
+            self.misses += 1
+            self.renders[key] = result
+
+        return result
+
+    def _render_key(self, node, context):
+
+        if node.variables == None:
+            return None
+
+        values = [(name, context[name])
+                  for name in node.variables if name in context]
+
+        data = io.BytesIO()
+
+        try:
+            _RenderKeyPickler(data, protocol = 4).dump(values)
+        except Exception:
+            return None
+
+        return (node.template, hashlib.sha1(data.getvalue()).hexdigest())
+
+    def render_stats(self):
+        """
+        Counts of cached renders so far.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'uncacheable': self.uncacheable,
+                    'hit_rate': self.hits / total if total > 0 else None}
+
+    def dependencies(self):
+        """
+        All the template files used by the nodes resolved so far, with their
+        hashes. Once a student has been rendered this covers every template
+        the exam class uses in this format. `None` if some node's
+        dependencies can't be tracked.
+        """
+        deps = dict()
+        with self._lock:
+            for node in self.nodes.values():
+                if node.dependencies == None:
+                    return None
+                deps |= node.dependencies
+        return deps
+
+    def _build_node(self, name, spec, out_path):
+
+        manager = self.manager
+        if manager == None:
+            manager = get_template_manager()
+
+        # Figure out whether our template is a file or string.
+        if spec.template == None:
+            raise RuntimeError("Template spec has no template given")
+
+        elif isinstance(spec.template, Path):
+            (template, source, template_name) = manager.get_template(
+                spec.template,
+                spec.path,
+                spec.format_dir,
+                spec.format_ext,
+                spec.jinja_opts)
+
+        else:
+            source = textwrap.dedent(spec.template).strip()
+            template_name = None
+            template = manager.from_string(source,
+                                           spec.path,
+                                           spec.format_dir,
+                                           spec.jinja_opts)
+
+        variables = manager.referenced_variables(template, source)
+
+        # Get the extension we use for debug output
+        if out_path != None:
+            out_ext = "".join(Path(out_path).suffixes)
+        elif spec.format_ext != None:
+            out_ext = "." + spec.format_ext
+        else:
+            out_ext = ""
+
+        return PlanNode(
+            template = template,
+            source = source,
+            template_name = template_name,
+            dependencies = manager.dependencies(template, source),
+            variables = (None if variables == None
+                         else tuple(sorted(variables))),
+            out_ext = out_ext,
+            template_debug_file = 'template-{}.jn2{}'.format(name, out_ext),
+            initial_context_file = 'initial-context-{}.yaml'.format(name),
+            final_context_file = 'final-context-{}.yaml'.format(name),
+            result_file = 'result-{}{}'.format(name, out_ext))
+
+class _RenderKeyPickler(pickle.Pickler):
+    """
+    Pickles the inputs of a render for `RenderPlan._render_key`. Anything
+    callable is refused, since we can't tell what calling it returns.
+    """
+
+    def reducer_override(self, obj):
+        if callable(obj):
+            raise pickle.PicklingError(
+                "Can't cache renders that use {!r}".format(obj))
+        return NotImplemented
+
+_render_plans = dict()
+"""
+Per-process render plans, keyed by exam class and format. See `render_plan`.
+"""
+
+_render_plan_lock = threading.Lock()
+
+def render_plan(doc_cls, exam_format=None):
+    """
+    Get the shared `RenderPlan` for a document class and exam format.
+    """
+    key = (doc_cls, exam_format)
+    with _render_plan_lock:
+        if key not in _render_plans:
+            _render_plans[key] = RenderPlan()
+        return _render_plans[key]
+
 def template_spec_from_var(var, versions=[], empty_okay=False):
     """
     Create a TemplateSpec from a template var (a `VersionedOpts` with the
@@ -455,6 +1024,11 @@ def template_spec_from_var(var, versions=[], empty_okay=False):
 
 
 
+__debug_levels__ = ['off', 'on-error', 'summary', 'full']
+"""
+The valid values for the `debug_level` of `build_template_spec`.
+"""
+
 __jinja_default_opts__ = dict(
     block_start_string = '{%',
     block_end_string = '%}',
@@ -468,6 +1042,10 @@ __jinja_default_opts__ = dict(
     keep_trailing_newline = False,
     optimized = True,
     autoescape = False, # !! Not Jinja Default
+    extensions = [
+        # Adds `{% cache key, ... %}...{% endcache %}`
+        'exam_gen.util.fragment_cache.FragmentCacheExtension',
+    ],
 )
 
 
@@ -1,5 +1,6 @@
 import inspect
 import textwrap
+import collections
 from copy import *
 from pprint import *
 
@@ -11,6 +12,21 @@ import exam_gen.util.logging as logging
 
 log = logging.new(__name__, level="WARNING")
 
+_change_counts = collections.Counter()
+"""
+Number of times a value has been assigned in any config group with a given
+path, see `change_count`.
+"""
+
+def change_count(path):
+    """
+    Get the number of assignments made to values in config groups at `path`
+    (e.g. `['settings', 'template']`), across every class and instance.
+    Lets callers cache things derived from a group's values and notice when
+    they've been changed at runtime.
+    """
+    return _change_counts[tuple(path)]
+
 @attr.s
 class ConfigGroup():
     """
@@ -163,6 +179,7 @@ class ConfigGroup():
             if isinstance(members[name], ConfigValue):
                 members[name].value = value
                 members[name].ctxt  = self.ctxt
+                _change_counts[tuple(self.path)] += 1
             else:
                 raise AttributeError(
                     "Attribute '%s' is not a settable config value."
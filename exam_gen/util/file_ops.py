@@ -1,5 +1,8 @@
+import os
 import yaml
 import shutil
+import threading
+import contextlib
 import jsonpickle.pickler as json_p
 import jsonpickle.unpickler as json_u
 import collections
@@ -13,7 +16,13 @@ log = logging.new(__name__, level="DEBUG")
 __all__ = ["dump_str",
            "dump_yaml",
            "dump_obj",
-           "delete_folders"]
+           "delete_folders",
+           "working_dir"]
+
+_cwd_lock = threading.RLock()
+"""
+Guards the process-wide working directory, see `working_dir`.
+"""
 
 def _format_path(path):
     if isinstance(path, collections.Iterable):
@@ -38,3 +47,21 @@ def dump_obj(data, *, path):
 def delete_folders(*paths):
     for path in paths:
         shutil.rmtree(path, ignore_errors=True)
+
+@contextlib.contextmanager
+def working_dir(path):
+    """
+    Temporarily change the working directory of the process to `path`.
+
+    The working directory is shared by every thread so this holds a lock for
+    as long as the context is active. Only use it around user code that
+    expects to be run in some directory, everything else should use explicit
+    paths.
+    """
+    with _cwd_lock:
+        pwd = os.getcwd()
+        os.chdir(path)
+        try:
+            yield Path(path)
+        finally:
+            os.chdir(pwd)
@@ -0,0 +1,263 @@
+import os
+import re
+import attr
+import hashlib
+import tempfile
+import threading
+import collections.abc
+
+from pathlib import *
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.utils import LRUCache
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ["FragmentCache",
+           "FragmentCacheExtension",
+           "get_fragment_cache"]
+
+@attr.s
+class FragmentCache():
+    """
+    Rendered `{% cache %}` blocks, shared by every student built in this
+    process and optionally persisted to a directory so later runs can reuse
+    them too.
+
+    Entries are keyed on the block's own source and the values of the keys
+    given in the tag, so editing a block invalidates its entries.
+    """
+
+    max_size = attr.ib(default=1000, kw_only=True)
+    """
+    Max number of rendered blocks kept in memory.
+    """
+
+    cache_dir = attr.ib(default=None, kw_only=True)
+    """
+    Directory where rendered blocks are persisted, `None` to keep them only
+    in memory. See `use_dir`.
+    """
+
+    _entries = attr.ib(init=False)
+    _lock = attr.ib(factory=threading.RLock, init=False)
+
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+
+    @_entries.default
+    def _init_entries(self):
+        return LRUCache(self.max_size)
+
+    def use_dir(self, cache_dir):
+        """
+        Persist rendered blocks to `cache_dir`, or stop persisting them if
+        `cache_dir` is `None`.
+        """
+        with self._lock:
+            if cache_dir != None:
+                cache_dir = str(cache_dir)
+                os.makedirs(cache_dir, exist_ok = True)
+            self.cache_dir = cache_dir
+
+    def get(self, key):
+        """
+        Get the rendered text for `key`, or `None` if it's not cached.
+        """
+
+        with self._lock:
+
+            result = self._entries.get(key)
+
+            if result == None and self.cache_dir != None:
+                cache_file = Path(self.cache_dir, key + ".txt")
+                if cache_file.exists():
+                    result = cache_file.read_text(encoding = 'utf-8')
+                    self._entries[key] = result
+
+            if result == None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            return result
+
+    def set(self, key, value):
+        """
+        Store the rendered text for `key`.
+        """
+
+        with self._lock:
+
+            self._entries[key] = value
+
+            if self.cache_dir != None:
+                _write_atomic(Path(self.cache_dir, key + ".txt"), value)
+
+    def stats(self):
+        """
+        Counts of cache lookups so far.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / total if total > 0 else None}
+
+    def clear(self):
+        """
+        Drop every in-memory entry and reset the counters. Persisted entries
+        are left alone.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+class FragmentCacheExtension(Extension):
+    """
+    Adds a `{% cache key1, key2, ... %}...{% endcache %}` tag to jinja. The
+    body of the tag is rendered once for each distinct set of key values and
+    then reused, across students, from the environment's `fragment_cache`.
+
+    The keys must cover everything the body depends on, any other variable
+    used in the body will have whatever value it had the first time the
+    block was rendered. Blocks whose keys can't be turned into the same
+    cache key in every run (e.g. objects without their own `__repr__`) are
+    rendered every time.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache = get_fragment_cache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        keys = list()
+        while parser.stream.current.type != 'block_end':
+            if len(keys) > 0:
+                parser.stream.expect('comma')
+            keys.append(parser.parse_expression())
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        # Identify the block by its content rather than its location, so
+        # blocks in string templates can't collide and edits invalidate
+        # persisted entries.
+        block_id = hashlib.sha256(
+            bytes(repr(body), 'utf-8')).hexdigest()
+
+        args = [nodes.Const(block_id), nodes.List(keys)]
+
+        return nodes.CallBlock(self.call_method('_cache_support', args),
+                               [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, block_id, keys, caller):
+
+        try:
+            key_data = repr((block_id, _stable_key(keys)))
+        except _UnstableKey as err:
+            log.warning(("Not caching a `{%% cache %%}` block, the key %r "
+                         "changes between runs."), err.args[0])
+            return caller()
+
+        key = hashlib.sha256(bytes(key_data, 'utf-8')).hexdigest()
+
+        cache = self.environment.fragment_cache
+
+        result = cache.get(key)
+
+        if result == None:
+            result = caller()
+            cache.set(key, result)
+
+        return result
+
+class _UnstableKey(Exception):
+    """
+    A `{% cache %}` key whose value can't be turned into a stable key.
+    """
+
+_unstable_repr = re.compile(r" at 0x[0-9a-fA-F]+")
+"""
+Matches the memory address in default object reprs.
+"""
+
+def _stable_key(value):
+    """
+    Turn the value of a `{% cache %}` key into plain data whose `repr` is the
+    same in every process, so persisted entries can be found again.
+
+    Strings, numbers, bytes and `None` are kept, lists, tuples, dicts and
+    sets are normalized recursively, and anything else is identified by its
+    type and `repr`.
+
+    Raises:
+
+       _UnstableKey: If the value's `repr` has a memory address in it.
+    """
+
+    if isinstance(value, (type(None), bool, int, float, str, bytes)):
+        return value
+
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(map(_stable_key, value)))
+
+    if isinstance(value, collections.abc.Mapping):
+        return ('dict', tuple(sorted(
+            (repr(_stable_key(k)), _stable_key(v))
+            for (k, v) in value.items())))
+
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted(repr(_stable_key(v)) for v in value)))
+
+    text = repr(value)
+
+    if _unstable_repr.search(text) != None:
+        raise _UnstableKey(value)
+
+    return ("{}.{}".format(type(value).__module__, type(value).__qualname__),
+            text)
+
+def _write_atomic(path, text):
+    """
+    Write `text` to `path` through a temporary file, so other processes
+    never see a partial entry.
+    """
+
+    (fd, tmp_name) = tempfile.mkstemp(dir = path.parent,
+                                      prefix = ".tmp-",
+                                      suffix = ".txt")
+    try:
+        with os.fdopen(fd, 'w', encoding = 'utf-8') as out_file:
+            out_file.write(text)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+        raise
+
+_fragment_cache = None
+"""
+The cache shared by every environment in this process, see
+`get_fragment_cache`.
+"""
+
+_fragment_cache_lock = threading.Lock()
+
+def get_fragment_cache():
+    """
+    Get the process-wide `FragmentCache`, creating it if needed.
+    """
+    global _fragment_cache
+    with _fragment_cache_lock:
+        if _fragment_cache == None:
+            _fragment_cache = FragmentCache()
+        return _fragment_cache
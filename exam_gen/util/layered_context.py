@@ -0,0 +1,68 @@
+import collections
+
+from types import MappingProxyType
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ["LayeredContext"]
+
+class LayeredContext(collections.ChainMap):
+    """
+    A template context made of a stack of layers, where lookups search from
+    the top layer down and writes only ever go to the top layer.
+
+    Each node of a template tree adds its own layer on top of its parent's
+    context with `layer`, so parents and children share everything below
+    instead of copying it. Every layer below the top is wrapped in a
+    read-only view, so a child can't change its parent's context.
+    """
+
+    def layer(self, values=None):
+        """
+        Create a new context with `values` as its (writable) top layer and
+        all of this context's layers, frozen, below it.
+        """
+
+        values = dict() if values == None else dict(values)
+
+        frozen = [m if isinstance(m, MappingProxyType) else MappingProxyType(m)
+                  for m in self.maps]
+
+        return self.__class__(values, *frozen)
+
+    def new_child(self, m=None):
+        return self.layer(m)
+
+    def changes(self, base):
+        """
+        Get a dict of every key set in the layers this context has on top of
+        `base`, whose value is either new or different from the one in
+        `base`.
+
+        Parameters:
+
+           base: A context this one was derived from with `layer`.
+        """
+
+        own_layers = self.maps[:len(self.maps) - len(base.maps)]
+
+        changed = dict()
+
+        for layer in own_layers:
+            for key in layer.keys():
+                if key in changed:
+                    continue
+                value = self[key]
+                if key not in base or base[key] != value:
+                    changed[key] = value
+
+        return changed
+
+    def flatten(self):
+        """
+        A plain dict with the current value of every key, e.g. for writing
+        out as yaml.
+        """
+        return dict(self)
@@ -0,0 +1,527 @@
+import os
+import attr
+import hashlib
+import tempfile
+import threading
+import importlib.resources
+
+from pathlib import *
+from jinja2 import *
+from jinja2 import meta
+from jinja2 import nodes
+from jinja2.utils import LRUCache
+from jinja2.loaders import split_template_path
+from jinja2.bccache import FileSystemBytecodeCache
+
+import exam_gen.util.logging as logging
+
+log = logging.new(__name__, level="WARNING")
+
+__all__ = ["TemplateManager",
+           "AtomicBytecodeCache",
+           "BundledLoader",
+           "bundled_templates",
+           "get_template_manager"]
+
+class AtomicBytecodeCache(FileSystemBytecodeCache):
+    """
+    A `FileSystemBytecodeCache` that can be shared by several worker
+    processes. Each entry is written to a temporary file and then moved into
+    place, so other processes either see the complete old entry, the complete
+    new one, or nothing.
+
+    Entries are keyed on the template's name and file, and are only used if
+    the checksum of the template source matches.
+    """
+
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok = True)
+        final_name = self._get_cache_filename(bucket)
+        (fd, tmp_name) = tempfile.mkstemp(dir = self.directory,
+                                          prefix = ".tmp-",
+                                          suffix = ".cache")
+        try:
+            with os.fdopen(fd, 'wb') as cache_file:
+                bucket.write_bytecode(cache_file)
+            os.replace(tmp_name, final_name)
+        except BaseException:
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
+            raise
+
+class BundledLoader(BaseLoader):
+    """
+    Loads the templates bundled with exam_gen from memory, see
+    `bundled_templates`. Unlike `PackageLoader`, once the bundled templates
+    have been read a lookup never touches the filesystem or package metadata.
+    """
+
+    def __init__(self, prefix=None):
+        """
+        Parameters:
+
+           prefix: Subdirectory of `exam_gen/templates` to look templates up
+              in, e.g. `'latex'`. `None` looks them up from the top.
+        """
+        self.prefix = prefix
+
+    def get_source(self, environment, template):
+
+        name = "/".join(split_template_path(template))
+        if self.prefix != None:
+            name = "{}/{}".format(self.prefix, name)
+
+        entry = bundled_templates().get(name)
+
+        if entry == None:
+            raise TemplateNotFound(template)
+
+        (source, filename) = entry
+
+        # The bundled templates can't change without reinstalling exam_gen
+        return (source, filename, _always_uptodate)
+
+    def list_templates(self):
+        if self.prefix == None:
+            return sorted(bundled_templates().keys())
+        start = self.prefix + "/"
+        return sorted(name[len(start):] for name in bundled_templates()
+                      if name.startswith(start))
+
+_bundled_templates = None
+"""
+Every template bundled with exam_gen, read in by `bundled_templates`.
+"""
+
+_bundled_templates_lock = threading.Lock()
+
+def bundled_templates():
+    """
+    Get every template file in `exam_gen/templates`, reading them all in on
+    the first call.
+
+    Returns:
+
+       dict: Map from template name (e.g. `'latex/question.jn2.tex'`) to a
+       `(source, filename)` tuple.
+    """
+    global _bundled_templates
+    with _bundled_templates_lock:
+        if _bundled_templates == None:
+            templates = dict()
+            _read_bundled(importlib.resources.files("exam_gen") / "templates",
+                          list(), templates)
+            _bundled_templates = templates
+        return _bundled_templates
+
+def _read_bundled(directory, parts, templates):
+    """
+    Recursively add all the template files in `directory` to `templates`.
+    """
+    for entry in directory.iterdir():
+        if entry.name.startswith(("_", ".")):
+            continue
+        if entry.is_dir():
+            _read_bundled(entry, parts + [entry.name], templates)
+        elif ".jn2" in entry.name:
+            templates["/".join(parts + [entry.name])] = (
+                entry.read_text(encoding = 'utf-8'), str(entry))
+
+def _always_uptodate():
+    return True
+
+@attr.s
+class TemplateManager():
+    """
+    Process-wide cache of jinja environments and compiled templates.
+
+    Every node of every student's document tree asks for its template with
+    some search path, format directory, format extension and set of jinja
+    options. Those only depend on the document classes, not the students, so
+    we can create each environment and compile each template just once and
+    reuse them for the rest of the run.
+    """
+
+    string_cache_size = attr.ib(default=1000, kw_only=True)
+    """
+    Max number of templates given as strings to keep compiled. Unlike
+    template files these can in principle be generated per-student, so the
+    cache is bounded.
+    """
+
+    bytecode_cache = attr.ib(default=None, kw_only=True)
+    """
+    Optional jinja `BytecodeCache` used by every environment, see
+    `use_bytecode_dir`.
+    """
+
+    _environments = attr.ib(factory=dict, init=False)
+    _templates = attr.ib(factory=dict, init=False)
+    _strings = attr.ib(init=False)
+    _dependencies = attr.ib(factory=dict, init=False)
+    _variables = attr.ib(factory=dict, init=False)
+    _lock = attr.ib(factory=threading.RLock, init=False)
+
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+
+    @_strings.default
+    def _init_strings(self):
+        return LRUCache(self.string_cache_size)
+
+    def environment(self, search_path, format_dir, jinja_opts):
+        """
+        Get the (shared) environment and loader for a search path, format
+        directory and set of jinja options.
+
+        Returns:
+
+           (key, environment): where `key` identifies the environment in
+           further calls to the manager.
+        """
+
+        key = (tuple(map(str, search_path)),
+               format_dir,
+               _freeze_opts(jinja_opts))
+
+        with self._lock:
+            if key not in self._environments:
+                env = Environment(
+                    loader = _build_loader(search_path, format_dir),
+                    **jinja_opts)
+                if 'bytecode_cache' not in jinja_opts:
+                    env.bytecode_cache = self.bytecode_cache
+                self._environments[key] = env
+            return (key, self._environments[key])
+
+    def use_bytecode_dir(self, cache_dir):
+        """
+        Keep compiled templates in `cache_dir` so later runs (and other
+        worker processes) don't have to recompile them. Does nothing if the
+        manager is already using that directory.
+        """
+
+        cache_dir = str(cache_dir)
+
+        with self._lock:
+
+            if (self.bytecode_cache != None
+                and self.bytecode_cache.directory == cache_dir):
+                return
+
+            os.makedirs(cache_dir, exist_ok = True)
+            self.bytecode_cache = AtomicBytecodeCache(cache_dir)
+
+            for (key, env) in self._environments.items():
+                if 'bytecode_cache' not in dict(key[2]):
+                    env.bytecode_cache = self.bytecode_cache
+
+    def get_template(self, template_file, search_path, format_dir,
+                     format_ext, jinja_opts):
+        """
+        Find and compile a template file, trying `<template_file>.<format_ext>`
+        before `<template_file>` when there's a format extension.
+
+        Returns:
+
+           (template, source, template_name): The compiled template, its
+           source text, and the name it was found under.
+        """
+
+        (env_key, env) = self.environment(search_path, format_dir, jinja_opts)
+        key = (env_key, str(template_file), format_ext)
+
+        with self._lock:
+
+            if key in self._templates:
+                self.hits += 1
+                return self._templates[key]
+
+            self.misses += 1
+
+            names = [str(template_file)]
+            if format_ext != None:
+                names.insert(0, "{}.{}".format(str(template_file), format_ext))
+
+            result = None
+
+            for name in names:
+                try:
+                    (source, _, _) = env.loader.get_source(env, name)
+                except TemplateNotFound:
+                    continue
+                result = (env.loader.load(env, name), source, name)
+                break
+
+            if result == None:
+                raise TemplateNotFound(names[-1])
+
+            self._templates[key] = result
+            return result
+
+    def from_string(self, template_str, search_path, format_dir, jinja_opts):
+        """
+        Compile a template given as a string, templates are looked up in the
+        same environment as file templates so that includes and imports work.
+        """
+
+        (env_key, env) = self.environment(search_path, format_dir, jinja_opts)
+        key = (env_key, template_str)
+
+        with self._lock:
+
+            template = self._strings.get(key)
+
+            if template != None:
+                self.hits += 1
+                return template
+
+            self.misses += 1
+
+            template = env.from_string(template_str)
+            self._strings[key] = template
+            return template
+
+    def dependencies(self, template, source):
+        """
+        Find every template file that rendering `template` can read: its own
+        file, and everything reached through `{% include %}`, `{% extends %}`,
+        and `{% import %}` tags using the same loader.
+
+        Referenced templates that don't exist (e.g. from `ignore missing` or
+        a list of fallbacks) are skipped.
+
+        Parameters:
+
+           template: A compiled template from `get_template` or
+              `from_string`.
+
+           source: The source text of `template`.
+
+        Returns:
+
+           dict or None: Map from each template file to the sha256 of its
+           contents, or `None` if the template references a template whose
+           name is only known when rendering, so we can't know every file it
+           reads.
+        """
+
+        env = template.environment
+
+        key = (id(env), template.name if template.name != None else source)
+
+        with self._lock:
+
+            if key not in self._dependencies:
+
+                deps = dict()
+
+                # templates from strings have a placeholder filename
+                if template.name != None:
+                    deps[template.filename] = _source_hash(source)
+
+                if not self._find_references(env, template.name, source, deps):
+                    deps = None
+
+                self._dependencies[key] = deps
+
+            deps = self._dependencies[key]
+
+            return None if deps == None else dict(deps)
+
+    def referenced_variables(self, template, source):
+        """
+        Get the names of all the context variables that rendering `template`
+        could read, including those read by templates it includes, extends,
+        or imports.
+
+        Returns:
+
+           frozenset or None: The variable names, or `None` if the template
+           references a template whose name is only known when rendering, or
+           if its output could change even when those variables don't, see
+           `_has_side_inputs`.
+        """
+
+        env = template.environment
+
+        key = (id(env), template.name if template.name != None else source)
+
+        with self._lock:
+
+            if key not in self._variables:
+
+                names = set()
+                pending = [source]
+                seen = set()
+
+                while len(pending) > 0:
+
+                    ast = env.parse(pending.pop())
+                    undeclared = meta.find_undeclared_variables(ast)
+
+                    if _has_side_inputs(ast, undeclared, env.globals):
+                        names = None
+                        break
+
+                    names |= undeclared
+
+                    for ref in meta.find_referenced_templates(ast):
+                        if ref == None:
+                            names = None
+                            break
+                        if ref not in seen:
+                            seen.add(ref)
+                            try:
+                                pending.append(
+                                    env.loader.get_source(env, ref)[0])
+                            except TemplateNotFound:
+                                # optional includes that don't exist don't
+                                # read anything
+                                continue
+
+                    if names == None:
+                        break
+
+                self._variables[key] = (None if names == None
+                                        else frozenset(names))
+
+            return self._variables[key]
+
+    def _find_references(self, env, name, source, deps):
+        """
+        Recursively add everything referenced by `source` to `deps`.
+
+        Returns:
+
+           bool: Whether every referenced template could be found statically.
+        """
+
+        tracked = True
+
+        for ref in meta.find_referenced_templates(env.parse(source)):
+
+            if ref == None:
+                log.warning(("Template '%s' includes a template with a name "
+                             "that's computed when rendering, so builds "
+                             "using it are never considered up to date."),
+                            name)
+                tracked = False
+                continue
+
+            try:
+                (ref_source, ref_file, _) = env.loader.get_source(env, ref)
+            except TemplateNotFound:
+                log.debug("Template '%s' references missing template '%s'",
+                          name, ref)
+                continue
+
+            if ref_file == None:
+                ref_file = ref
+
+            if ref_file in deps:
+                continue
+
+            deps[ref_file] = _source_hash(ref_source)
+
+            if not self._find_references(env, ref, ref_source, deps):
+                tracked = False
+
+        return tracked
+
+    def clear(self):
+        """
+        Drop all cached environments and templates.
+        """
+        with self._lock:
+            self._environments.clear()
+            self._templates.clear()
+            self._strings.clear()
+            self._dependencies.clear()
+            self._variables.clear()
+            self.hits = 0
+            self.misses = 0
+
+def _source_hash(source):
+    return hashlib.sha256(bytes(source, 'utf-8')).hexdigest()
+
+def _freeze_opts(jinja_opts):
+    """
+    Turn a dict of jinja options into something we can use as a dict key.
+    """
+    return tuple(sorted((k, repr(v)) for (k, v) in jinja_opts.items()))
+
+def _build_loader(search_path, format_dir):
+    """
+    The loader for a search path, with `<dir>/<format_dir>` searched after
+    each entry of the path, then the templates bundled with exam_gen, first
+    in `<format_dir>` and then from the top.
+    """
+
+    dir_path = list()
+    for entry in search_path:
+        dir_path.append(str(entry))
+        if format_dir != None:
+            dir_path.append(str(Path(entry, format_dir)))
+
+    loader_list = [FileSystemLoader(dir_path)]
+    if format_dir != None:
+        loader_list.append(BundledLoader(format_dir))
+    loader_list.append(BundledLoader())
+
+    return ChoiceLoader(loader_list)
+
+_template_manager = None
+"""
+The manager shared by every build in this process, see
+`get_template_manager`.
+"""
+
+_template_manager_lock = threading.Lock()
+
+def get_template_manager():
+    """
+    Get the process-wide `TemplateManager`, creating it if needed.
+    """
+    global _template_manager
+    with _template_manager_lock:
+        if _template_manager == None:
+            _template_manager = TemplateManager()
+        return _template_manager
+
+_pure_globals = frozenset(['range', 'dict', 'namespace', 'cycler', 'joiner'])
+"""
+Jinja globals whose result only depends on their arguments.
+"""
+
+def _has_side_inputs(ast, undeclared, env_globals):
+    """
+    Can rendering `ast` give a different result for the same values of its
+    `undeclared` variables? That's the case if it uses the `random` filter,
+    or calls anything that comes from the context or from `env_globals`
+    (e.g. `rng.choice(...)` or `lipsum()`), since we can't tell what the
+    call returns or does. Calls to macros the template defines or imports,
+    and to `_pure_globals`, are fine.
+    """
+
+    for node in ast.find_all(nodes.Filter):
+        if node.name == 'random':
+            return True
+
+    for node in ast.find_all(nodes.Call):
+
+        target = node.node
+        while isinstance(target, (nodes.Getattr, nodes.Getitem)):
+            target = target.node
+
+        if not isinstance(target, nodes.Name):
+            return True
+
+        if (target.name in undeclared
+            or (target.name in env_globals
+                and target.name not in _pure_globals)):
+            return True
+
+    return False
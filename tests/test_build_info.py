@@ -0,0 +1,63 @@
+import attr
+import pytest
+
+from pathlib import *
+
+from exam_gen.build.data import BuildInfo
+
+class HeavyClassroom():
+    def __init__(self):
+        self.students = {"s{}".format(i): {'answers': list(range(50))}
+                         for i in range(100)}
+
+def test_where_shares_heavy_objects():
+    classroom = HeavyClassroom()
+
+    class_bld = BuildInfo(root_dir = "/nowhere").where(class_name = "a",
+                                                      classroom = classroom)
+    student_bld = class_bld.where(student_id = "s1",
+                                  student = classroom.students["s1"])
+
+    assert student_bld.classroom is classroom
+    assert student_bld.student is classroom.students["s1"]
+    assert student_bld.class_name == "a"
+    assert class_bld.student_id == None
+
+def test_build_info_is_immutable():
+    build_info = BuildInfo(root_dir = "/nowhere")
+
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        build_info.class_name = "a"
+
+def test_exam_out_file_keeps_dotted_student_ids(tmp_path):
+    build_info = BuildInfo(root_dir = tmp_path,
+                           class_name = "a",
+                           exam_format = "exam",
+                           student_id = "john.smith")
+
+    out_file = build_info.exam_out_file()
+
+    assert out_file.name == "john.smith.pdf"
+    assert out_file.parent == build_info.exam_out_path()
+
+def test_output_build_writes_the_declared_target(tmp_path):
+    from types import SimpleNamespace
+    from exam_gen.property.format.latex import LatexDoc
+
+    build_info = BuildInfo(root_dir = tmp_path,
+                           class_name = "a",
+                           exam_format = "exam",
+                           student_id = "john.smith")
+    build_info = build_info.where(build_path = tmp_path / "build",
+                                  out_path = build_info.exam_out_path())
+
+    Path(build_info.build_path).mkdir()
+    Path(build_info.out_path).mkdir(parents = True)
+    Path(build_info.build_path, "exam.pdf").write_bytes(b"%PDF")
+
+    exam = SimpleNamespace(settings = SimpleNamespace(
+        template = SimpleNamespace(output = "exam")))
+
+    LatexDoc.output_build(exam, build_info, output_file = "john.smith")
+
+    assert build_info.exam_out_file().read_bytes() == b"%PDF"
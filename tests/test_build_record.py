@@ -0,0 +1,136 @@
+import os
+
+from pathlib import *
+
+import yaml
+
+import exam_gen.property.format.latex_build as latex_build
+
+from exam_gen.property.format.latex_build import *
+
+build_args = ["pdflatex", "-recorder", "exam.tex"]
+
+def fake_compile(tmp_path):
+    """
+    Lay out what a compile with `-recorder` leaves behind: the document, a
+    package it read from outside the build directory, its own `.aux`, the
+    `.fls` listing all of them, and the PDF.
+    """
+
+    build_dir = tmp_path / "build"
+    texmf = tmp_path / "texmf-dist" / "tex"
+    build_dir.mkdir()
+    texmf.mkdir(parents = True)
+
+    (build_dir / "exam.tex").write_text("\\documentclass{article}")
+    (build_dir / "exam.aux").write_text("\\relax")
+    (build_dir / "exam.pdf").write_bytes(b"%PDF")
+    (texmf / "article.cls").write_text("class")
+
+    (build_dir / "exam.fls").write_text("\n".join([
+        "PWD {}".format(build_dir),
+        "INPUT exam.tex",
+        "INPUT {}".format(texmf / "article.cls"),
+        "INPUT exam.aux",
+        "OUTPUT exam.aux",
+        "OUTPUT exam.pdf"]) + "\n")
+
+    return (build_dir, texmf / "article.cls")
+
+def count_hashes(monkeypatch):
+    hashed = list()
+    file_hash = latex_build._file_hash
+
+    def counting_hash(path):
+        hashed.append(str(path))
+        return file_hash(path)
+
+    monkeypatch.setattr(latex_build, "_file_hash", counting_hash)
+    return hashed
+
+def test_recorded_inputs_leaves_out_outputs(tmp_path):
+    (build_dir, package) = fake_compile(tmp_path)
+
+    assert recorded_inputs(build_dir, "exam") == [
+        str((build_dir / "exam.tex").resolve()), str(package.resolve())]
+    assert recorded_inputs(build_dir, "missing") == None
+
+def test_unchanged_build_is_current(tmp_path):
+    (build_dir, package) = fake_compile(tmp_path)
+
+    write_build_record(build_args, build_dir, "exam")
+
+    record = yaml.safe_load(
+        (build_dir / "exam.build-record.yaml").read_text())
+    entry = record['inputs'][str(package.resolve())]
+    assert entry['size'] == len("class")
+    assert 'mtime_ns' in entry and 'sha256' in entry
+
+    assert build_is_current(build_args, build_dir, "exam", "exam.tex")
+
+def test_check_does_not_hash_untouched_inputs(tmp_path, monkeypatch):
+    (build_dir, package) = fake_compile(tmp_path)
+    write_build_record(build_args, build_dir, "exam")
+
+    hashed = count_hashes(monkeypatch)
+
+    assert build_is_current(build_args, build_dir, "exam", "exam.tex")
+    assert hashed == list()
+
+def test_rewritten_identical_tex_is_current(tmp_path, monkeypatch):
+    (build_dir, package) = fake_compile(tmp_path)
+    write_build_record(build_args, build_dir, "exam")
+
+    tex_file = build_dir / "exam.tex"
+    stat = tex_file.stat()
+    tex_file.write_text("\\documentclass{article}")
+    os.utime(tex_file, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    hashed = count_hashes(monkeypatch)
+
+    assert build_is_current(build_args, build_dir, "exam", "exam.tex")
+    assert hashed == [str(tex_file.resolve())]
+
+def test_changes_make_build_stale(tmp_path):
+    (build_dir, package) = fake_compile(tmp_path)
+    write_build_record(build_args, build_dir, "exam")
+
+    assert not build_is_current(build_args + ["-draftmode"], build_dir,
+                                "exam", "exam.tex")
+    assert not build_is_current(build_args, build_dir, "exam", "other.tex")
+
+    package.write_text("a new class")
+    assert not build_is_current(build_args, build_dir, "exam", "exam.tex")
+
+def test_same_size_edit_makes_build_stale(tmp_path):
+    (build_dir, package) = fake_compile(tmp_path)
+    write_build_record(build_args, build_dir, "exam")
+
+    tex_file = build_dir / "exam.tex"
+    stat = tex_file.stat()
+    tex_file.write_text("\\documentclass{articlx}")
+    os.utime(tex_file, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert not build_is_current(build_args, build_dir, "exam", "exam.tex")
+
+def test_missing_pdf_or_old_record_is_stale(tmp_path):
+    (build_dir, package) = fake_compile(tmp_path)
+    write_build_record(build_args, build_dir, "exam")
+
+    (build_dir / "exam.pdf").unlink()
+    assert not build_is_current(build_args, build_dir, "exam", "exam.tex")
+
+    (build_dir / "exam.pdf").write_bytes(b"%PDF")
+    tex_name = str((build_dir / "exam.tex").resolve())
+    (build_dir / "exam.build-record.yaml").write_text(yaml.safe_dump(
+        {'build_args': build_args, 'inputs': {tex_name: "0123abcd"}}))
+    assert not build_is_current(build_args, build_dir, "exam", "exam.tex")
+
+def test_record_reuses_hashes_of_untouched_inputs(tmp_path, monkeypatch):
+    (build_dir, package) = fake_compile(tmp_path)
+    write_build_record(build_args, build_dir, "exam")
+
+    hashed = count_hashes(monkeypatch)
+    write_build_record(build_args, build_dir, "exam")
+
+    assert hashed == list()
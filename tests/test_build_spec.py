@@ -0,0 +1,35 @@
+import pickle
+import textwrap
+
+from exam_gen.build.data import BuildInfo, BuildSpec
+
+def test_build_spec_pickles_without_classroom():
+    spec = BuildSpec("some_exam", "SomeExam", "/nowhere/exam.py",
+                     class_name = "class-a",
+                     student_id = "s1",
+                     exam_format = "exam",
+                     build_info = BuildInfo(root_dir = "/nowhere"))
+
+    copy = pickle.loads(pickle.dumps(spec))
+
+    assert copy == spec
+    assert copy.build_info.classroom == None
+
+def test_exam_class_imports_exam_file(tmp_path):
+    exam_file = tmp_path / "spec_test_exam.py"
+    exam_file.write_text(textwrap.dedent(
+        """
+        class SpecTestExam():
+            marker = 42
+        """))
+
+    spec = BuildSpec("spec_test_exam_not_loaded", "SpecTestExam",
+                     str(exam_file),
+                     class_name = "class-a",
+                     student_id = "s1",
+                     exam_format = "exam")
+
+    exam_cls = pickle.loads(pickle.dumps(spec)).exam_class()
+
+    assert exam_cls.marker == 42
+    assert spec.exam_class() is exam_cls
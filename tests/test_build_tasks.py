@@ -0,0 +1,64 @@
+from pathlib import *
+
+from exam_gen.build.data import BuildInfo
+from exam_gen.build.loader.build_tasks import (build_dir_listing,
+                                               copy_exam_assets)
+
+def format_info(tmp_path, exam_format):
+    return BuildInfo(root_dir = tmp_path,
+                     exam_format = exam_format,
+                     data_path = tmp_path / "data" / exam_format,
+                     build_path = tmp_path / "build" / exam_format)
+
+def test_copy_exam_assets_copies_setup_outputs(tmp_path):
+    exam_info = format_info(tmp_path, "exam")
+    solution_info = format_info(tmp_path, "solution")
+
+    # a declared asset and a file some user_setup generated
+    exam_build = Path(exam_info.build_path)
+    (exam_build / "assets").mkdir(parents = True)
+    (exam_build / "assets" / "figure.png").write_bytes(b"png")
+    (exam_build / "graph.tex").write_text("generated")
+
+    copy_log = copy_exam_assets(exam_info, solution_info,
+                                ["assets/figure.png", "graph.tex"])
+
+    solution_build = Path(solution_info.build_path)
+    assert (solution_build / "assets" / "figure.png").read_bytes() == b"png"
+    assert (solution_build / "graph.tex").read_text() == "generated"
+
+    assert len(copy_log['files_copied']) == 2
+    assert copy_log['copy_seconds'] >= 0
+    assert Path(solution_info.data_path,
+                solution_info.setup_prefix + solution_info.log_file).exists()
+
+def test_copy_exam_assets_leaves_other_build_outputs(tmp_path):
+    exam_info = format_info(tmp_path, "exam")
+    solution_info = format_info(tmp_path, "solution")
+
+    exam_build = Path(exam_info.build_path)
+    solution_build = Path(solution_info.build_path)
+    exam_build.mkdir(parents = True)
+    solution_build.mkdir(parents = True)
+
+    # outputs of the last compile of each format
+    for build_dir in [exam_build, solution_build]:
+        for ext in [".aux", ".pdf", ".build-record.yaml"]:
+            (build_dir / ("exam" + ext)).write_text(build_dir.name + ext)
+
+    before_setup = build_dir_listing(exam_build)
+    (exam_build / "graph.tex").write_text("generated")
+    after_setup = build_dir_listing(exam_build)
+
+    setup_files = [name for (name, stat) in after_setup.items()
+                   if before_setup.get(name, None) != stat]
+
+    assert setup_files == ["graph.tex"]
+
+    copy_exam_assets(exam_info, solution_info, setup_files)
+
+    assert (solution_build / "graph.tex").read_text() == "generated"
+
+    for ext in [".aux", ".pdf", ".build-record.yaml"]:
+        assert ((solution_build / ("exam" + ext)).read_text()
+                == "solution" + ext)
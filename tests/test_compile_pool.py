@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from exam_gen.build.loader.compile_pool import *
+
+def test_parse_latex_jobs():
+    assert parse_latex_jobs(0) == 0
+    assert parse_latex_jobs(4) == 4
+
+    with pytest.raises(RuntimeError):
+        parse_latex_jobs(-1)
+
+def test_parse_latex_jobs_compiles_inline_in_worker_processes():
+    assert parse_latex_jobs(4, num_process = 4) == 0
+    assert parse_latex_jobs(4, num_process = 1) == 4
+    assert parse_latex_jobs(4, num_process = 4, par_type = 'thread') == 4
+
+def test_pool_defaults_to_cores():
+    pool = CompilePool()
+
+    assert pool.workers >= 1
+    assert pool.max_pending == 2 * pool.workers
+
+def test_pool_limits_concurrent_jobs():
+    pool = CompilePool(2)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    for i in range(6):
+        pool.submit("a", str(i), job)
+
+    pool.drain("a")
+
+    assert peak[0] == 2
+
+def test_submit_blocks_when_queue_is_full():
+    pool = CompilePool(1, max_pending = 2)
+    release = threading.Event()
+    submitted = list()
+
+    def producer():
+        for i in range(3):
+            pool.submit("a", str(i), release.wait)
+            submitted.append(i)
+
+    thread = threading.Thread(target = producer)
+    thread.start()
+    time.sleep(0.1)
+
+    assert submitted == [0, 1]
+
+    release.set()
+    thread.join()
+    pool.drain()
+
+    assert submitted == [0, 1, 2]
+
+def test_drain_raises_failures_of_its_group():
+    pool = CompilePool(2)
+
+    def job(student_id):
+        if student_id == "ysmith":
+            raise RuntimeError("LaTeX failed")
+
+    for student_id in ["acalderon", "ysmith"]:
+        pool.submit("class-a", student_id, job, student_id)
+    pool.submit("class-b", "ysmith", lambda: None)
+
+    pool.drain("class-b")
+
+    with pytest.raises(RuntimeError, match = "1 exam\\(s\\): ysmith"):
+        pool.drain("class-a")
+
+    # failures are only reported once
+    pool.drain()
+
+def test_get_compile_pool_is_shared():
+    assert get_compile_pool(1) is get_compile_pool(3)
+
+def test_class_drains_after_its_students():
+    from exam_gen.build.loader.task_generators import build_all_class_tasks
+
+    drained = list()
+
+    tasks = build_all_class_tasks(
+        task_prefix = "build-exam",
+        exam_data = {'a': {'s1': None, 's2': None}},
+        run_task = lambda class_name, student_id, spec: None,
+        class_finish_actions = [drained.append])
+    tasks = {task.name: task for task in tasks}
+
+    finish_task = tasks["build-exam:a:finish"]
+
+    assert finish_task.task_dep == ["build-exam:a:s1", "build-exam:a:s2"]
+    assert "build-exam:a:finish" in tasks["build-exam:a"].task_dep
+
+    (action,) = finish_task.actions
+    action.py_callable(*action.args, **action.kwargs)
+
+    assert drained == ['a']
@@ -0,0 +1,53 @@
+import os
+import threading
+
+from pathlib import *
+
+import pytest
+
+from exam_gen.util.file_ops import dump_str, working_dir
+
+def test_working_dir_restores_cwd(tmp_path):
+    start = os.getcwd()
+
+    with working_dir(tmp_path) as path:
+        assert Path.cwd() == tmp_path.resolve()
+        assert path == tmp_path
+
+    assert os.getcwd() == start
+
+def test_working_dir_restores_cwd_on_error(tmp_path):
+    start = os.getcwd()
+
+    with pytest.raises(ValueError):
+        with working_dir(tmp_path):
+            raise ValueError("user setup failed")
+
+    assert os.getcwd() == start
+
+def test_working_dir_serializes_threads(tmp_path):
+    dirs = [tmp_path / "a", tmp_path / "b"]
+    seen = dict()
+
+    for d in dirs:
+        d.mkdir()
+
+    def run(d):
+        with working_dir(d):
+            # no other thread can chdir while we hold the directory
+            for _ in range(1000):
+                assert Path.cwd() == d.resolve()
+            seen[d.name] = True
+
+    threads = [threading.Thread(target = run, args = (d,)) for d in dirs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert seen == {'a': True, 'b': True}
+
+def test_dump_str_takes_explicit_paths(tmp_path):
+    dump_str("text", path = (tmp_path, "nested", "out.txt"))
+
+    assert (tmp_path / "nested" / "out.txt").read_text() == "text"
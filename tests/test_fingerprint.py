@@ -0,0 +1,77 @@
+import sys
+import hashlib
+import importlib.util
+import textwrap
+
+from pathlib import *
+
+from exam_gen.build.loader.fingerprint import (exam_file_deps,
+                                               templates_unchanged)
+from exam_gen.build.loader.journal import (BuildJournal,
+                                           journal_templates_unchanged)
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def file_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+def test_exam_file_deps_skips_templates_and_build_dirs(tmp_path):
+    (tmp_path / "figure.png").write_bytes(b"png")
+    (tmp_path / "body.jn2.tex").write_text("{{ x }}")
+    (tmp_path / "~build").mkdir()
+    (tmp_path / "~build" / "stale.jn2.tex").write_text("{{ y }}")
+
+    exam_file = tmp_path / "fingerprint_exam.py"
+    exam_file.write_text(textwrap.dedent(
+        """
+        from exam_gen import *
+
+        class FingerprintQuestion(LatexDoc, Question):
+            settings.assets = ['*.png']
+        """))
+
+    module = load_module(exam_file, "fingerprint_exam")
+
+    deps = exam_file_deps(module.FingerprintQuestion)
+
+    assert deps == sorted([str(exam_file.resolve()),
+                           str((tmp_path / "figure.png").resolve())])
+
+def test_templates_unchanged(tmp_path):
+    template = tmp_path / "body.jn2.tex"
+    template.write_text("{{ x }}")
+
+    templates = {str(template): file_hash(template)}
+
+    assert templates_unchanged(templates)
+    assert not templates_unchanged(None)
+
+    template.write_text("{{ y }}")
+    assert not templates_unchanged(templates)
+
+    template.unlink()
+    assert not templates_unchanged(templates)
+
+def test_journal_records_templates(tmp_path):
+    template = tmp_path / "body.jn2.tex"
+    template.write_text("{{ x }}")
+
+    journal_file = tmp_path / "journal.yaml"
+    journal = BuildJournal(journal_file)
+    journal.start("abc")
+
+    assert not journal_templates_unchanged([str(journal_file)])
+
+    journal.phase_done('template',
+                       templates = {str(template): file_hash(template)})
+
+    assert journal_templates_unchanged([str(journal_file)])
+
+    template.write_text("{{ y }}")
+
+    assert not journal_templates_unchanged([str(journal_file)])
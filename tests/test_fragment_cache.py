@@ -0,0 +1,92 @@
+import pytest
+
+from jinja2 import Environment
+
+from exam_gen.util.fragment_cache import *
+from exam_gen.util.fragment_cache import _stable_key, _UnstableKey
+
+class Opaque():
+    pass
+
+class Named():
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Named({!r})".format(self.name)
+
+def make_env(cache):
+    env = Environment(extensions = [FragmentCacheExtension])
+    env.fragment_cache = cache
+    return env
+
+def counting_render(env, source, **context):
+    calls = list()
+
+    def count():
+        calls.append(True)
+        return len(calls)
+
+    template = env.from_string(source)
+    results = [template.render(count = count, **context) for _ in range(3)]
+    return (results, len(calls))
+
+def test_blocks_render_once_per_key():
+    env = make_env(FragmentCache())
+    source = "{% cache k %}{{ k }}:{{ count() }}{% endcache %}"
+
+    (results, calls) = counting_render(env, source, k = "a")
+
+    assert results == ["a:1"] * 3
+    assert calls == 1
+
+    (results, calls) = counting_render(env, source, k = "b")
+
+    assert results == ["b:1"] * 3
+    assert env.fragment_cache.stats()['hits'] == 4
+
+def test_editing_a_block_invalidates_it():
+    env = make_env(FragmentCache())
+
+    first = env.from_string("{% cache 1 %}old{% endcache %}").render()
+    second = env.from_string("{% cache 1 %}new{% endcache %}").render()
+
+    assert (first, second) == ("old", "new")
+
+def test_persisted_blocks_are_reused(tmp_path):
+    source = "{% cache k %}{{ count() }}{% endcache %}"
+
+    first = FragmentCache()
+    first.use_dir(tmp_path)
+    counting_render(make_env(first), source, k = {'b': 1, 'a': [1, 2]})
+
+    second = FragmentCache()
+    second.use_dir(tmp_path)
+    (results, calls) = counting_render(make_env(second), source,
+                                       k = {'a': [1, 2], 'b': 1})
+
+    assert calls == 0
+    assert results == ["1"] * 3
+    assert not any(p.name.startswith(".tmp-") for p in tmp_path.iterdir())
+
+def test_unstable_keys_are_not_cached():
+    env = make_env(FragmentCache())
+    source = "{% cache k %}{{ count() }}{% endcache %}"
+
+    (results, calls) = counting_render(env, source, k = Opaque())
+
+    assert results == ["1", "2", "3"]
+    assert env.fragment_cache.stats() == {'hits': 0, 'misses': 0,
+                                          'hit_rate': None}
+
+def test_stable_key():
+    assert _stable_key({'b': 1, 'a': 2}) == _stable_key({'a': 2, 'b': 1})
+    assert _stable_key([1, 2]) != _stable_key((1, 2))
+    assert _stable_key({1, 2, 3}) == _stable_key({3, 2, 1})
+    assert _stable_key(Named("x")) == _stable_key(Named("x"))
+
+    with pytest.raises(_UnstableKey):
+        _stable_key([Opaque()])
+
+    with pytest.raises(_UnstableKey):
+        _stable_key({'f': lambda: 1})
@@ -0,0 +1,102 @@
+import hashlib
+
+import pytest
+
+from exam_gen.build.loader.journal import *
+
+def finished_journal(path, fingerprint, template):
+    journal = BuildJournal(path)
+    journal.start(fingerprint)
+    for phase in __build_phases__:
+        templates = None
+        if phase == 'template':
+            templates = {str(template): hashlib.sha256(
+                template.read_bytes()).hexdigest()}
+        journal.phase_done(phase, templates = templates)
+    journal.finish()
+    return journal
+
+def test_journal_round_trip(tmp_path):
+    path = tmp_path / "student" / "journal.yaml"
+
+    journal = BuildJournal(path)
+    journal.start("abc")
+    journal.phase_done('init')
+
+    loaded = BuildJournal.load(path)
+
+    assert loaded.fingerprint == "abc"
+    assert loaded.status == 'running'
+    assert list(loaded.phases) == ['init']
+    assert not path.with_name(path.name + ".tmp").exists()
+
+def test_journal_records_failures(tmp_path):
+    path = tmp_path / "journal.yaml"
+
+    journal = BuildJournal(path)
+    journal.start("abc")
+    journal.fail(RuntimeError("LaTeX failed"))
+
+    loaded = BuildJournal.load(path)
+
+    assert loaded.status == 'failed'
+    assert loaded.error == "RuntimeError: LaTeX failed"
+    assert not loaded.is_complete("abc")
+
+def test_missing_or_corrupt_journal_is_empty(tmp_path):
+    path = tmp_path / "journal.yaml"
+
+    assert BuildJournal.load(path).status == None
+
+    path.write_text("{ not: [valid yaml")
+
+    assert BuildJournal.load(path).status == None
+
+def test_start_forgets_previous_run(tmp_path):
+    template = tmp_path / "exam.jn2.tex"
+    template.write_text("{{ x }}")
+
+    journal = finished_journal(tmp_path / "journal.yaml", "abc", template)
+    journal.start("def")
+
+    assert journal.phases == dict()
+    assert journal.templates == None
+    assert not journal.is_complete("def")
+
+def test_journal_complete(tmp_path):
+    template = tmp_path / "exam.jn2.tex"
+    template.write_text("{{ x }}")
+
+    paths = [tmp_path / "exam.yaml", tmp_path / "solution.yaml"]
+    files = list(map(str, paths))
+
+    finished_journal(paths[0], "abc", template)
+
+    assert journal_complete(files[:1], "abc")
+    assert not journal_complete(files[:1], "changed")
+    assert not journal_complete(files, "abc")
+
+    finished_journal(paths[1], "abc", template)
+
+    assert journal_complete(files, "abc")
+
+    template.write_text("{{ y }}")
+
+    assert not journal_complete(files, "abc")
+
+def test_invalid_phase(tmp_path):
+    journal = BuildJournal(tmp_path / "journal.yaml")
+
+    with pytest.raises(AssertionError):
+        journal.phase_done('compile')
+
+def test_resume_task_fields(tmp_path):
+    fields = resume_task_fields([tmp_path / "journal.yaml"], "abc",
+                                targets = [tmp_path / "s1.pdf"])
+
+    ((check, args, kwargs),) = fields['uptodate']
+
+    assert check is journal_complete
+    assert args == ([str(tmp_path / "journal.yaml")], "abc")
+    assert fields['targets'] == [str(tmp_path / "s1.pdf")]
+    assert 'file_dep' not in fields
@@ -0,0 +1,68 @@
+from exam_gen.property.format.latex_build import *
+
+def test_file_line_errors():
+    log_text = "\n".join([
+        "(./exam.tex",
+        "./questions/q1.tex:12: Undefined control sequence.",
+        "l.12 \\badmacro"])
+
+    result = parse_latex_log(log_text)
+
+    assert result['errors'] == [{'file': "./questions/q1.tex",
+                                 'line': 12,
+                                 'message': "Undefined control sequence."}]
+    assert result['warnings'] == list()
+
+def test_bang_errors_use_open_file_and_line():
+    log_text = "\n".join([
+        "(./exam.tex (/usr/share/texmf/tex/latex/base/article.cls)",
+        "! Missing $ inserted.",
+        "<inserted text>",
+        "                $",
+        "l.42 x^",
+        "       2"])
+
+    result = parse_latex_log(log_text)
+
+    assert result['errors'] == [{'file': "./exam.tex",
+                                 'line': 42,
+                                 'message': "Missing $ inserted."}]
+
+def test_warnings_with_input_line():
+    log_text = "\n".join([
+        "(./exam.tex",
+        "LaTeX Warning: Reference `q:2' on page 1 undefined on input line 7.",
+        "",
+        ")"])
+
+    (warning,) = parse_latex_log(log_text)['warnings']
+
+    assert warning == {
+        'file': "./exam.tex",
+        'line': 7,
+        'message': "Reference `q:2' on page 1 undefined on input line 7."}
+
+def test_package_warning_continuation_lines():
+    log_text = "\n".join([
+        "(./exam.tex",
+        "Package hyperref Warning: Token not allowed in a PDF string "
+        "(Unicode):",
+        "(hyperref)                removing `math shift' on input line 20.",
+        "",
+        "Overfull \\hbox (2.0pt too wide) in paragraph at lines 3--4"])
+
+    (warning,) = parse_latex_log(log_text)['warnings']
+
+    assert warning['line'] == 20
+    assert warning['message'] == (
+        "Token not allowed in a PDF string (Unicode): "
+        "removing `math shift' on input line 20.")
+
+def test_clean_log():
+    log_text = "\n".join([
+        "This is pdfTeX, Version 3.14159265",
+        "(./exam.tex (./exam.aux))",
+        "Output written on exam.pdf (2 pages, 1234 bytes)."])
+
+    assert parse_latex_log(log_text) == {'errors': list(),
+                                         'warnings': list()}
@@ -0,0 +1,89 @@
+import sys
+
+from pathlib import *
+
+from exam_gen.property.format.latex_build import *
+
+fake_engine = """#!{python}
+import sys
+from pathlib import Path
+
+count = Path("passes.txt")
+passes = int(count.read_text()) + 1 if count.exists() else 1
+count.write_text(str(passes))
+
+# References settle after `settle` passes
+Path("exam.aux").write_text("pass {{}}".format(min(passes, {settle})))
+Path("exam.log").write_text({log!r})
+print("pass", passes)
+sys.exit({code})
+"""
+
+def make_engine(tmp_path, settle=1, log="", code=0):
+    engine = tmp_path / "pdflatex"
+    engine.write_text(fake_engine.format(python = sys.executable,
+                                         settle = settle, log = log,
+                                         code = code))
+    engine.chmod(0o755)
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    return ([str(engine), "exam.tex"], build_dir)
+
+def test_single_pass_when_nothing_changes(tmp_path):
+    (build_args, build_dir) = make_engine(tmp_path, settle = 1)
+    (build_dir / "exam.aux").write_text("pass 1")
+
+    (process, passes) = run_latex(build_args, build_dir, "exam")
+
+    assert process.returncode == 0
+    assert passes == 1
+
+def test_reruns_until_aux_settles(tmp_path):
+    (build_args, build_dir) = make_engine(tmp_path, settle = 3)
+
+    (process, passes) = run_latex(build_args, build_dir, "exam")
+
+    # passes 1 to 3 each change the .aux, pass 4 confirms it's stable
+    assert passes == 4
+    assert (build_dir / "exam.aux").read_text() == "pass 3"
+
+def test_rerun_requested_by_log(tmp_path):
+    (build_args, build_dir) = make_engine(
+        tmp_path, settle = 1,
+        log = "LaTeX Warning: Label(s) may have changed. Rerun to get "
+              "cross-references right.\n")
+    (build_dir / "exam.aux").write_text("pass 1")
+
+    (process, passes) = run_latex(build_args, build_dir, "exam",
+                                  max_passes = 3)
+
+    assert passes == 3
+
+def test_stops_at_max_passes(tmp_path):
+    (build_args, build_dir) = make_engine(tmp_path, settle = 10)
+
+    (process, passes) = run_latex(build_args, build_dir, "exam",
+                                  max_passes = 2)
+
+    assert process.returncode == 0
+    assert passes == 2
+
+def test_stops_at_failed_pass(tmp_path):
+    (build_args, build_dir) = make_engine(tmp_path, settle = 3, code = 1)
+
+    (process, passes) = run_latex(build_args, build_dir, "exam")
+
+    assert process.returncode == 1
+    assert passes == 1
+
+def test_output_file_collects_every_pass(tmp_path):
+    (build_args, build_dir) = make_engine(tmp_path, settle = 2)
+    output_file = tmp_path / "latex.out"
+
+    (process, passes) = run_latex(build_args, build_dir, "exam",
+                                  output_file = output_file)
+
+    output = output_file.read_text()
+    assert passes == 3
+    assert output.count("$ " + " ".join(build_args)) == 3
+    assert "pass 3" in output
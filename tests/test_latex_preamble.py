@@ -0,0 +1,112 @@
+import sys
+
+from pathlib import *
+
+import pytest
+
+from exam_gen.property.format.latex_build import *
+
+fake_engine = """#!{python}
+import sys
+from pathlib import Path
+
+calls = Path(__file__).with_name("calls.txt")
+with open(calls, 'a') as stream:
+    stream.write(" ".join(sys.argv[1:]) + "\\n")
+
+if {fail}:
+    sys.exit(1)
+
+job = next(arg[len('-jobname='):] for arg in sys.argv
+           if arg.startswith('-jobname='))
+Path(job + ".fmt").write_text("format")
+"""
+
+def make_engine(tmp_path, fail=False):
+    engine = tmp_path / "bin" / "pdflatex"
+    engine.parent.mkdir()
+    engine.write_text(fake_engine.format(python = sys.executable,
+                                         fail = fail))
+    engine.chmod(0o755)
+    return engine
+
+def engine_calls(engine):
+    calls = engine.with_name("calls.txt")
+    if not calls.exists():
+        return list()
+    return calls.read_text().splitlines()
+
+def write_doc(path, preamble, body="Hello\n"):
+    path.parent.mkdir(parents = True, exist_ok = True)
+    path.write_text(preamble + "\\begin{document}\n" + body
+                    + "\\end{document}\n")
+    return path
+
+def test_split_preamble():
+    source = "\\documentclass{article}\n  \\begin{document}\nHi\n"
+
+    assert split_preamble(source) == ("\\documentclass{article}\n",
+                                      "  \\begin{document}\nHi\n")
+
+def test_split_preamble_needs_begin_document_on_its_own_line():
+    assert split_preamble("\\documentclass{article}\nHi\n") == None
+    assert split_preamble("% \\begin{document}\nHi\n") == None
+
+def test_precompile_preamble_writes_body(tmp_path):
+    engine = make_engine(tmp_path)
+    tex_file = write_doc(tmp_path / "s1" / "exam.tex",
+                         "\\documentclass{article}\n")
+
+    (fmt_name, body_file) = precompile_preamble(str(engine), tex_file,
+                                                tmp_path / "formats")
+
+    assert fmt_name.startswith("pdflatex-")
+    assert (tmp_path / "formats" / (fmt_name + ".fmt")).exists()
+    assert body_file == tmp_path / "s1" / "exam-body.tex"
+    assert body_file.read_text().startswith("\\begin{document}")
+
+    (call,) = engine_calls(engine)
+    assert "-ini" in call.split()
+    assert "&pdflatex" in call.split()
+
+def test_precompile_preamble_reuses_format(tmp_path):
+    engine = make_engine(tmp_path)
+    formats = tmp_path / "formats"
+    preamble = "\\documentclass{article}\n"
+
+    first = precompile_preamble(
+        str(engine), write_doc(tmp_path / "s1" / "exam.tex", preamble),
+        formats)
+    second = precompile_preamble(
+        str(engine), write_doc(tmp_path / "s2" / "exam.tex", preamble,
+                               body = "Other student\n"),
+        formats)
+
+    assert first[0] == second[0]
+    assert len(engine_calls(engine)) == 1
+
+    changed = precompile_preamble(
+        str(engine), write_doc(tmp_path / "s3" / "exam.tex",
+                               preamble + "\\usepackage{amsmath}\n"),
+        formats)
+
+    assert changed[0] != first[0]
+    assert len(engine_calls(engine)) == 2
+
+def test_precompile_preamble_without_preamble(tmp_path):
+    engine = make_engine(tmp_path)
+    tex_file = tmp_path / "exam.tex"
+    tex_file.write_text("Just text\n")
+
+    assert precompile_preamble(str(engine), tex_file,
+                               tmp_path / "formats") == None
+    assert engine_calls(engine) == list()
+
+def test_precompile_preamble_failure(tmp_path):
+    engine = make_engine(tmp_path, fail = True)
+    tex_file = write_doc(tmp_path / "exam.tex", "\\documentclass{article}\n")
+
+    with pytest.raises(RuntimeError, match = "format"):
+        precompile_preamble(str(engine), tex_file, tmp_path / "formats")
+
+    assert list((tmp_path / "formats").glob("*.fmt")) == list()
@@ -0,0 +1,50 @@
+import pytest
+
+from exam_gen.util.layered_context import LayeredContext
+
+def test_layers_share_and_shadow():
+    base = LayeredContext({'a': 1, 'b': 2})
+    child = base.layer({'b': 3})
+
+    assert child['a'] == 1
+    assert child['b'] == 3
+    assert base['b'] == 2
+
+def test_writes_go_to_the_top_layer():
+    base = LayeredContext({'a': 1})
+    child = base.layer()
+
+    child['a'] = 5
+    child['c'] = 6
+
+    assert base.flatten() == {'a': 1}
+    assert child.flatten() == {'a': 5, 'c': 6}
+
+def test_lower_layers_are_read_only():
+    base = LayeredContext({'a': 1})
+    child = base.layer()
+
+    with pytest.raises(TypeError):
+        child.maps[1]['a'] = 2
+
+def test_layer_copies_its_values():
+    values = {'a': 1}
+    child = LayeredContext().layer(values)
+
+    child['a'] = 2
+
+    assert values == {'a': 1}
+
+def test_changes():
+    base = LayeredContext({'a': 1, 'b': 2})
+    child = base.layer({'a': 1, 'b': 3}).layer({'c': 4})
+
+    assert child.changes(base) == {'b': 3, 'c': 4}
+    assert base.layer().changes(base) == dict()
+
+def test_new_child_is_layer():
+    base = LayeredContext({'a': 1})
+    child = base.new_child({'b': 2})
+
+    assert isinstance(child, LayeredContext)
+    assert child.flatten() == {'a': 1, 'b': 2}
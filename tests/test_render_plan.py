@@ -0,0 +1,154 @@
+import threading
+
+from pathlib import *
+
+import pytest
+
+from exam_gen.property.templated import (RenderPlan, TemplateSpec, Templated,
+                                         template_dependencies)
+from exam_gen.util.template_manager import TemplateManager
+
+def file_spec(search_path, jinja_opts=None):
+    spec = TemplateSpec(Path("body"), path = list(search_path),
+                        format_ext = "tex")
+    spec.jinja_opts = dict(jinja_opts or dict())
+    return spec
+
+def make_dirs(tmp_path):
+    for (name, text) in [("a", "from a {{ x }}"), ("b", "from b {{ x }}")]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "body.tex").write_text(text)
+    return (tmp_path / "a", tmp_path / "b")
+
+def test_resolve_reuses_nodes(tmp_path):
+    (dir_a, _) = make_dirs(tmp_path)
+    plan = RenderPlan(manager = TemplateManager())
+
+    first = plan.resolve("body", file_spec([dir_a]))
+
+    assert plan.resolve("body", file_spec([dir_a])) is first
+    assert first.template.render(x = 1) == "from a 1"
+
+def test_resolve_keys_on_search_path(tmp_path):
+    (dir_a, dir_b) = make_dirs(tmp_path)
+    plan = RenderPlan(manager = TemplateManager())
+
+    node_a = plan.resolve("body", file_spec([dir_a]))
+    node_b = plan.resolve("body", file_spec([dir_b]))
+
+    assert node_a.template.render(x = 1) == "from a 1"
+    assert node_b.template.render(x = 1) == "from b 1"
+
+def test_resolve_keys_on_jinja_opts(tmp_path):
+    (dir_a, _) = make_dirs(tmp_path)
+    (dir_a / "body.tex").write_text("<<x>>{{ x }}")
+    plan = RenderPlan(manager = TemplateManager())
+
+    plain = plan.resolve("body", file_spec([dir_a]))
+    custom = plan.resolve("body", file_spec(
+        [dir_a], {'variable_start_string': '<<',
+                  'variable_end_string': '>>'}))
+
+    assert plain.template.render(x = 1) == "<<x>>1"
+    assert custom.template.render(x = 1) == "1{{ x }}"
+
+def test_template_dependencies(tmp_path):
+    (dir_a, _) = make_dirs(tmp_path)
+    (dir_a / "part.tex").write_text("part")
+    (dir_a / "body.tex").write_text('{% include "part.tex" %}')
+
+    spec = file_spec([dir_a])
+    spec.subtemplates['sub'] = TemplateSpec("{{ x }}")
+
+    deps = template_dependencies(spec, manager = TemplateManager())
+
+    assert set(deps) == {str(dir_a / "body.tex"), str(dir_a / "part.tex")}
+
+    spec.subtemplates['dynamic'] = TemplateSpec("{% include name %}")
+
+    assert template_dependencies(spec, manager = TemplateManager()) == None
+
+def string_node(plan, source, tmp_path):
+    return plan.resolve("node", TemplateSpec(source, path = [tmp_path]))
+
+def test_render_cache_reuses_results(tmp_path):
+    plan = RenderPlan(manager = TemplateManager())
+    node = string_node(plan, "{{ a }} {{ b }}", tmp_path)
+
+    assert plan.render(node, {'a': 1, 'b': [2], 'unused': 3}) == "1 [2]"
+    assert plan.render(node, {'a': 1, 'b': [2], 'unused': 4}) == "1 [2]"
+    assert plan.render(node, {'a': 2, 'b': [2]}) == "2 [2]"
+
+    stats = plan.render_stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+@pytest.mark.parametrize("value", [
+    lambda: "called",
+    {'nested': [len]},
+    threading.Lock()])
+def test_callables_and_unpicklable_values_are_rendered(tmp_path, value):
+    plan = RenderPlan(manager = TemplateManager())
+    node = string_node(plan, "{{ a }}", tmp_path)
+
+    plan.render(node, {'a': value})
+    plan.render(node, {'a': value})
+
+    assert plan.render_stats()['uncacheable'] == 2
+    assert plan.render_stats()['hits'] == 0
+
+def test_dynamic_includes_are_rendered(tmp_path):
+    (tmp_path / "one.tex").write_text("one {{ x }}")
+    (tmp_path / "two.tex").write_text("two {{ x }}")
+
+    plan = RenderPlan(manager = TemplateManager())
+    node = string_node(plan, "{% include name %}", tmp_path)
+
+    assert node.variables == None
+    assert plan.render(node, {'name': "one.tex", 'x': 1}) == "one 1"
+    assert plan.render(node, {'name': "two.tex", 'x': 1}) == "two 1"
+
+def test_missing_optional_includes_resolve(tmp_path):
+    plan = RenderPlan(manager = TemplateManager())
+    node = string_node(
+        plan, '{% include "missing.tex" ignore missing %}{{ x }}', tmp_path)
+
+    assert node.variables == ("x",)
+    assert plan.render(node, {'x': 1}) == "1"
+
+def test_cache_renders_is_on_by_default():
+    assert getattr(Templated, '__settings').template.cache_renders == True
+
+@pytest.mark.parametrize("source", [
+    "{{ choices | random }}",
+    "{{ rng.choice(choices) }}",
+    "{{ lipsum(1) }}",
+    "{% include 'side.tex' %}"])
+def test_templates_with_side_inputs_are_rendered(tmp_path, source):
+    import random
+
+    (tmp_path / "side.tex").write_text("{{ rng.random() }}")
+
+    plan = RenderPlan(manager = TemplateManager())
+    node = string_node(plan, source, tmp_path)
+    context = {'choices': ["a", "b"], 'rng': random.Random(1)}
+
+    assert node.variables == None
+
+    plan.render(node, context)
+    plan.render(node, context)
+
+    assert plan.render_stats()['uncacheable'] == 2
+
+@pytest.mark.parametrize("source", [
+    "{% macro m(a) %}[{{ a }}]{% endmacro %}{{ m(x) }}",
+    "{% for i in range(2) %}{{ loop.cycle(x, 'b') }}{% endfor %}"])
+def test_pure_calls_are_cached(tmp_path, source):
+    plan = RenderPlan(manager = TemplateManager())
+    node = string_node(plan, source, tmp_path)
+
+    assert node.variables == ("x",)
+
+    first = plan.render(node, {'x': "a"})
+
+    assert plan.render(node, {'x': "a"}) == first
+    assert plan.render_stats()['hits'] == 1
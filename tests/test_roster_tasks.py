@@ -0,0 +1,52 @@
+from exam_gen.build.data import BuildInfo
+from exam_gen.build.loader.roster_tasks import cached_roster
+from exam_gen.build.loader.task_generators import delayed_task_group
+
+class CountingClassroom():
+
+    loads = 0
+
+    def __init__(self, exam, parent_path):
+        self.answers = None
+        self.scores = None
+        self.students = dict()
+
+    def load_students(self):
+        CountingClassroom.loads += 1
+        self.students = {'s1': "student one"}
+
+class RosterExam():
+    classes = {'class-a': CountingClassroom}
+
+def test_cached_roster_parses_once(tmp_path):
+    CountingClassroom.loads = 0
+    build_info = BuildInfo(root_dir = tmp_path)
+
+    first = cached_roster(RosterExam, 'class-a', build_info)
+    second = cached_roster(RosterExam, 'class-a', build_info)
+    with_answers = cached_roster(RosterExam, 'class-a', build_info,
+                                 load_answers = True)
+
+    assert first is second
+    assert with_answers is not first
+    assert with_answers.students == first.students
+    assert CountingClassroom.loads == 1
+
+def test_delayed_task_group_is_lazy():
+    calls = list()
+
+    def create_tasks():
+        calls.append(True)
+        return [{'basename': 'build-lazy', 'name': 's1', 'actions': None}]
+
+    (task,) = delayed_task_group("build-lazy", create_tasks,
+                                 task_doc = "Build lazily.")
+
+    assert task.name == "build-lazy"
+    assert task.doc == "Build lazily."
+    assert calls == []
+
+    generated = list(task.loader.creator())
+
+    assert calls == [True]
+    assert generated[0]['name'] == 's1'
@@ -0,0 +1,59 @@
+import pytest
+
+from exam_gen.build.data import BuildInfo
+from exam_gen.build.loader.shard_tasks import find_shard_dirs, parse_shard
+
+def make_shards(class_out, count, indices=None):
+    if indices == None:
+        indices = range(1, count + 1)
+    for i in indices:
+        (class_out / "shard-{}-of-{}".format(i, count)).mkdir(parents = True)
+
+def test_parse_shard():
+    assert parse_shard("") == None
+    assert parse_shard(None) == None
+    assert parse_shard("2/4") == (2, 4)
+
+    for bad in ["2", "a/b", "0/4", "5/4"]:
+        with pytest.raises(RuntimeError):
+            parse_shard(bad)
+
+def test_shards_partition_students():
+    student_ids = ["student{}".format(i) for i in range(200)]
+    count = 4
+
+    shards = [[s for s in student_ids
+               if BuildInfo(shard = (i, count)).in_shard(s)]
+              for i in range(1, count + 1)]
+
+    assert sorted(sum(shards, [])) == sorted(student_ids)
+    assert all(len(shard) > 0 for shard in shards)
+    assert all(BuildInfo().in_shard(s) for s in student_ids)
+
+def test_find_shard_dirs(tmp_path):
+    assert find_shard_dirs(tmp_path / "missing", "shard-") == list()
+
+    make_shards(tmp_path, 3)
+    (tmp_path / "shard-notes").mkdir()
+
+    assert find_shard_dirs(tmp_path, "shard-") == [
+        tmp_path / "shard-1-of-3",
+        tmp_path / "shard-2-of-3",
+        tmp_path / "shard-3-of-3"]
+
+def test_find_shard_dirs_ignores_other_counts_when_given(tmp_path):
+    make_shards(tmp_path, 2)
+    make_shards(tmp_path, 4)
+
+    with pytest.raises(RuntimeError, match = "2 and 4"):
+        find_shard_dirs(tmp_path, "shard-")
+
+    assert find_shard_dirs(tmp_path, "shard-", count = 2) == [
+        tmp_path / "shard-1-of-2",
+        tmp_path / "shard-2-of-2"]
+
+def test_find_shard_dirs_requires_every_shard(tmp_path):
+    make_shards(tmp_path, 4, indices = [1, 2, 4])
+
+    with pytest.raises(RuntimeError, match = "shard\\(s\\) 3 of 4"):
+        find_shard_dirs(tmp_path, "shard-")
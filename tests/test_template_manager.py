@@ -0,0 +1,229 @@
+from pathlib import *
+
+import pytest
+
+from jinja2 import TemplateNotFound
+
+from exam_gen.util.template_manager import *
+
+def write(path, text):
+    path.parent.mkdir(parents = True, exist_ok = True)
+    path.write_text(text)
+    return path
+
+def test_environments_are_shared(tmp_path):
+    manager = TemplateManager()
+
+    (key_a, env_a) = manager.environment([tmp_path], "latex", dict())
+    (key_b, env_b) = manager.environment([tmp_path], "latex", dict())
+    (key_c, env_c) = manager.environment([tmp_path], "latex",
+                                         {'trim_blocks': True})
+
+    assert env_a is env_b
+    assert key_a == key_b
+    assert env_c is not env_a
+
+def test_get_template_prefers_format_ext(tmp_path):
+    write(tmp_path / "body", "plain {{ x }}")
+    write(tmp_path / "body.tex", "tex {{ x }}")
+
+    manager = TemplateManager()
+
+    (template, source, name) = manager.get_template(
+        Path("body"), [tmp_path], None, "tex", dict())
+
+    assert name == "body.tex"
+    assert source == "tex {{ x }}"
+    assert template.render(x = 1) == "tex 1"
+
+    (template, _, name) = manager.get_template(
+        Path("body"), [tmp_path], None, None, dict())
+
+    assert name == "body"
+    assert template.render(x = 1) == "plain 1"
+
+def test_get_template_is_compiled_once(tmp_path):
+    write(tmp_path / "body.tex", "{{ x }}")
+
+    manager = TemplateManager()
+
+    first = manager.get_template(Path("body"), [tmp_path], None, "tex",
+                                 dict())
+    second = manager.get_template(Path("body"), [tmp_path], None, "tex",
+                                  dict())
+
+    assert first[0] is second[0]
+    assert (manager.hits, manager.misses) == (1, 1)
+
+def test_get_template_missing(tmp_path):
+    manager = TemplateManager()
+
+    with pytest.raises(TemplateNotFound):
+        manager.get_template(Path("nope"), [tmp_path], None, "tex", dict())
+
+def test_format_dir_is_searched(tmp_path):
+    write(tmp_path / "latex" / "part.tex", "latex part")
+
+    manager = TemplateManager()
+
+    (template, _, _) = manager.get_template(
+        Path("part"), [tmp_path], "latex", "tex", dict())
+
+    assert template.render() == "latex part"
+
+def test_from_string_cache_is_bounded(tmp_path):
+    manager = TemplateManager(string_cache_size = 2)
+
+    first = manager.from_string("{{ a }}", [tmp_path], None, dict())
+
+    assert manager.from_string("{{ a }}", [tmp_path], None, dict()) is first
+
+    manager.from_string("{{ b }}", [tmp_path], None, dict())
+    manager.from_string("{{ c }}", [tmp_path], None, dict())
+
+    assert manager.from_string("{{ a }}", [tmp_path], None, dict()) \
+        is not first
+
+def test_string_templates_can_include_files(tmp_path):
+    write(tmp_path / "part.tex", "part {{ x }}")
+
+    manager = TemplateManager()
+    template = manager.from_string('{% include "part.tex" %}!', [tmp_path],
+                                   None, dict())
+
+    assert template.render(x = 2) == "part 2!"
+
+def test_clear(tmp_path):
+    manager = TemplateManager()
+    first = manager.from_string("{{ a }}", [tmp_path], None, dict())
+
+    manager.clear()
+
+    assert manager.from_string("{{ a }}", [tmp_path], None, dict()) \
+        is not first
+    assert (manager.hits, manager.misses) == (0, 1)
+
+def test_bytecode_cache_is_reused(tmp_path, monkeypatch):
+    write(tmp_path / "src" / "body.tex", "{{ x }}")
+    cache_dir = tmp_path / "cache"
+
+    manager = TemplateManager()
+    manager.use_bytecode_dir(cache_dir)
+    manager.get_template(Path("body"), [tmp_path / "src"], None, "tex",
+                         dict())
+
+    entries = list(cache_dir.iterdir())
+    assert len(entries) == 1
+    assert not entries[0].name.startswith(".tmp-")
+
+    # a new process with the same cache shouldn't need to compile anything
+    def no_compile(*vargs, **kwargs):
+        raise AssertionError("template was recompiled")
+
+    manager = TemplateManager()
+    manager.use_bytecode_dir(cache_dir)
+    (_, env) = manager.environment([tmp_path / "src"], None, dict())
+    monkeypatch.setattr(env, "compile", no_compile)
+
+    (template, _, _) = manager.get_template(
+        Path("body"), [tmp_path / "src"], None, "tex", dict())
+
+    assert template.render(x = 3) == "3"
+
+def test_bytecode_cache_notices_edits(tmp_path):
+    body = write(tmp_path / "src" / "body.tex", "{{ x }}")
+    cache_dir = tmp_path / "cache"
+
+    manager = TemplateManager()
+    manager.use_bytecode_dir(cache_dir)
+    manager.get_template(Path("body"), [tmp_path / "src"], None, "tex",
+                         dict())
+
+    body.write_text("new {{ x }}")
+
+    manager = TemplateManager()
+    manager.use_bytecode_dir(cache_dir)
+    (template, _, _) = manager.get_template(
+        Path("body"), [tmp_path / "src"], None, "tex", dict())
+
+    assert template.render(x = 3) == "new 3"
+
+def test_use_bytecode_dir_updates_environments(tmp_path):
+    manager = TemplateManager()
+    (_, env) = manager.environment([tmp_path], None, dict())
+
+    manager.use_bytecode_dir(tmp_path / "cache")
+
+    assert isinstance(env.bytecode_cache, AtomicBytecodeCache)
+    assert env.bytecode_cache.directory == str(tmp_path / "cache")
+
+def dependencies_of(tmp_path, source):
+    manager = TemplateManager()
+    template = manager.from_string(source, [tmp_path], None, dict())
+    return manager.dependencies(template, source)
+
+def test_dependencies_follow_includes(tmp_path):
+    part = write(tmp_path / "part.tex", '{% include "inner.tex" %}')
+    inner = write(tmp_path / "inner.tex", "inner")
+
+    deps = dependencies_of(tmp_path, '{% include "part.tex" %}')
+
+    assert set(deps) == {str(part), str(inner)}
+
+@pytest.mark.parametrize("source", [
+    '{% include "missing.tex" ignore missing %}',
+    '{% include ["missing.tex", "part.tex"] %}',
+    '{% if false %}{% include "missing.tex" %}{% endif %}'])
+def test_dependencies_skip_missing_templates(tmp_path, source):
+    part = write(tmp_path / "part.tex", "part")
+
+    deps = dependencies_of(tmp_path, source)
+
+    assert str(tmp_path / "missing.tex") not in deps
+    if "part.tex" in source:
+        assert str(part) in deps
+
+def test_dynamic_includes_are_untracked(tmp_path):
+    write(tmp_path / "part.tex", '{% include name %}')
+
+    assert dependencies_of(tmp_path, '{% include name %}') == None
+    assert dependencies_of(tmp_path, '{% include "part.tex" %}') == None
+
+def test_bundled_templates_are_read_once():
+    templates = bundled_templates()
+
+    assert "latex/exam_standalone.jn2.tex" in templates
+    assert not any(name.endswith(".py") for name in templates)
+    assert bundled_templates() is templates
+
+    (source, filename) = templates["latex/exam_standalone.jn2.tex"]
+    assert Path(filename).read_text(encoding = 'utf-8') == source
+
+def test_bundled_loader_prefix():
+    manager = TemplateManager()
+    (_, env) = manager.environment(list(), None, dict())
+
+    loader = BundledLoader("latex")
+    (source, filename, uptodate) = loader.get_source(
+        env, "exam_standalone.jn2.tex")
+
+    assert uptodate()
+    assert filename.endswith("exam_standalone.jn2.tex")
+    assert "exam_standalone.jn2.tex" in loader.list_templates()
+    assert "latex/exam_standalone.jn2.tex" in BundledLoader().list_templates()
+
+    with pytest.raises(TemplateNotFound):
+        loader.get_source(env, "latex/exam_standalone.jn2.tex")
+
+def test_user_templates_shadow_bundled_ones(tmp_path):
+    write(tmp_path / "exam_standalone.jn2.tex", "mine")
+
+    manager = TemplateManager()
+
+    (template, _, _) = manager.get_template(
+        Path("exam_standalone.jn2"), [tmp_path], "latex", "tex", dict())
+    assert template.render() == "mine"
+
+    (template, _, _) = manager.get_template(
+        Path("question_embed.jn2"), [tmp_path], "latex", "tex", dict())
+    assert template.filename.endswith("question_embed.jn2.tex")
@@ -0,0 +1,59 @@
+import sys
+import textwrap
+import importlib.util
+
+from pathlib import *
+
+from exam_gen.util.config.group import change_count
+
+def load_question(tmp_path):
+    question_file = tmp_path / "settings_question.py"
+    question_file.write_text(textwrap.dedent(
+        """
+        from exam_gen import *
+
+        class SettingsQuestion(LatexDoc, Question):
+            settings.template.search_path = ['tmpl']
+        """))
+
+    spec = importlib.util.spec_from_file_location("settings_question",
+                                                  question_file)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["settings_question"] = module
+    spec.loader.exec_module(module)
+
+    return module.SettingsQuestion
+
+def template_settings(doc):
+    return doc._Templated__get_template_settings()
+
+def test_template_settings_are_shared(tmp_path):
+    question = load_question(tmp_path)
+
+    first = question(None, None, parent_path = tmp_path)
+    second = question(None, None, parent_path = tmp_path)
+
+    settings = template_settings(first)
+
+    assert template_settings(second) is settings
+    assert settings.ident != None
+    assert Path(tmp_path, "tmpl") in settings.search_path
+
+def test_instance_changes_get_private_settings(tmp_path):
+    question = load_question(tmp_path)
+
+    shared = question(None, None, parent_path = tmp_path)
+    changed = question(None, None, parent_path = tmp_path)
+
+    template_settings(shared)
+    before = change_count(['settings', 'template'])
+
+    changed.settings.template.search_path = ['other']
+
+    assert change_count(['settings', 'template']) == before + 1
+
+    settings = template_settings(changed)
+
+    assert settings.ident == None
+    assert Path(tmp_path, "other") in settings.search_path
+    assert Path(tmp_path, "other") not in template_settings(shared).search_path
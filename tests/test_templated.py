@@ -0,0 +1,118 @@
+from pathlib import *
+
+import pytest
+
+from exam_gen.property.templated import *
+from exam_gen.util.template_manager import TemplateManager
+
+def exam_spec():
+    spec = TemplateSpec("{{ intro.text }}|{% for q in questions %}"
+                        "{{ q.text }};{% endfor %}",
+                        context = {'title': "Midterm"})
+    spec.subtemplates['intro'] = TemplateSpec("Welcome to {{ title }}")
+    spec.subtemplates['questions'] = [
+        TemplateSpec("Q{{ n }}", context = {'n': n}) for n in range(3)]
+    return spec
+
+def build(spec, **kwargs):
+    return build_template_spec("exam", spec,
+                               manager = TemplateManager(), **kwargs)
+
+def test_render_to_file(tmp_path):
+    out_file = tmp_path / "exam.tex"
+
+    result = build(exam_spec(), out_file = out_file)
+
+    assert result['text'] == "Welcome to Midterm|Q0;Q1;Q2;"
+    assert out_file.read_text() == result['text']
+    assert result['intro']['text'] == "Welcome to Midterm"
+
+def test_stream_to_file(tmp_path):
+    out_file = tmp_path / "nested" / "exam.tex"
+
+    result = build(exam_spec(), out_file = out_file, stream = True)
+
+    assert 'text' not in result
+    assert result['file'] == out_file
+    assert out_file.read_text() == "Welcome to Midterm|Q0;Q1;Q2;"
+
+def test_stream_needs_text_for_hooks(tmp_path):
+    out_file = tmp_path / "exam.tex"
+    seen = list()
+
+    spec = exam_spec()
+    spec.post_render_hook = lambda result: seen.append(result['text'])
+
+    result = build(spec, out_file = out_file, stream = True)
+
+    assert seen == ["Welcome to Midterm|Q0;Q1;Q2;"]
+    assert out_file.read_text() == result['text']
+
+def test_keep_text_false_drops_subtemplate_text(tmp_path):
+    result = build(exam_spec(), out_file = tmp_path / "exam.tex",
+                   keep_text = False)
+
+    assert result['text'] == "Welcome to Midterm|Q0;Q1;Q2;"
+    assert 'text' not in result['intro']
+    assert all('text' not in q for q in result['questions'])
+
+def debug_files(debug_dir):
+    return sorted(p.name for p in Path(debug_dir).iterdir()) \
+        if Path(debug_dir).exists() else list()
+
+@pytest.mark.parametrize("debug_level", ['off', 'on-error'])
+def test_quiet_debug_levels(tmp_path, debug_level):
+    build(exam_spec(), out_file = tmp_path / "exam.tex",
+          debug_dir = tmp_path / "debug", debug_level = debug_level)
+
+    assert debug_files(tmp_path / "debug") == list()
+
+def test_summary_debug_level(tmp_path):
+    build(exam_spec(), out_file = tmp_path / "exam.tex",
+          debug_dir = tmp_path / "debug", debug_level = 'summary')
+
+    assert debug_files(tmp_path / "debug") == ["result-exam.tex",
+                                               "template-exam.jn2.tex"]
+
+def test_full_debug_level(tmp_path):
+    build(exam_spec(), out_file = tmp_path / "exam.tex",
+          debug_dir = tmp_path / "debug", debug_level = 'full')
+
+    files = debug_files(tmp_path / "debug")
+
+    # the root, the intro, and three questions
+    for prefix in ["template-", "initial-context-", "final-context-",
+                   "result-"]:
+        assert len([f for f in files if f.startswith(prefix)]) == 5
+
+@pytest.mark.parametrize("debug_level", ['on-error', 'summary'])
+def test_failed_node_writes_debug_files(tmp_path, debug_level):
+    spec = exam_spec()
+    spec.subtemplates['intro'] = TemplateSpec("{{ missing.field }}")
+
+    with pytest.raises(Exception):
+        build(spec, out_file = tmp_path / "exam.tex",
+              debug_dir = tmp_path / "debug", debug_level = debug_level)
+
+    files = debug_files(tmp_path / "debug")
+
+    assert "template-exam-intro.jn2.tex" in files
+    assert "initial-context-exam-intro.yaml" in files
+    assert "final-context-exam-intro.yaml" in files
+    assert not any("questions" in f for f in files)
+
+def test_unknown_debug_level(tmp_path):
+    with pytest.raises(RuntimeError):
+        build(exam_spec(), debug_dir = tmp_path, debug_level = 'verbose')
+
+def test_children_cannot_change_parent_context(tmp_path):
+    spec = exam_spec()
+    spec.subtemplates['intro'] = TemplateSpec(
+        "{% set title = 'Changed' %}{{ title }}")
+
+    result = build(spec, ctxt = {'student': "s1"},
+                   out_file = tmp_path / "exam.tex")
+
+    assert result['intro']['text'] == "Changed"
+    assert result['title'] == "Midterm"
+    assert 'student' not in result
@@ -0,0 +1,80 @@
+import yaml
+
+from exam_gen.build.data import BuildInfo
+from exam_gen.build.loader.timing_tasks import *
+from exam_gen.build.loader.timing_tasks import _percentile
+
+def report(student, total, setup=0.0):
+    return {'class': "a",
+            'student': student,
+            'format': "exam",
+            'phases': {'template_exam': total - setup, 'setup_exam': setup},
+            'details': {'setup_assets': setup / 2},
+            'total': total}
+
+def test_phase_timer():
+    timer = PhaseTimer()
+
+    with timer.phase('init_exam'):
+        pass
+    timer.add('init_exam', 1.0)
+    timer.add_detail('setup_user', 0.5)
+
+    result = timer.report(BuildInfo(class_name = "a",
+                                    student_id = "s1",
+                                    exam_format = "exam"))
+
+    assert 1.0 <= result['phases']['init_exam'] < 2.0
+    assert result['details'] == {'setup_user': 0.5}
+    assert result['total'] == result['phases']['init_exam']
+    assert result['student'] == "s1"
+
+def test_sum_log_field():
+    setup_log = {'copy_seconds': 1.0,
+                 'children': {'q1': {'copy_seconds': 0.5,
+                                     'user_setup_seconds': 2.0},
+                              'q2': [{'copy_seconds': 0.25}]}}
+
+    assert sum_log_field(setup_log, 'copy_seconds') == 1.75
+    assert sum_log_field(setup_log, 'user_setup_seconds') == 2.0
+    assert sum_log_field(setup_log, 'missing') == 0.0
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert _percentile(values, 50) == 50
+    assert _percentile(values, 95) == 95
+    assert _percentile(values, 100) == 100
+    assert _percentile([7], 95) == 7
+
+def test_summarize_timings():
+    reports = [report("s{}".format(i), float(i), setup = 1.0)
+               for i in range(1, 21)]
+
+    summary = summarize_timings(reports, num_slowest = 3)
+
+    template = summary['phases']['template_exam']
+    assert template['count'] == 20
+    assert template['p50'] == 9.0
+    assert template['max'] == 19.0
+    assert summary['phases']['setup_assets']['total'] == 10.0
+    assert [s['student'] for s in summary['slowest']] == ["s20", "s19", "s18"]
+
+def test_report_timings(tmp_path):
+    build_info = BuildInfo(root_dir = tmp_path)
+    class_info = build_info.where(class_name = "a")
+
+    for (i, student) in enumerate(["s1", "s2"]):
+        student_info = class_info.where(student_id = student,
+                                        exam_format = "exam")
+        timing_file = student_info.exam_data_path() / build_info.timing_file
+        timing_file.parent.mkdir(parents = True)
+        timing_file.write_text(yaml.safe_dump(report(student, i + 1.0)))
+
+    report_timings(None, "a", build_info)
+
+    summary = yaml.safe_load((class_info.class_data_path()
+                              / build_info.timing_summary_file).read_text())
+
+    assert summary['phases']['template_exam']['count'] == 2
+    assert summary['slowest'][0]['student'] == "s2"